@@ -141,3 +141,30 @@ class RecordAdmin(MainAppAdmin):
 @admin.register(Media)
 class MediaAdmin(MainAppAdmin):
     list_display = ['id', 'record', 'file']
+
+
+@admin.register(Job)
+class JobAdmin(MainAppAdmin):
+    list_display = ['id', 'type', 'status', 'owner', 'created', 'finished']
+    list_filter = ['type', 'status']
+    readonly_fields = ['started', 'finished']
+
+
+@admin.register(Species)
+class SpeciesAdmin(MainAppAdmin):
+    list_display = ['species_name', 'name_id', 'genus', 'family_code', 'rank_name']
+    list_filter = ['rank_name']
+    search_fields = ['species_name', 'name_id']
+
+
+@admin.register(SpeciesSummary)
+class SpeciesSummaryAdmin(MainAppAdmin):
+    list_display = ['species_name', 'name_id', 'record_count', 'dataset_count', 'first_observed', 'last_observed']
+    search_fields = ['species_name', 'name_id']
+
+
+@admin.register(DatasetExport)
+class DatasetExportAdmin(MainAppAdmin):
+    list_display = ['id', 'dataset', 'format', 'version', 'file', 'last_modified']
+    list_filter = ['format']
+    readonly_fields = ['key', 'version', 'job']
@@ -1,12 +1,76 @@
-from django.utils import six
+import datetime
+import decimal
+import json
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+from django.utils import six, timezone
+from django.utils.text import slugify
+import zipstream
 from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.writer.write_only import WriteOnlyCell
+from rest_framework.settings import import_from_string
 
+from main.constants import MODEL_SRID
+from main.models import Dataset, DatasetMedia, Media, ProjectMedia, Site
 from main.utils_data_package import GenericSchema
+from main.utils_geopackage import GeoPackageWriter, FID_COLUMN, GEOMETRY_COLUMN
+from main.utils_zip import parallel_read_it
+
+logger = logging.getLogger(__name__)
 
 COLUMN_HEADER_FONT = Font(bold=True)
 
+# the schema field types exported in a typed column of a columnar (parquet/arrow) export, the others are text.
+COLUMNAR_FIELD_TYPES = ['integer', 'year', 'number', 'boolean', 'date', 'datetime']
+# the record columns added after the schema fields in a columnar export
+COLUMNAR_RECORD_COLUMNS = ['datetime', 'species_name', 'name_id', 'geometry']
+# the maximum number of distinct values memoised per column by column_caster
+COLUMN_CAST_MEMO_SIZE = 10000
+GEOPACKAGE_FIELD_TYPES = {
+    'integer': 'INTEGER',
+    'year': 'INTEGER',
+    'number': 'DOUBLE',
+    'boolean': 'BOOLEAN',
+    'date': 'DATE',
+    'datetime': 'DATETIME',
+}
+
+
+class Echo(object):
+    """
+    A file-like object that just returns what is written. Used to stream a csv writer output.
+    """
+
+    def write(self, value):
+        return value
+
+
+class _UnclosableFile(object):
+    """
+    A proxy of a file that ignores close(). The pyarrow writers close their sink but the caller still reads it.
+    """
+
+    def __init__(self, output):
+        self._output = output
+
+    @property
+    def closed(self):
+        return False
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._output, name)
+
 
 class DefaultExporter:
     def __init__(self, dataset, records=None):
@@ -15,30 +79,220 @@ class DefaultExporter:
         self.headers = self.schema.headers
         self.warnings = []
         self.errors = []
-        self.records = records if records else []
+        # don't test the truth value of a queryset, it would fetch all the records
+        self.records = records if records is not None else []
+
+    def data_it(self):
+        """
+        Iterate through the data of the records.
+        For a queryset only the data column is fetched, through a server-side cursor, so the records are never all
+        loaded in memory.
+        """
+        if isinstance(self.records, QuerySet):
+            for data in self.records.values_list('data', flat=True).iterator():
+                yield data
+        else:
+            for record in self.records:
+                yield record.data
 
     def row_it(self, cast=True):
-        for record in self.records:
-            row = []
-            for field in self.schema.fields:
-                value = record.data.get(field.name, '')
-                if cast:
-                    # Cast to native python type
-                    try:
-                        value = field.cast(value)
-                    except Exception:
-                        pass
-                # TODO: remove that when running in Python3
-                if isinstance(value, six.string_types) and not isinstance(value, six.text_type):
-                    value = six.u(value)
-                row.append(value)
-            yield row
+        fields = self.schema.fields
+        # one memoised caster per column, the columns often repeat a small set of values (codes, species, dates...)
+        casters = [column_caster(field, _cast_value if cast else _text_value) for field in fields]
+        for data in self.data_it():
+            yield [caster(data.get(field.name, '')) for field, caster in zip(fields, casters)]
 
     def csv_it(self):
         yield self.headers
         for row in self.row_it(cast=False):
             yield row
 
+    def geojson_it(self):
+        """
+        Generate a GeoJSON FeatureCollection by chunks of text.
+        The features are built in SQL and read through a server-side cursor so the records are never loaded in memory.
+        """
+        records = self._records_queryset()
+        table = connection.ops.quote_name(records.model._meta.db_table)
+        feature_sql = """jsonb_build_object(
+          'type', 'Feature',
+          'id', {table}.id,
+          'geometry', ST_AsGeoJSON({table}.geometry)::jsonb,
+          'properties', {table}.data
+        )::text""".format(table=table)
+        features = records.annotate(feature=RawSQL(feature_sql, ())).values_list('feature', flat=True)
+        yield '{"type": "FeatureCollection", "features": ['
+        separator = ''
+        for feature in features.iterator():
+            yield separator + feature
+            separator = ','
+        yield ']}'
+
+    def _records_queryset(self):
+        records = self.records
+        if not isinstance(records, QuerySet):
+            records = self.ds.record_queryset.filter(pk__in=[r.pk for r in records])
+        return records
+
+    def arrow_schema(self):
+        """
+        The pyarrow schema of a columnar export: a typed column per schema field (text for the non typed fields, see
+        COLUMNAR_FIELD_TYPES) followed by the record datetime, species_name, name_id and geometry (WKB).
+        """
+        # import here, pyarrow is only loaded for a columnar export
+        import pyarrow as pa
+
+        types = {
+            'integer': pa.int64(),
+            'year': pa.int64(),
+            'number': pa.float64(),
+            'boolean': pa.bool_(),
+            'date': pa.date32(),
+            'datetime': pa.timestamp('us'),
+        }
+        columns = [pa.field(six.text_type(f.name), types.get(f.type, pa.string())) for f in self.schema.fields]
+        record_types = {
+            'datetime': pa.timestamp('us', tz='UTC'),
+            'species_name': pa.string(),
+            'name_id': pa.int64(),
+            'geometry': pa.binary(),
+        }
+        for name, column_name in zip(COLUMNAR_RECORD_COLUMNS, self._record_column_names(COLUMNAR_RECORD_COLUMNS)):
+            columns.append(pa.field(six.text_type(column_name), record_types[name]))
+        return pa.schema(columns)
+
+    def _record_column_names(self, names):
+        """
+        The names of the record columns added to the schema fields in an export. A record column with the same name
+        (case insensitive) as a schema field is prefixed with 'record_'.
+        """
+        field_names = [name.lower() for name in self.schema.field_names]
+        column_names = []
+        for name in names:
+            column_name = name
+            while column_name.lower() in field_names:
+                column_name = 'record_' + column_name
+            column_names.append(column_name)
+        return column_names
+
+    def record_batch_it(self, schema=None, batch_size=None):
+        """
+        Generate pyarrow RecordBatch of batch_size records (default settings.EXPORT_ROW_GROUP_SIZE).
+        The records are read through a server-side cursor, with the geometry already encoded in WKB by PostGIS.
+        """
+        import pyarrow as pa
+
+        schema = schema or self.arrow_schema()
+        batch_size = batch_size or getattr(settings, 'EXPORT_ROW_GROUP_SIZE', 100000)
+        records = self._records_queryset()
+        table = connection.ops.quote_name(records.model._meta.db_table)
+        wkb_sql = 'ST_AsBinary({table}.geometry)'.format(table=table)
+        rows = records \
+            .annotate(wkb=RawSQL(wkb_sql, ())) \
+            .values_list('data', 'datetime', 'species_name', 'name_id', 'wkb') \
+            .iterator()
+        fields = self.schema.fields
+        casters = [column_caster(field, _columnar_value) for field in fields]
+        columns = [[] for _ in range(len(fields) + len(COLUMNAR_RECORD_COLUMNS))]
+        for data, record_datetime, species_name, name_id, wkb in rows:
+            for index, field in enumerate(fields):
+                columns[index].append(casters[index](data.get(field.name)))
+            index = len(fields)
+            columns[index].append(_naive_utc(record_datetime))
+            columns[index + 1].append(species_name)
+            columns[index + 2].append(name_id)
+            columns[index + 3].append(bytes(wkb) if wkb is not None else None)
+            if len(columns[0]) >= batch_size:
+                yield _record_batch(pa, schema, columns)
+                columns = [[] for _ in columns]
+        if columns[0]:
+            yield _record_batch(pa, schema, columns)
+
+    def to_parquet(self, output):
+        """
+        Write the records in a parquet file, one row group per record batch.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self.arrow_schema()
+        writer = pq.ParquetWriter(_UnclosableFile(output), schema)
+        try:
+            for batch in self.record_batch_it(schema=schema):
+                writer.write_table(pa.Table.from_batches([batch], schema=schema))
+        finally:
+            writer.close()
+
+    def to_arrow(self, output):
+        """
+        Write the records in an Arrow IPC stream.
+        """
+        import pyarrow as pa
+
+        schema = self.arrow_schema()
+        writer = pa.RecordBatchStreamWriter(_UnclosableFile(output), schema)
+        try:
+            for batch in self.record_batch_it(schema=schema):
+                writer.write_batch(batch)
+        finally:
+            writer.close()
+
+    def to_geopackage(self, file_path):
+        """
+        Write the records in a GeoPackage: one features layer with a typed column per schema field (text for the non
+        typed fields, see COLUMNAR_FIELD_TYPES), the record datetime, species_name and name_id, the record geometry and
+        its spatial index. The fid of a feature is the record id.
+        The records are read through a server-side cursor, with the geometry encoded in WKB and its envelope
+        computed by PostGIS, and inserted one transaction per settings.EXPORT_ROW_GROUP_SIZE records.
+        """
+        fields = self.schema.fields
+        # the SQLite column names are case insensitive. The fid and geometry columns of the layer take precedence,
+        # then the schema fields, then the record columns.
+        used = [FID_COLUMN, GEOMETRY_COLUMN]
+        columns = []
+        for field in fields:
+            name = _unique_name(field.name, 'field_', used)
+            columns.append((name, GEOPACKAGE_FIELD_TYPES.get(field.type, 'TEXT')))
+        for name, column_type in [('datetime', 'DATETIME'), ('species_name', 'TEXT'), ('name_id', 'INTEGER')]:
+            columns.append((_unique_name(name, 'record_', used), column_type))
+
+        records = self._records_queryset()
+        table = connection.ops.quote_name(records.model._meta.db_table)
+        geometry_functions = [
+            ('wkb', 'ST_AsBinary'),
+            ('minx', 'ST_XMin'),
+            ('maxx', 'ST_XMax'),
+            ('miny', 'ST_YMin'),
+            ('maxy', 'ST_YMax'),
+        ]
+        rows = records \
+            .annotate(**dict([
+                (name, RawSQL('{}({}.geometry)'.format(function, table), ())) for name, function in geometry_functions
+            ])) \
+            .values_list('id', 'wkb', 'minx', 'maxx', 'miny', 'maxy', 'data', 'datetime', 'species_name', 'name_id') \
+            .iterator()
+
+        casters = [column_caster(field, _geopackage_field_value) for field in fields]
+
+        def features():
+            for pk, wkb, minx, maxx, miny, maxy, data, record_datetime, species_name, name_id in rows:
+                values = [caster(data.get(field.name)) for field, caster in zip(fields, casters)]
+                values += [_geopackage_value(_naive_utc(record_datetime)), species_name, name_id]
+                yield pk, wkb, (minx, maxx, miny, maxy), values
+
+        writer = GeoPackageWriter(
+            file_path,
+            _geopackage_table_name(self.ds.name),
+            columns,
+            _spatial_ref_sys(MODEL_SRID),
+            identifier=self.ds.name,
+            description=self.ds.description or ''
+        )
+        try:
+            writer.write(features(), chunk_size=getattr(settings, 'EXPORT_ROW_GROUP_SIZE', 100000))
+        finally:
+            writer.close()
+
     def _to_worksheet(self, ws):
         ws.title = self.ds.name
         # write headers
@@ -59,32 +313,418 @@ class DefaultExporter:
         return wb
 
     def to_csv(self, output):
-        # TODO: remove when python3
-        if six.PY2:
-            import unicodecsv as csv
-        else:
-            import csv
-
         output = output or six.StringIO()
-        writer = csv.writer(output, dialect='excel')
+        writer = _csv_writer(output)
         for row in self.csv_it():
             writer.writerow(row)
 
+    def csv_stream_it(self):
+        """
+        Generate the csv file line by line. Typical use: the content of a StreamingHttpResponse.
+        """
+        writer = _csv_writer(Echo())
+        for row in self.csv_it():
+            yield writer.writerow(row)
+
+    def parent_lookup(self):
+        """
+        :return: (parent dataset, parent field, child field) of the foreign key of the dataset (see Record.parents) or
+        None if the dataset has no parent dataset.
+        """
+        parent_dataset = self.ds.get_parent_dataset if self.ds.has_foreign_keys else None
+        if parent_dataset is None:
+            return None
+        parent_field, child_field = self.ds.get_fk_lookup_fields_for_dataset(parent_dataset)
+        if not (parent_field and child_field):
+            return None
+        return parent_dataset, parent_field, child_field
+
+    def joined_csv_it(self):
+        """
+        Generate a flat csv file of the records joined to their parent record, line by line.
+        The columns are prefixed by the dataset name: '<parent dataset>.<field>' then '<dataset>.<field>'.
+        The join is done in one query on the text values of the foreign key fields (instead of a containment query per
+        record, see Record.parents) and read through a server-side cursor. A record without parent has empty parent
+        columns, a record with several parents has a row per parent.
+        """
+        lookup = self.parent_lookup()
+        if lookup is None:
+            raise ValueError('The dataset {} has no parent dataset'.format(self.ds))
+        parent_dataset, parent_field, child_field = lookup
+        parent_schema = GenericSchema(parent_dataset.schema_data)
+        parent_prefix, child_prefix = _dataset_slug(parent_dataset), _dataset_slug(self.ds)
+        if parent_prefix == child_prefix:
+            parent_prefix = 'parent-' + parent_prefix
+
+        writer = _csv_writer(Echo())
+        yield writer.writerow(
+            ['{}.{}'.format(parent_prefix, header) for header in parent_schema.headers] +
+            ['{}.{}'.format(child_prefix, header) for header in self.headers]
+        )
+        records = self._records_queryset().order_by().values('id', 'data')
+        records_sql, records_params = records.query.sql_with_params()
+        sql = """
+        SELECT parent.data, child.data
+        FROM ({records}) AS child
+        LEFT JOIN {record} AS parent
+          ON parent.dataset_id = %s AND parent.data->>%s = child.data->>%s
+        ORDER BY child.id, parent.id
+        """.format(
+            records=records_sql,
+            record=connection.ops.quote_name(records.model._meta.db_table)
+        )
+        columns = [
+            (field, column_caster(field, _text_value), index)
+            for index, schema in enumerate([parent_schema, self.schema])
+            for field in schema.fields
+        ]
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, tuple(records_params) + (parent_dataset.pk, parent_field, child_field))
+            rows = cursor.fetchmany(GET_ITERATOR_CHUNK_SIZE)
+            while rows:
+                for row in rows:
+                    # the parent data is null for a record without parent
+                    data = [row[0] or {}, row[1]]
+                    yield writer.writerow([caster(data[index].get(field.name, '')) for field, caster, index in columns])
+                rows = cursor.fetchmany(GET_ITERATOR_CHUNK_SIZE)
+
+    def to_file(self, output, output_format):
+        """
+        Write the export in the given format ('csv', 'xlsx' or 'geojson') in a binary file.
+        """
+        if output_format == 'xlsx':
+            self.to_workbook().save(output)
+        elif output_format == 'geojson':
+            for chunk in self.geojson_it():
+                output.write(_to_bytes(chunk))
+        else:
+            for line in self.csv_stream_it():
+                output.write(_to_bytes(line))
+
+    def media_files(self):
+        """
+        :return: the list of (path in the bundle, storage, file name) of the media files of the records, of the
+        dataset and of its project, in a deterministic order:
+        media/records/<record id>/<media id>_<file name>, media/dataset/<media id>_<file name> and
+        media/project/<media id>_<file name>
+        """
+        files = []
+        records = self._records_queryset().order_by().values('pk')
+        storage = Media._meta.get_field('file').storage
+        media = Media.objects.filter(record__in=records).order_by('record_id', 'id')
+        for pk, record_id, name in media.values_list('id', 'record_id', 'file').iterator():
+            files.append(('media/records/{}/{}_{}'.format(record_id, pk, os.path.basename(name)), storage, name))
+        storage = DatasetMedia._meta.get_field('file').storage
+        media = DatasetMedia.objects.filter(dataset=self.ds).order_by('id')
+        for pk, name in media.values_list('id', 'file'):
+            files.append(('media/dataset/{}_{}'.format(pk, os.path.basename(name)), storage, name))
+        storage = ProjectMedia._meta.get_field('file').storage
+        media = ProjectMedia.objects.filter(project=self.ds.project_id).order_by('id')
+        for pk, name in media.values_list('id', 'file'):
+            files.append(('media/project/{}_{}'.format(pk, os.path.basename(name)), storage, name))
+        return files
+
+    def media_bundle_entries(self, workers=None):
+        """
+        The zip entries (see main.utils_zip.zip_stream_it) of the records csv file followed by the media files (see
+        media_files).
+        The media files are read from the storage by a pool of threads, ahead of the zip stream, and stored without
+        compression (photos are already compressed). A read error is raised by the zip stream.
+        :param workers: the number of reading threads, settings.EXPORT_MEDIA_WORKERS by default
+        """
+        if workers is None:
+            workers = settings.EXPORT_MEDIA_WORKERS
+        files = self.media_files()
+        contents = parallel_read_it([(storage, name) for arcname, storage, name in files], _read_file, workers=workers)
+        entries = [(_dataset_slug(self.ds) + '.csv', self.csv_stream_it())]
+        for arcname, storage, name in files:
+            # the files are written in order, each one as soon as its content has been read
+            entries.append((arcname, _next_it(contents), zipstream.ZIP_STORED))
+        return entries
+
+
+class ProjectExporter(object):
+    """
+    Export of a whole project as a frictionless data package: a csv file per dataset, the sites csv file and the
+    datapackage.json built from the stored dataset descriptors.
+    The dataset csv files are always written by the DefaultExporter, they must match the package schemas whatever the
+    configured exporter (see get_exporter_class).
+    """
+    SITES_RESOURCE_NAME = 'sites'
+    SITE_FIELDS = [
+        {'name': 'id', 'type': 'integer'},
+        {'name': 'code', 'type': 'string'},
+        {'name': 'name', 'type': 'string'},
+        {'name': 'description', 'type': 'string'},
+        {'name': 'geometry', 'type': 'string', 'description': 'WKT (EPSG:{})'.format(MODEL_SRID)},
+        {'name': 'attributes', 'type': 'object'},
+    ]
+
+    def __init__(self, project):
+        self.project = project
+        self.datasets = list(Dataset.objects.filter(project=project).order_by('id'))
+        # a unique resource (and file) name per dataset
+        self.resource_names = {}
+        used = [self.SITES_RESOURCE_NAME]
+        for dataset in self.datasets:
+            base_name = _dataset_slug(dataset)
+            name = base_name
+            while name in used:
+                name = '{}-{}'.format(base_name, dataset.pk)
+                base_name = name
+            used.append(name)
+            self.resource_names[dataset.pk] = name
+
+    def dataset_resource(self, dataset):
+        """
+        The stored resource descriptor of the dataset, renamed and with its path in the package. The foreign keys are
+        updated with the renamed parent resources.
+        """
+        renamed = dict([(ds.resource_name, self.resource_names[ds.pk]) for ds in self.datasets])
+        resource = json.loads(json.dumps(dataset.resource))
+        name = self.resource_names[dataset.pk]
+        resource.update({
+            'name': name,
+            'title': dataset.name,
+            'path': name + '.csv',
+            'format': 'csv',
+            'mediatype': 'text/csv',
+            'encoding': 'utf-8',
+        })
+        for foreign_key in resource.get('schema', {}).get('foreignKeys', []):
+            reference = foreign_key.get('reference', {})
+            if reference.get('resource') in renamed:
+                reference['resource'] = renamed[reference['resource']]
+        return resource
+
+    def datapackage(self):
+        resources = [self.dataset_resource(dataset) for dataset in self.datasets]
+        resources.append({
+            'name': self.SITES_RESOURCE_NAME,
+            'title': 'Sites',
+            'path': self.SITES_RESOURCE_NAME + '.csv',
+            'format': 'csv',
+            'mediatype': 'text/csv',
+            'encoding': 'utf-8',
+            'schema': {
+                'fields': self.SITE_FIELDS,
+                'primaryKey': 'id'
+            }
+        })
+        return {
+            'name': slugify(self.project.name) or 'project-{}'.format(self.project.pk),
+            'title': self.project.name,
+            'description': self.project.description or '',
+            'resources': resources
+        }
+
+    def sites_csv_it(self):
+        """
+        Generate the sites csv file line by line. The sites are read through a server-side cursor.
+        """
+        writer = _csv_writer(Echo())
+        yield writer.writerow([field['name'] for field in self.SITE_FIELDS])
+        table = connection.ops.quote_name(Site._meta.db_table)
+        sites = Site.objects \
+            .filter(project=self.project) \
+            .order_by('id') \
+            .annotate(wkt=RawSQL('ST_AsText({}.geometry)'.format(table), ())) \
+            .values_list('id', 'code', 'name', 'description', 'wkt', 'attributes')
+        for pk, code, name, description, wkt, attributes in sites.iterator():
+            yield writer.writerow([
+                pk,
+                code,
+                name or '',
+                description or '',
+                wkt or '',
+                json.dumps(attributes) if attributes else ''
+            ])
+
+    def zip_entries(self):
+        """
+        :return: the list of (file name, iterable of the file content chunks) of the package files
+        """
+        entries = [('datapackage.json', [json.dumps(self.datapackage(), indent=2)])]
+        for dataset in self.datasets:
+            exporter = DefaultExporter(dataset, dataset.record_queryset.order_by('id'))
+            entries.append((self.resource_names[dataset.pk] + '.csv', exporter.csv_stream_it()))
+        entries.append((self.SITES_RESOURCE_NAME + '.csv', self.sites_csv_it()))
+        return entries
+
+
+def column_caster(field, cast, memo_size=COLUMN_CAST_MEMO_SIZE):
+    """
+    A memoised cast(field, value) for the values of a column. The memo keeps up to memo_size distinct values, the
+    other values (and the unhashable ones) are cast every time.
+    The memo key includes the value type, e.g. 1 and True are cast separately.
+    """
+    memo = {}
+
+    def caster(value):
+        try:
+            key = (type(value), value)
+            return memo[key]
+        except TypeError:
+            # list or dict
+            return cast(field, value)
+        except KeyError:
+            result = cast(field, value)
+            if len(memo) < memo_size:
+                memo[key] = result
+            return result
+
+    return caster
+
+
+def _text_value(field, value):
+    # TODO: remove that when running in Python3
+    if isinstance(value, six.string_types) and not isinstance(value, six.text_type):
+        value = six.u(value)
+    return value
+
+
+def _cast_value(field, value):
+    """
+    The value cast to the native python type of the field, unchanged if invalid.
+    """
+    try:
+        value = field.cast(value)
+    except Exception:
+        pass
+    return _text_value(field, value)
+
+
+def _naive_utc(value):
+    # pyarrow timestamps are naive, the aware datetimes are stored in UTC
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value, timezone.utc)
+    return value
+
+
+def _columnar_value(field, value):
+    """
+    The value of a schema field for its column of a columnar export. None if blank or, for a typed column, invalid.
+    """
+    if value is None or value == '':
+        return None
+    if field.type in COLUMNAR_FIELD_TYPES:
+        try:
+            value = field.cast(value)
+        except Exception:
+            return None
+        if isinstance(value, decimal.Decimal):
+            return float(value)
+        if field.type == 'date' and isinstance(value, datetime.datetime):
+            return value.date()
+        return _naive_utc(value)
+    if not isinstance(value, six.string_types):
+        return json.dumps(value)
+    return six.text_type(value)
+
+
+def _geopackage_value(value):
+    """
+    The GeoPackage encoding of a columnar value: dates and datetimes (UTC) in ISO 8601 text, booleans as integers.
+    """
+    if isinstance(value, datetime.datetime):
+        return '{}.{:03d}Z'.format(value.replace(microsecond=0).isoformat(), value.microsecond // 1000)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _geopackage_field_value(field, value):
+    return _geopackage_value(_columnar_value(field, value))
+
+
+def _geopackage_table_name(name):
+    # a plain sql identifier, it is used in the name of the spatial index table and triggers. The gpkg_, rtree_ and
+    # sqlite_ prefixes are reserved for the GeoPackage and SQLite tables.
+    table_name = re.sub(r'[^a-z0-9_]+', '_', name.lower()).strip('_')
+    if not table_name or table_name[0].isdigit() or table_name.startswith(('gpkg', 'rtree_', 'sqlite_')):
+        table_name = 'records_' + table_name
+    return table_name.strip('_')
+
+
+def _unique_name(name, prefix, used):
+    """
+    Prefix the name until it is not in the used names (case insensitive) and add it to them.
+    :param used: a list of lower case names
+    """
+    while name.lower() in used:
+        name = prefix + name
+    used.append(name.lower())
+    return name
+
+
+def _spatial_ref_sys(srid):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT auth_name, auth_srid, srtext FROM spatial_ref_sys WHERE srid = %s', [srid])
+        organization, organization_coordsys_id, definition = cursor.fetchone()
+    return {
+        'srs_id': srid,
+        'organization': organization,
+        'organization_coordsys_id': organization_coordsys_id,
+        'definition': definition
+    }
+
+
+def _dataset_slug(dataset):
+    return slugify(dataset.name) or 'dataset-{}'.format(dataset.pk)
+
+
+def _read_file(storage_file):
+    # an error aborts the zip stream, the client gets an incomplete archive rather than a corrupt file.
+    storage, name = storage_file
+    with storage.open(name, 'rb') as file_:
+        return file_.read()
+
+
+def _next_it(iterator):
+    yield next(iterator)
+
+
+def _record_batch(pa, schema, columns):
+    arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema.names)
+
+
+def _to_bytes(value):
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def _csv_writer(output):
+    # TODO: remove when python3
+    if six.PY2:
+        import unicodecsv as csv
+    else:
+        import csv
+    return csv.writer(output, dialect='excel')
+
 
 class BionetExporter(DefaultExporter):
     """
     Same as default but spit two blank lines at the top when using csv
     """
-    def to_csv(self, output):
-        # TODO: remove when python3
-        if six.PY2:
-            import unicodecsv as csv
-        else:
-            import csv
+    def csv_it(self):
+        yield ['Bionet Ignored Line']
+        yield ['Bionet Ignored Line']
+        for row in DefaultExporter.csv_it(self):
+            yield row
 
-        output = output or six.StringIO()
-        writer = csv.writer(output, dialect='excel')
-        writer.writerow(['Bionet Ignored Line'])
-        writer.writerow(['Bionet Ignored Line'])
-        for row in self.csv_it():
-            writer.writerow(row)
+
+def get_exporter_class():
+    """
+    The exporter class of settings.EXPORTER_CLASS or DefaultExporter if not set or not importable.
+    """
+    exporter_class = DefaultExporter
+    if hasattr(settings, 'EXPORTER_CLASS') and settings.EXPORTER_CLASS:
+        try:
+            exporter_class = import_from_string(settings.EXPORTER_CLASS, 'EXPORTER_CLASS')
+        except Exception:
+            logger.exception("Error while importing exporter class: {}".format(settings.EXPORTER_CLASS))
+    return exporter_class
@@ -2,11 +2,14 @@ import logging
 import json
 
 from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Polygon
 from django_filters import rest_framework as filters, constants
 from django.utils import six
 from rest_framework.exceptions import APIException
 
 from main import models
+from main.api.helpers import parse_bbox, to_bool
+from main.constants import MODEL_SRID
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +73,42 @@ class GeometryFilter(filters.CharFilter):
             raise FilterException(message)
 
 
+class BBoxFilter(filters.CharFilter):
+    """
+    Filter geometries that intersect a WGS84 bbox given as 'minx,miny,maxx,maxy'.
+    The filter compiles to a bounding box overlap (&&) that is always answered by the spatial index.
+    If the query param 'in_bbox_exact' is true the result is refined with an exact intersection test.
+    Combined with an id__gt filter and a limit it can be used for a keyset pagination (the default ordering is id):
+    ?in_bbox=115,-33,116,-31&id__gt=<last id of previous page>&limit=1000
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.exact_param = kwargs.pop('exact_param', 'in_bbox_exact')
+        super(BBoxFilter, self).__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in constants.EMPTY_VALUES:
+            return qs
+        try:
+            polygon = Polygon.from_bbox(parse_bbox(value))
+            polygon.srid = MODEL_SRID
+        except Exception as e:
+            message = "Error while filtering {field} with value: '{value}'. {e}".format(
+                field=self.field_name,
+                value=value,
+                e=e
+            )
+            raise FilterException(message)
+        qs = qs.filter(**{'{}__bboverlaps'.format(self.field_name): polygon})
+        if self.is_exact():
+            qs = qs.filter(**{'{}__intersects'.format(self.field_name): polygon})
+        return qs
+
+    def is_exact(self):
+        data = getattr(self.parent, 'data', None) or {}
+        return to_bool(data.get(self.exact_param, False))
+
+
 class UserFilterSet(filters.FilterSet):
     project__id = filters.CharFilter(name='project', method='filter_project_id_custodians')
     project__name = filters.CharFilter(name='project', method='filter_project_name_custodians')
@@ -141,20 +180,37 @@ class DatasetFilterSet(filters.FilterSet):
         }
 
 
+class SiteFilterSet(filters.FilterSet):
+    in_bbox = BBoxFilter(field_name='geometry')
+
+    class Meta:
+        model = models.Site
+        fields = {
+            'id': ['exact', 'in', 'gt', 'lt'],
+            'name': ['exact'],
+            'code': ['exact'],
+            'project__name': ['exact'],
+            'project__code': ['exact'],
+            'project__id': ['exact'],
+        }
+
+
 class RecordFilterSet(filters.FilterSet):
     # TODO: how to document these filters so that a description appears in the swagger.
     data__contains = JSONFilter(field_name='data', lookup_expr='contains', distinct=True)
     data__has_key = filters.CharFilter(field_name='data', lookup_expr='has_key', distinct=True)
     geometry__within = GeometryFilter(field_name='geometry', lookup_expr='within', distinct=True)
+    in_bbox = BBoxFilter(field_name='geometry')
 
     class Meta:
         model = models.Record
         fields = {
-            'id': ['exact', 'in'],
+            'id': ['exact', 'in', 'gt', 'lt'],
             'dataset__id': ['exact', 'in'],
             'dataset__name': ['exact'],
             'dataset__project__id': ['exact', 'in'],
             'dataset__project__name': ['exact'],
+            'dataset__project__program__id': ['exact', 'in'],
             'datetime': ['exact', 'gt', 'lt', 'gte', 'lte'],
             'species_name': ['iexact'],
             'name_id': ['exact', 'in'],
@@ -170,6 +226,26 @@ class RecordFilterSet(filters.FilterSet):
         }
 
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+class TileRecordFilterSet(filters.FilterSet):
+    """
+    The filters available for the records layer of the vector tiles.
+    project, dataset and name_id accept a comma separated list of ids.
+    """
+    project = NumberInFilter(field_name='dataset__project__id', lookup_expr='in')
+    dataset = NumberInFilter(field_name='dataset__id', lookup_expr='in')
+    name_id = NumberInFilter(field_name='name_id', lookup_expr='in')
+
+    class Meta:
+        model = models.Record
+        fields = {
+            'datetime': ['gt', 'lt', 'gte', 'lte'],
+        }
+
+
 class MediaFilterSet(filters.FilterSet):
     class Meta:
         model = models.Media
@@ -213,3 +289,13 @@ class DatasetMediaFilterSet(filters.FilterSet):
             'dataset__project__name': ['exact'],
             'dataset__project__code': ['exact'],
         }
+
+
+class JobFilterSet(filters.FilterSet):
+    class Meta:
+        model = models.Job
+        fields = {
+            'id': ['exact', 'in'],
+            'type': ['exact'],
+            'status': ['exact', 'in'],
+        }
@@ -6,3 +6,17 @@ def to_bool(s):
         return s.lower() in ('y', 'yes', 'true', 'on', '1')
     else:
         return bool(s)
+
+
+def parse_bbox(s):
+    """
+    Parse a 'minx,miny,maxx,maxy' string into a tuple of 4 floats.
+    Raise a ValueError if the string is not a valid bbox.
+    """
+    values = [float(v) for v in s.split(',')]
+    if len(values) != 4:
+        raise ValueError("A bbox must be 4 comma separated numbers: minx,miny,maxx,maxy")
+    minx, miny, maxx, maxy = values
+    if minx > maxx or miny > maxy:
+        raise ValueError("Invalid bbox: min values must be lower than max values")
+    return minx, miny, maxx, maxy
@@ -14,9 +14,9 @@ from drf_extra_fields.fields import Base64ImageField
 
 from main.api.validators import get_record_validator_for_dataset
 from main.constants import MODEL_SRID
-from main.models import Program, Project, Site, Dataset, Record, Media, DatasetMedia, ProjectMedia
+from main.models import Program, Project, Site, Dataset, Record, Media, DatasetMedia, ProjectMedia, Job, \
+    SpeciesSummary
 from main.utils_auth import is_admin
-from main.utils_species import get_key_for_value
 
 User = get_user_model()
 
@@ -116,7 +116,7 @@ class ProjectSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Project
-        fields = '__all__'
+        exclude = Project.CACHED_EXTENT_FIELDS
 
 
 class SiteSerializer(serializers.ModelSerializer):
@@ -173,7 +173,7 @@ class DatasetSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Dataset
-        fields = '__all__'
+        exclude = Dataset.CACHED_EXTENT_FIELDS
         validators = [
             serializers.UniqueTogetherValidator(
                 queryset=Dataset.objects.all(),
@@ -220,9 +220,9 @@ class RecordSerializer(serializers.ModelSerializer):
         self.strict_schema_validation = ctx.get('strict', False)
         # species naming service
         self.species_naming_facade_class = ctx.get('species_naming_facade_class')
-        # the next object will hold a cached version of the 'species_name' -> name_id obtained
+        # the next object will hold a cached SpeciesIndex ('species_name' <-> name_id) obtained
         # from the species_naming_facade above.
-        self.species_name_id_mapping_cached = None
+        self.species_index_cached = None
 
         # dynamic fields
         request = ctx.get('request')
@@ -304,15 +304,15 @@ class RecordSerializer(serializers.ModelSerializer):
         # either a species name or a nameId
         species_name = schema.cast_species_name(schema_data)
         name_id = schema.cast_species_name_id(schema_data)
-        species_mapping = self.get_species_name_id_mapping()
-        if species_mapping:
+        species_index = self.get_species_index()
+        if species_index:
             # name id takes precedence
             if name_id and name_id != -1:
-                species_name = get_key_for_value(species_mapping, int(name_id), None)
+                species_name = species_index.get_species_name(name_id)
                 if not species_name:
                     raise Exception("Cannot find a species with nameId={}".format(name_id))
             elif species_name:
-                name_id = int(species_mapping.get(species_name, -1))
+                name_id = species_index.get_name_id(species_name)
             else:
                 raise Exception('Missing Species Name or Species Name Id')
         else:
@@ -324,14 +324,14 @@ class RecordSerializer(serializers.ModelSerializer):
             instance.save()
         return instance
 
-    def get_species_name_id_mapping(self):
+    def get_species_index(self):
         if all([
-            self.species_name_id_mapping_cached is None,
+            self.species_index_cached is None,
             self.species_naming_facade_class is not None,
-            callable(getattr(self.species_naming_facade_class, 'name_id_by_species_name'))
+            callable(getattr(self.species_naming_facade_class, 'species_index', None))
         ]):
-            self.species_name_id_mapping_cached = self.species_naming_facade_class().name_id_by_species_name()
-        return self.species_name_id_mapping_cached
+            self.species_index_cached = self.species_naming_facade_class().species_index()
+        return self.species_index_cached
 
     def set_fields_from_data(self, instance, validated_data):
         try:
@@ -370,7 +370,7 @@ class RecordSerializer(serializers.ModelSerializer):
         schema_validator = SchemaValidator(strict=self.strict_schema_validation)
         schema_validator.dataset = self.dataset
         if self.dataset and self.dataset.type == Dataset.TYPE_SPECIES_OBSERVATION:
-            schema_validator.kwargs['species_name_id_mapping'] = self.get_species_name_id_mapping()
+            schema_validator.kwargs['species_index'] = self.get_species_index()
         schema_validator(data)
         return data
 
@@ -449,3 +449,15 @@ class GeometrySerializer(serializers.Serializer):
 
 class GeoConvertSerializer(GeometrySerializer):
     data = serializers.JSONField(required=False)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = '__all__'
+
+
+class SpeciesSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SpeciesSummary
+        exclude = ('id', 'stale')
@@ -14,7 +14,7 @@ from main.models import Site, Dataset
 from main.utils_data_package import GeometryParser, ObservationSchema, SpeciesObservationSchema, BiosysSchema, \
     SpeciesNameParser
 from main.utils_misc import get_value
-from main.utils_species import HerbieFacade, get_key_for_value
+from main.utils_species import HerbieFacade, SpeciesIndex
 
 # TODO: remove when python3
 if six.PY2:
@@ -236,9 +236,9 @@ class RecordCreator:
         self.record_model = dataset.record_model
         self.validator = validator if validator else get_record_validator_for_dataset(dataset)
         # if species. First load species list from herbie. Should raise an exception if problem.
-        self.species_id_by_name = {}
+        self.species_index = SpeciesIndex()
         if dataset.type == Dataset.TYPE_SPECIES_OBSERVATION:
-            self.species_id_by_name = species_facade_class().name_id_by_species_name()
+            self.species_index = species_facade_class().species_index()
         # Schema foreign key for site.
         self.site_fk = self.schema.get_fk_for_model('Site')
         self.commit = commit
@@ -294,14 +294,14 @@ class RecordCreator:
                         name_id = self.schema.cast_species_name_id(row)
                         # name id takes precedence
                         if name_id:
-                            species_name = get_key_for_value(self.species_id_by_name, int(name_id), None)
+                            species_name = self.species_index.get_species_name(name_id)
                             if not species_name:
                                 column_name = self.schema.species_name_parser.name_id_field.name
                                 message = "Cannot find a species with nameId={}".format(name_id)
                                 validator_result.add_column_error(column_name, message)
                                 return record, validator_result
                         elif species_name:
-                            name_id = int(self.species_id_by_name.get(species_name, -1))
+                            name_id = self.species_index.get_name_id(species_name)
                         record.species_name = species_name
                         record.name_id = name_id
                 if self.commit:
@@ -17,6 +17,7 @@ router.register(r'records?', api_views.RecordViewSet, 'record')
 router.register(r'media', api_views.MediaViewSet, 'media')
 router.register(r'project-media', api_views.ProjectMediaViewSet, 'project-media')
 router.register(r'dataset-media', api_views.DatasetMediaViewSet, 'dataset-media')
+router.register(r'jobs?', api_views.JobViewSet, 'job')
 
 
 url_patterns = [
@@ -24,13 +25,24 @@ url_patterns = [
     url(r'projects?/(?P<pk>\d+)/sites/?', api_views.ProjectSitesView.as_view(), name='project-sites'),  # bulk sites
     url(r'projects?/(?P<pk>\d+)/upload-sites/?', api_views.ProjectSitesUploadView.as_view(),
         name='upload-sites'),  # file upload for sites
+    url(r'projects?/(?P<pk>\d+)/assign-nearest-sites/?', api_views.ProjectAssignNearestSitesView.as_view(),
+        name='assign-nearest-sites'),
+    url(r'projects?/(?P<pk>\d+)/export/?', api_views.ProjectExportView.as_view(),
+        name='project-export'),  # streamed zip of the project data package
     url(r'datasets?/(?P<pk>\d+)/records/?', api_views.DatasetRecordsView.as_view(), name='dataset-records'),
+    url(r'datasets?/(?P<pk>\d+)/species-matching/?', api_views.DatasetSpeciesMatchingView.as_view(),
+        name='dataset-species-matching'),  # fuzzy match of the unresolved species names
+    url(r'datasets?/(?P<pk>\d+)/export/?', api_views.DatasetExportView.as_view(),
+        name='dataset-export'),  # cached export files
     # upload data files
     url(r'datasets?/(?P<pk>\d+)/upload-records/?', api_views.DatasetUploadRecordsView.as_view(),
         name='dataset-upload'),
+    url(r'records?-density/?', api_views.RecordDensityView.as_view(), name='record-density'),
+    url(r'records?-taxonomy/?', api_views.RecordTaxonomyView.as_view(), name='record-taxonomy'),
     url(r'statistics/?', api_views.StatisticsView.as_view(), name="statistics"),
     url(r'whoami/?', api_views.WhoamiView.as_view(), name="whoami"),
     url(r'species/?', api_views.SpeciesView.as_view(), name="species"),
+    url(r'tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.mvt/?$', api_views.TileView.as_view(), name="tiles"),
     url(r'logout/?', api_views.LogoutView.as_view(), name="logout"),
     # utils
     url(r'utils/geometry-to-data/dataset/(?P<pk>\d+)/?',
@@ -152,7 +152,8 @@ class SpeciesObservationValidator(ObservationValidator):
     def __init__(self, dataset, schema_error_as_warning=True, **kwargs):
         super(SpeciesObservationValidator, self).__init__(dataset, schema_error_as_warning)
         self.parser = self.schema.species_name_parser
-        self.species_name_id_mapping = kwargs.get('species_name_id_mapping')
+        # a main.utils_species.SpeciesIndex
+        self.species_index = kwargs.get('species_index')
 
     def validate(self, data, schema_error_as_warning=True):
         result = super(SpeciesObservationValidator, self).validate(data)
@@ -171,8 +172,8 @@ class SpeciesObservationValidator(ObservationValidator):
         result = RecordValidatorResult()
         if self.parser.has_name_id:
             name_id = self.parser.cast_species_name_id(data)
-            if name_id and self.species_name_id_mapping is not None:
-                if name_id not in self.species_name_id_mapping.values():
+            if name_id and self.species_index is not None:
+                if not self.species_index.has_name_id(name_id):
                     message = "Cannot find a species with nameId={}".format(name_id)
                     result.add_column_error(self.parser.name_id_field.name, message)
         return result
@@ -2,12 +2,17 @@ from __future__ import absolute_import, unicode_literals, print_function, divisi
 
 import datetime
 import logging
+import math
 from collections import OrderedDict
 from os import path
 
 from django.contrib.auth import get_user_model, logout
+from django.contrib.gis.db.models.functions import Centroid, GeoHash, SnapToGrid
+from django.contrib.gis.geos import Polygon
 from django.core.files.uploadhandler import TemporaryFileUploadHandler
-from django.db.models import Q
+from django.db import connection, transaction
+from django.db.models import Q, Count
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 from dry_rest_permissions.generics import DRYPermissions
@@ -15,20 +20,26 @@ from rest_framework import viewsets, generics, status
 from rest_framework.parsers import MultiPartParser, FormParser, FileUploadParser, JSONParser
 from rest_framework.permissions import IsAuthenticated, BasePermission, SAFE_METHODS
 from rest_framework.views import APIView, Response
-from rest_framework.settings import import_from_string
+from rest_framework.settings import api_settings, import_from_string
 
 from main import models, constants
 from main.api import serializers
 from main.api import filters
-from main.api.helpers import to_bool
+from main.api.helpers import to_bool, parse_bbox
 from main.api.uploaders import SiteUploader, FileReader, RecordCreator, DataPackageBuilder
 from main.api.validators import get_record_validator_for_dataset
 from main.models import Project, Site, Dataset, Record
+from main.signals import bulk_record_changes, bulk_site_changes
 from main.utils_auth import is_admin
-from main.api.exporters import DefaultExporter
-from main.utils_http import WorkbookResponse, CSVFileResponse
-from main.utils_species import NoSpeciesFacade
+from main.jobs import create_job
+from main.api.exporters import get_exporter_class, ProjectExporter
+from main.utils_http import WorkbookResponse, CSVFileResponse, GeoJSONFileResponse, StoredFileResponse, \
+    ParquetFileResponse, ArrowFileResponse, GeoPackageFileResponse, ZipFileResponse
+from main.utils_species import NoSpeciesFacade, CachedSpeciesFacade
+from main import utils_species_matching
 from main.utils_misc import search_json_fields, order_by_json_field
+from main.utils_tiles import TileBuilder, TileError, LAYERS, RECORDS_LAYER, SITES_LAYER
+from main.utils_zip import zip_stream_it
 
 
 logger = logging.getLogger(__name__)
@@ -138,7 +149,8 @@ class ProjectSitesView(generics.ListCreateAPIView, generics.DestroyAPIView):
             qs = Site.objects.filter(project=self.project)
         else:
             return Response("A list of site ids must be provided or 'all'", status=status.HTTP_400_BAD_REQUEST)
-        qs.delete()
+        with bulk_site_changes(self.project):
+            qs.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -185,28 +197,130 @@ class ProjectSitesUploadView(APIView):
         return Response(data, status=status_code)
 
 
+class ProjectAssignNearestSitesView(APIView):
+    """
+    Link the records of the project to their nearest site within a distance. Done in a background job.
+    POST {"max_distance": meters, "datasets": [ids] (optional), "overwrite": false}
+    """
+    permission_classes = (IsAuthenticated, ProjectPermission)
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Intercept any request to set the project from the pk.
+        This is necessary for the ProjectPermission.
+        :param request:
+        """
+        self.project = get_object_or_404(Project, pk=self.kwargs.get('pk'))
+        return super(ProjectAssignNearestSitesView, self).dispatch(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            max_distance = float(request.data.get('max_distance'))
+            if math.isnan(max_distance) or math.isinf(max_distance) or max_distance <= 0:
+                raise ValueError()
+        except (TypeError, ValueError):
+            return Response("max_distance must be a positive number of meters", status=status.HTTP_400_BAD_REQUEST)
+        datasets = request.data.get('datasets')
+        if datasets is not None:
+            if not isinstance(datasets, list):
+                return Response("datasets must be a list of dataset ids", status=status.HTTP_400_BAD_REQUEST)
+            datasets = list(Dataset.objects.filter(project=self.project, pk__in=datasets).values_list('pk', flat=True))
+        job = create_job(
+            models.Job.TYPE_ASSIGN_NEAREST_SITES,
+            params={
+                'project': self.project.pk,
+                'max_distance': max_distance,
+                'datasets': datasets,
+                'overwrite': to_bool(request.data.get('overwrite', False))
+            },
+            owner=request.user
+        )
+        return Response(serializers.JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class ProjectExportView(APIView):
+    """
+    Stream a zip of the whole project as a frictionless data package: a csv file per dataset, the sites csv file and
+    the datapackage.json. The archive is generated on the fly.
+    """
+    permission_classes = (IsAuthenticated, ProjectPermission)
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Intercept any request to set the project from the pk.
+        This is necessary for the ProjectPermission.
+        :param request:
+        """
+        self.project = get_object_or_404(Project, pk=self.kwargs.get('pk'))
+        return super(ProjectExportView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        exporter = ProjectExporter(self.project)
+        file_name = self.project.name + '_' + datetime.datetime.now().strftime('%Y-%m-%d-%H%M%S') + '.zip'
+        return ZipFileResponse(zip_stream_it(exporter.zip_entries()), file_name=file_name)
+
+
 class SiteViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated, DRYPermissions)
     queryset = models.Site.objects.all()
     serializer_class = serializers.SiteSerializer
-    filter_fields = ('id', 'name', 'code', 'project__name', 'project__code', 'project__id')
+    filter_class = filters.SiteFilterSet
+
+    def filter_queryset(self, queryset):
+        queryset = super(SiteViewSet, self).filter_queryset(queryset)
+        if 'id__gt' in self.request.query_params or 'id__lt' in self.request.query_params:
+            # keyset pagination: the sites are ordered by code by default
+            queryset = queryset.order_by('id')
+        return queryset
 
     def perform_update(self, serializer):
         """
         Use case: A site has its geometry updated, all records related to the site having the same geometry
         should be updated accordingly.
+        The records are flagged with geometry_from_site. The cascade is done in one UPDATE, or in a background job
+        if there are more than settings.SITE_GEOMETRY_CASCADE_MAX_SYNC records to update.
         :param serializer:
         :return:
         """
-        instance = self.get_object()
-        if instance.geometry is not None:
-            records = Record.objects.filter(site=instance, geometry=instance.geometry)
-        else:
-            records = Record.objects.none()
-        serializer.save()
-        instance.refresh_from_db()
-        if instance.geometry is not None:
-            records.update(geometry=instance.geometry)
+        previous_geometry = serializer.instance.geometry
+        instance = serializer.save()
+        self.cascade_job = None
+        if instance.geometry is None or instance.geometry == previous_geometry:
+            return
+        count = instance.geometry_records.count()
+        if count > settings.SITE_GEOMETRY_CASCADE_MAX_SYNC:
+            self.cascade_job = create_job(
+                models.Job.TYPE_SITE_GEOMETRY_CASCADE,
+                params={
+                    'site': instance.pk,
+                    'previous_geometry': previous_geometry.ewkt if previous_geometry is not None else None
+                },
+                owner=self.request.user
+            )
+        elif count:
+            instance.cascade_geometry_to_records(previous_geometry)
+
+    def update(self, request, *args, **kwargs):
+        response = super(SiteViewSet, self).update(request, *args, **kwargs)
+        job = getattr(self, 'cascade_job', None)
+        if job is not None:
+            response.data['geometry_cascade_job'] = serializers.JobSerializer(job).data
+        return response
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    The background jobs of the user (all jobs for an admin).
+    """
+    permission_classes = (IsAuthenticated, DRYPermissions)
+    serializer_class = serializers.JobSerializer
+    filter_class = filters.JobFilterSet
+
+    def get_queryset(self):
+        queryset = models.Job.objects.all()
+        if not is_admin(self.request.user):
+            queryset = queryset.filter(owner=self.request.user)
+        return queryset
 
 
 class DatasetViewSet(viewsets.ModelViewSet):
@@ -315,10 +429,122 @@ class DatasetRecordsView(generics.ListAPIView, generics.DestroyAPIView, SpeciesM
             qs = Record.objects.filter(dataset=self.dataset)
         else:
             return Response("A list of record ids must be provided or 'all'", status=status.HTTP_400_BAD_REQUEST)
-        qs.delete()
+        with bulk_record_changes(self.dataset):
+            qs.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class DatasetSpeciesMatchingView(APIView):
+    """
+    Fuzzy matching of the unresolved species names (name_id = -1) of a species observation dataset.
+    GET: the suggested species for every distinct unresolved name. Query params: limit, threshold (similarity 0-1)
+    POST: apply the accepted corrections [{"species_name": <unresolved name>, "name_id": <name_id>}, ...]
+    """
+    permission_classes = (IsAuthenticated, DatasetRecordsPermission)
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Intercept any request to set the dataset from the pk.
+        This is necessary for the DatasetRecordsPermission.
+        :param request:
+        """
+        self.dataset = get_object_or_404(models.Dataset, pk=kwargs.get('pk'))
+        return super(DatasetSpeciesMatchingView, self).dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super(DatasetSpeciesMatchingView, self).initial(request, *args, **kwargs)
+        # the matching is done against the cached species list
+        CachedSpeciesFacade().ensure_fresh()
+
+    def get(self, request, *args, **kwargs):
+        if self.dataset.type != Dataset.TYPE_SPECIES_OBSERVATION:
+            return Response("Not a species observation dataset", status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', utils_species_matching.DEFAULT_SUGGESTIONS_LIMIT))
+            threshold = float(
+                request.query_params.get('threshold', utils_species_matching.DEFAULT_SIMILARITY_THRESHOLD))
+            # a threshold of 0 would match every species
+            if limit <= 0 or not 0 < threshold <= 1:
+                raise ValueError()
+        except (TypeError, ValueError):
+            return Response("limit must be a positive integer and threshold a number greater than 0 and up to 1",
+                            status=status.HTTP_400_BAD_REQUEST)
+        data = utils_species_matching.get_species_suggestions(self.dataset, limit=limit, threshold=threshold)
+        return Response(data)
+
+    def post(self, request, *args, **kwargs):
+        if self.dataset.type != Dataset.TYPE_SPECIES_OBSERVATION:
+            return Response("Not a species observation dataset", status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list):
+            return Response("A list of corrections must be provided", status=status.HTTP_400_BAD_REQUEST)
+        corrections = []
+        try:
+            for correction in request.data:
+                corrections.append((correction['species_name'], int(correction['name_id'])))
+        except (KeyError, TypeError, ValueError):
+            return Response("A correction must have a species_name and an integer name_id",
+                            status=status.HTTP_400_BAD_REQUEST)
+        name_ids = set([name_id for species_name, name_id in corrections])
+        unknown = name_ids - set(models.Species.objects.filter(name_id__in=name_ids).values_list('name_id', flat=True))
+        if unknown:
+            return Response("Unknown name_id: {}".format(', '.join([str(n) for n in sorted(unknown)])),
+                            status=status.HTTP_400_BAD_REQUEST)
+        count = utils_species_matching.apply_species_corrections(self.dataset, corrections)
+        return Response({'records': count})
+
+
+class DatasetExportView(APIView):
+    """
+    Cached export of the records of a dataset.
+    Query params: output (csv, xlsx or geojson, default csv) and any record filter (see RecordFilterSet).
+    The export file of the (dataset, filters, output) is sent if it has been generated from the current version of the
+    records. Otherwise a job (re)generating it in background is started (unless one is already running) and returned
+    with a 202 status: poll the job or request the export again later.
+    """
+    permission_classes = (IsAuthenticated, DatasetRecordsPermission)
+    content_types = {
+        models.DatasetExport.FORMAT_CSV: 'text/csv',
+        models.DatasetExport.FORMAT_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        models.DatasetExport.FORMAT_GEOJSON: 'application/geo+json',
+    }
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Intercept any request to set the dataset from the pk.
+        This is necessary for the DatasetRecordsPermission.
+        :param request:
+        """
+        self.dataset = get_object_or_404(models.Dataset, pk=kwargs.get('pk'))
+        return super(DatasetExportView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        # don't use 'format' param as it's kind of reserved by DRF
+        output = request.query_params.get('output', models.DatasetExport.FORMAT_CSV)
+        if output not in self.content_types:
+            return Response("output must be one of: {}".format(', '.join(sorted(self.content_types))),
+                            status=status.HTTP_400_BAD_REQUEST)
+        filter_names = set(filters.RecordFilterSet.base_filters) | {'in_bbox_exact'}
+        record_filters = dict([
+            (name, value) for name, value in request.query_params.items() if name in filter_names
+        ])
+        filter_set = filters.RecordFilterSet(record_filters, queryset=self.dataset.record_queryset)
+        if not filter_set.is_valid():
+            return Response(filter_set.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        export = models.DatasetExport.get_for(self.dataset, output, record_filters)
+        if export.is_current:
+            return StoredFileResponse(export.file, file_name=export.file_name, content_type=self.content_types[output])
+        with transaction.atomic():
+            # lock the export so that concurrent requests don't start several jobs
+            export = models.DatasetExport.objects.select_for_update().get(pk=export.pk)
+            job = export.job
+            if job is None or job.is_done:
+                job = create_job(models.Job.TYPE_DATASET_EXPORT, params={'export': export.pk}, owner=request.user)
+                export.job = job
+                export.save(update_fields=['job'])
+        return Response(serializers.JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
 class RecordViewSet(viewsets.ModelViewSet, SpeciesMixin):
     # TODO: implement a patch for the data JSON field. Ability to partially update some of the data properties.
     permission_classes = (IsAuthenticated, DRYPermissions)
@@ -380,31 +606,41 @@ class RecordViewSet(viewsets.ModelViewSet, SpeciesMixin):
     def list(self, request, *args, **kwargs):
         # don't use 'format' param as it's kind of reserved by DRF
         output = self.request.query_params.get('output')
-        if output in ['xlsx', 'csv']:
+        if output in ['xlsx', 'csv', 'geojson', 'parquet', 'arrow', 'gpkg', 'bundle', 'joined']:
             if not self.dataset:
                 return Response(status=status.HTTP_400_BAD_REQUEST, data="No dataset specified")
             qs = self.filter_queryset(self.get_queryset())
 
-            # exporter class
-            exporter_class = DefaultExporter
-            if hasattr(settings, 'EXPORTER_CLASS') and settings.EXPORTER_CLASS:
-                try:
-                    exporter_class = import_from_string(settings.EXPORTER_CLASS, 'EXPORTER_CLASS')
-                except Exception:
-                    logger.exception("Error while importing exporter class: {}".format(settings.EXPORTER_CLASS))
-
-            exporter = exporter_class(self.dataset, qs)
+            exporter = get_exporter_class()(self.dataset, qs)
             now = datetime.datetime.now()
             file_name = self.dataset.name + '_' + now.strftime('%Y-%m-%d-%H%M%S')
             if output == 'xlsx':
                 file_name += '.xlsx'
                 wb = exporter.to_workbook()
                 response = WorkbookResponse(wb, file_name)
+            elif output == 'geojson':
+                file_name += '.geojson'
+                response = GeoJSONFileResponse(exporter.geojson_it(), file_name=file_name)
+            elif output == 'parquet':
+                response = ParquetFileResponse(exporter.to_parquet, file_name=file_name)
+            elif output == 'arrow':
+                response = ArrowFileResponse(exporter.to_arrow, file_name=file_name)
+            elif output == 'gpkg':
+                response = GeoPackageFileResponse(exporter.to_geopackage, file_name=file_name)
+            elif output == 'joined':
+                # csv of the records joined to their parent record
+                if exporter.parent_lookup() is None:
+                    return Response(status=status.HTTP_400_BAD_REQUEST, data="The dataset has no parent dataset")
+                file_name += '_joined.csv'
+                response = CSVFileResponse(exporter.joined_csv_it(), file_name=file_name)
+            elif output == 'bundle':
+                # the records csv file and the media files
+                file_name += '.zip'
+                response = ZipFileResponse(zip_stream_it(exporter.media_bundle_entries()), file_name=file_name)
             else:
                 # csv
                 file_name += '.csv'
-                response = CSVFileResponse(file_name=file_name)
-                exporter.to_csv(response)
+                response = CSVFileResponse(exporter.csv_stream_it(), file_name=file_name)
             return response
         else:
             return super(RecordViewSet, self).list(request, *args, **kwargs)
@@ -539,49 +775,72 @@ class DatasetUploadRecordsView(APIView, SpeciesMixin):
             msg = "Wrong file type {}. Should be one of: {}".format(file_obj.content_type, SiteUploader.SUPPORTED_TYPES)
             return Response(msg, status=status.HTTP_501_NOT_IMPLEMENTED)
 
-        if delete_previous:
-            self.dataset.record_queryset.delete()
-        generator = FileReader(file_obj)
-        validator = get_record_validator_for_dataset(self.dataset)
-        validator.schema_error_as_warning = not strict
-        creator = RecordCreator(self.dataset, generator,
-                                validator=validator, create_site=create_site, commit=True,
-                                species_facade_class=self.species_facade_class)
         data = []
         has_error = False
-        row = 1  # starts at 1 to match excel row id
-        for record, validator_result in creator:
-            row += 1
-            result = {
-                'row': row
-            }
-            if validator_result.has_errors:
-                has_error = True
-            else:
-                result['recordId'] = record.id
-            result.update(validator_result.to_dict())
-            data.append(result)
+        # the extents and species summary are maintained once for the whole upload
+        with bulk_record_changes(self.dataset):
+            if delete_previous:
+                self.dataset.record_queryset.delete()
+            generator = FileReader(file_obj)
+            validator = get_record_validator_for_dataset(self.dataset)
+            validator.schema_error_as_warning = not strict
+            creator = RecordCreator(self.dataset, generator,
+                                    validator=validator, create_site=create_site, commit=True,
+                                    species_facade_class=self.species_facade_class)
+            row = 1  # starts at 1 to match excel row id
+            for record, validator_result in creator:
+                row += 1
+                result = {
+                    'row': row
+                }
+                if validator_result.has_errors:
+                    has_error = True
+                else:
+                    result['recordId'] = record.id
+                result.update(validator_result.to_dict())
+                data.append(result)
         status_code = status.HTTP_200_OK if not has_error else status.HTTP_400_BAD_REQUEST
         return Response(data, status=status_code)
 
 
 class SpeciesView(APIView, SpeciesMixin):
+    """
+    The species names of the records, read from the species summary table (see SpeciesSummary).
+    Query params:
+    - prefix: names starting with the value (case insensitive)
+    - search: names containing the value (case insensitive)
+    - strict: only the names resolved to a name_id
+    - summary: the species summaries (name_id, record and dataset counts, first and last observation) instead of the
+    names
+    - limit and offset for pagination
+    """
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+
     def get(self, request, *args, **kwargs):
         """
         Get a list of all species name present in the system
         :return: a list of species name.
         """
-        qs = Record.objects.exclude(species_name__isnull=True)
-        qs = self.filter_queryset(qs)
-        # we output just the species name
-        data = qs \
-            .distinct('species_name') \
-            .order_by('species_name') \
-            .values_list('species_name', flat=True)
+        models.SpeciesSummary.refresh_stale()
+        qs = self.filter_queryset(models.SpeciesSummary.objects.order_by('species_name'))
+        summary = to_bool(request.query_params.get('summary', False))
+        if not summary:
+            # we output just the species name
+            qs = qs.values_list('species_name', flat=True)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        species = page if page is not None else qs
+        data = serializers.SpeciesSummarySerializer(species, many=True).data if summary else list(species)
+        if page is not None:
+            return paginator.get_paginated_response(data)
         return Response(data=data)
 
     def filter_queryset(self, queryset):
         query = Q()
+        # prefix search
+        prefix = self.request.query_params.get('prefix')
+        if prefix:
+            query &= Q(species_name__istartswith=prefix)
         # search
         search = self.request.query_params.get('search')
         if search:
@@ -593,6 +852,213 @@ class SpeciesView(APIView, SpeciesMixin):
         return queryset.filter(query)
 
 
+class TileView(APIView):
+    """
+    Mapbox Vector Tile of the records and sites geometries.
+    Layers: 'records' and 'sites'.
+    Query params:
+    layers: comma separated list of layers (default all)
+    project, dataset, name_id: comma separated list of ids
+    datetime__gte, datetime__lte (also gt and lt): filter the records on the observation date
+    """
+    permission_classes = (IsAuthenticated,)
+    CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+    def get(self, request, *args, **kwargs):
+        layers = request.query_params.get('layers')
+        layers = [l.strip() for l in layers.split(',')] if layers else LAYERS
+        unknown_layers = set(layers) - set(LAYERS)
+        if unknown_layers:
+            return Response("Unknown layers {}. Should be one of: {}".format(list(unknown_layers), LAYERS),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        record_filter = filters.TileRecordFilterSet(request.query_params, queryset=Record.objects.all())
+        if not record_filter.is_valid():
+            return Response(record_filter.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = record_filter.form.cleaned_data
+
+        datasets = Dataset.objects.all()
+        if data.get('dataset'):
+            datasets = datasets.filter(pk__in=data['dataset'])
+        if data.get('project'):
+            datasets = datasets.filter(project__in=data['project'])
+
+        records = record_filter.qs if RECORDS_LAYER in layers else None
+        sites = None
+        if SITES_LAYER in layers:
+            sites = Site.objects.all()
+            if data.get('project'):
+                sites = sites.filter(project__in=data['project'])
+            if data.get('dataset'):
+                sites = sites.filter(project__in=datasets.values('project'))
+
+        builder = TileBuilder(records=records, sites=sites, datasets=datasets)
+        cache_filters = dict((k, request.query_params.getlist(k)) for k in sorted(request.query_params.keys()))
+        try:
+            tile = builder.get_tile(int(kwargs.get('z')), int(kwargs.get('x')), int(kwargs.get('y')),
+                                    filters=cache_filters)
+        except TileError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+        return HttpResponse(tile, content_type=self.CONTENT_TYPE)
+
+
+class RecordDensityView(APIView):
+    """
+    Count of records per cell for a bbox and a zoom level, computed in the database.
+    Query params:
+    bbox: minx,miny,maxx,maxy in WGS84 (optional)
+    zoom: the map zoom level, between 0 (default) and MAX_ZOOM. The cell size is about CELL_PIXELS screen pixels at
+    this zoom.
+    cell: 'grid' (default) or 'geohash'
+    All the record filters (see RecordFilterSet) are supported.
+    Output:
+    {
+        'cell': 'grid',
+        'cell_size': 0.7,
+        'cells': [{'cell': [x, y], 'count': 12}, ...]
+    }
+    For a grid the cell is the centre of the cell. For geohash it's the geohash string.
+    """
+    permission_classes = (IsAuthenticated,)
+    CELL_GRID = 'grid'
+    CELL_GEOHASH = 'geohash'
+    CELL_TYPES = [CELL_GRID, CELL_GEOHASH]
+    CELL_PIXELS = 32
+    TILE_PIXELS = 256
+    # at zoom 22 a cell is about 10cm wide, higher zooms don't aggregate anything.
+    MAX_ZOOM = 22
+    MAX_GEOHASH_PRECISION = 12
+
+    @staticmethod
+    def geohash_cell_width(precision):
+        # a geohash character is 5 bits, the longitude takes the extra bit.
+        lon_bits = (5 * precision + 1) // 2
+        return 360.0 / 2 ** lon_bits
+
+    def get_cell_size(self, zoom):
+        return 360.0 / 2 ** zoom * self.CELL_PIXELS / self.TILE_PIXELS
+
+    def get_geohash_precision(self, cell_size):
+        """
+        :return: the highest precision with a geohash cell not smaller than the cell size.
+        """
+        precision = 1
+        while precision < self.MAX_GEOHASH_PRECISION and self.geohash_cell_width(precision + 1) >= cell_size:
+            precision += 1
+        return precision
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        cell_type = params.get('cell', self.CELL_GRID)
+        if cell_type not in self.CELL_TYPES:
+            return Response("Unknown cell type {}. Should be one of: {}".format(cell_type, self.CELL_TYPES),
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            zoom = int(params.get('zoom', 0))
+            bbox = parse_bbox(params['bbox']) if params.get('bbox') else None
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+        if zoom < 0 or zoom > self.MAX_ZOOM:
+            return Response("zoom must be an integer between 0 and {}".format(self.MAX_ZOOM),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        qs = filters.RecordFilterSet(params, queryset=Record.objects.all()).qs
+        qs = qs.filter(geometry__isnull=False)
+        if bbox:
+            polygon = Polygon.from_bbox(bbox)
+            polygon.srid = constants.MODEL_SRID
+            qs = qs.filter(geometry__bboverlaps=polygon)
+
+        cell_size = self.get_cell_size(zoom)
+        if cell_type == self.CELL_GEOHASH:
+            precision = self.get_geohash_precision(cell_size)
+            cell_expression = GeoHash(Centroid('geometry'), precision=precision)
+            cell_size = self.geohash_cell_width(precision)
+        else:
+            cell_expression = SnapToGrid(Centroid('geometry'), cell_size)
+        cells = qs \
+            .annotate(cell=cell_expression) \
+            .order_by() \
+            .values('cell') \
+            .annotate(count=Count('id'))
+
+        data = OrderedDict([
+            ('cell', cell_type),
+            ('cell_size', cell_size),
+            ('cells', [
+                {
+                    'cell': [c['cell'].x, c['cell'].y] if cell_type == self.CELL_GRID else c['cell'],
+                    'count': c['count']
+                } for c in cells
+            ])
+        ])
+        return Response(data)
+
+
+class RecordTaxonomyView(APIView):
+    """
+    Count of records per taxon (family, genus, species or rank) computed in the database from the taxonomy of the
+    cached species list (see Species).
+    Query params:
+    group_by: 'family' (default), 'genus', 'species' or 'rank'
+    All the record filters (see RecordFilterSet) are supported, e.g. dataset__project__program__id, in_bbox,
+    datetime__gte.
+    Output:
+    {
+        'group_by': 'family',
+        'groups': [{'family_nid': 22751, 'family_code': '031', 'family': 'Poaceae', 'record_count': 12,
+                    'species_count': 3}, ...]
+    }
+    The records without a known name_id are counted in a group where the taxon values are null.
+    """
+    permission_classes = (IsAuthenticated,)
+    # group_by -> list of (sql expression, output name)
+    GROUPS = OrderedDict([
+        ('family', [
+            ('sp.family_nid', 'family_nid'), ('sp.family_code', 'family_code'), ('fam.species_name', 'family')
+        ]),
+        ('genus', [('sp.genus', 'genus')]),
+        ('species', [('sp.name_id', 'name_id'), ('sp.species_name', 'species_name')]),
+        ('rank', [('sp.rank_name', 'rank_name')]),
+    ])
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        group_by = params.get('group_by', 'family')
+        if group_by not in self.GROUPS:
+            return Response("Unknown group_by {}. Should be one of: {}".format(group_by, list(self.GROUPS)),
+                            status=status.HTTP_400_BAD_REQUEST)
+        qs = filters.RecordFilterSet(params, queryset=Record.objects.all()).qs
+        # count per name_id first, then roll-up the (few) name_ids to the taxon
+        counts = qs.order_by().values('name_id').annotate(record_count=Count('id'))
+        counts_sql, counts_params = counts.query.sql_with_params()
+        columns = self.GROUPS[group_by]
+        group_sql = ', '.join([expression for expression, name in columns])
+        species_table = connection.ops.quote_name(models.Species._meta.db_table)
+        sql = """
+        SELECT {group_sql}, SUM(c.record_count) AS record_count, COUNT(sp.name_id) AS species_count
+        FROM ({counts_sql}) AS c
+        LEFT JOIN {species} AS sp ON sp.name_id = c.name_id
+        LEFT JOIN {species} AS fam ON fam.name_id = sp.family_nid
+        GROUP BY {group_sql}
+        ORDER BY record_count DESC
+        """.format(group_sql=group_sql, counts_sql=counts_sql, species=species_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, counts_params)
+            rows = cursor.fetchall()
+        names = [name for expression, name in columns]
+        groups = []
+        for row in rows:
+            group = OrderedDict(zip(names, row[:len(names)]))
+            group['record_count'] = int(row[-2])
+            group['species_count'] = int(row[-1])
+            groups.append(group)
+        return Response(OrderedDict([
+            ('group_by', group_by),
+            ('groups', groups)
+        ]))
+
+
 class LogoutView(APIView):
     def get(self, request, *args, **kwargs):
         """
@@ -0,0 +1,11 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+from django.apps import AppConfig
+
+
+class MainConfig(AppConfig):
+    name = 'main'
+
+    def ready(self):
+        # connect the signal receivers
+        from main import signals  # noqa
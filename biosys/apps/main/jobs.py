@@ -0,0 +1,214 @@
+"""
+Background jobs.
+A job is a Job model instance with a type, params and a status. The function that executes a job type is registered
+with the @job_handler decorator and receives the job, what it returns is stored as the job result.
+Jobs are started in a thread after the current transaction is committed, unless settings.JOBS_RUN_IN_THREAD is False.
+In that case they stay pending until the 'run_jobs' management command picks them up.
+A job still running after settings.JOBS_RUNNING_TIMEOUT minutes (e.g. its web worker was restarted) is flagged as
+failed by run_pending_jobs.
+"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import datetime
+import logging
+import tempfile
+import threading
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main.api.exporters import get_exporter_class
+from main.api.filters import RecordFilterSet
+from main.models import DatasetExport, Job, Project, Site, Species
+from main.utils_species import refresh_species, build_species_lookup_file_from_db, get_species_facade_class, \
+    SpeciesCacheError, SpeciesIndex
+from main.utils_species_matching import resolve_species_names, get_name_resolved_datasets
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+
+    return decorator
+
+
+def create_job(job_type, params=None, owner=None, start=True):
+    """
+    Create a job and start it once the current transaction is committed.
+    :param start: if False the job is left pending, e.g. to be run synchronously with run_job.
+    :return: the Job instance
+    """
+    job = Job.objects.create(type=job_type, params=params or {}, owner=owner)
+    if start and getattr(settings, 'JOBS_RUN_IN_THREAD', True):
+        transaction.on_commit(lambda: start_job_thread(job.pk))
+    return job
+
+
+def start_job_thread(job_id):
+    thread = threading.Thread(target=_run_job_in_thread, args=(job_id,))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _run_job_in_thread(job_id):
+    try:
+        job = Job.objects.filter(pk=job_id, status=Job.STATUS_PENDING).first()
+        if job is not None:
+            run_job(job)
+    finally:
+        # the thread has its own db connection
+        connection.close()
+
+
+def run_job(job):
+    """
+    Execute the job synchronously and store its status and result.
+    :return: the job
+    """
+    handler = JOB_HANDLERS.get(job.type)
+    job.status = Job.STATUS_RUNNING
+    job.started = timezone.now()
+    job.save(update_fields=['status', 'started'])
+    try:
+        if handler is None:
+            raise Exception('No handler for the job type {}'.format(job.type))
+        # the handler manages its own transactions (e.g. chunked updates)
+        job.result = handler(job)
+        job.status = Job.STATUS_SUCCESS
+    except Exception as e:
+        logger.exception('Error while running the job {}'.format(job))
+        job.status = Job.STATUS_FAILED
+        job.error = '{}'.format(e)
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished'])
+    return job
+
+
+def fail_stale_jobs(timeout=None):
+    """
+    Flag as failed the jobs running for more than timeout minutes (settings.JOBS_RUNNING_TIMEOUT by default). Their
+    thread is most likely dead.
+    :return: the number of failed jobs
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'JOBS_RUNNING_TIMEOUT', None)
+    if not timeout:
+        return 0
+    now = timezone.now()
+    return Job.objects \
+        .filter(status=Job.STATUS_RUNNING, started__lt=now - datetime.timedelta(minutes=timeout)) \
+        .update(
+            status=Job.STATUS_FAILED,
+            error='The job has not finished after {} minutes'.format(timeout),
+            finished=now
+        )
+
+
+def run_pending_jobs(limit=None):
+    """
+    Run the pending jobs, oldest first. A job is locked while it is picked so that concurrent runners don't execute
+    the same job. The stale running jobs are flagged as failed first (see fail_stale_jobs).
+    :return: the list of executed jobs
+    """
+    stale_count = fail_stale_jobs()
+    if stale_count:
+        logger.warning('{} stale running jobs flagged as failed'.format(stale_count))
+    executed = []
+    while limit is None or len(executed) < limit:
+        with transaction.atomic():
+            job = Job.objects \
+                .select_for_update(skip_locked=True) \
+                .filter(status=Job.STATUS_PENDING) \
+                .order_by('created') \
+                .first()
+            if job is None:
+                break
+            job.status = Job.STATUS_RUNNING
+            job.started = timezone.now()
+            job.save(update_fields=['status', 'started'])
+        executed.append(run_job(job))
+    return executed
+
+
+@job_handler(Job.TYPE_SITE_GEOMETRY_CASCADE)
+def site_geometry_cascade(job):
+    params = job.params or {}
+    site = Site.objects.get(pk=params['site'])
+    previous_geometry = params.get('previous_geometry')
+    if previous_geometry:
+        previous_geometry = GEOSGeometry(previous_geometry)
+    return {
+        'records': site.cascade_geometry_to_records(previous_geometry)
+    }
+
+
+@job_handler(Job.TYPE_ASSIGN_NEAREST_SITES)
+def assign_nearest_sites(job):
+    params = job.params or {}
+    project = Project.objects.get(pk=params['project'])
+    return {
+        'records': project.assign_nearest_sites(
+            params['max_distance'],
+            datasets=params.get('datasets'),
+            overwrite=params.get('overwrite', False)
+        )
+    }
+
+
+@job_handler(Job.TYPE_REFRESH_SPECIES)
+def refresh_species_handler(job):
+    params = job.params or {}
+    result = refresh_species(full=params.get('full', False))
+    # the shared lookup file of this host is rebuilt now, the other hosts will rebuild it on their next lookup.
+    build_species_lookup_file_from_db(stamp=job.pk)
+    if result['created'] or result['updated'] or result['deleted']:
+        # re-resolve the name_id of the records against the new species list
+        species_index = SpeciesIndex(dict(Species.objects.values_list('species_name', 'name_id')))
+        result['resolved'] = resolve_species_names(species_index)
+    return result
+
+
+@job_handler(Job.TYPE_RESOLVE_SPECIES_NAMES)
+def resolve_species_names_handler(job):
+    params = job.params or {}
+    species_index = get_species_facade_class()().species_index()
+    if not len(species_index):
+        # protect the records against an unavailable species list
+        raise SpeciesCacheError('The species list is empty')
+    datasets = None
+    if params.get('datasets'):
+        datasets = [ds for ds in get_name_resolved_datasets() if ds.pk in params['datasets']]
+    return resolve_species_names(species_index, datasets=datasets)
+
+
+@job_handler(Job.TYPE_DATASET_EXPORT)
+def dataset_export(job):
+    params = job.params or {}
+    export = DatasetExport.objects.select_related('dataset').get(pk=params['export'])
+    dataset = export.dataset
+    # the version is read before the records, a change during the export will trigger another one.
+    version = dataset.records_version
+    records = RecordFilterSet(export.filters, queryset=dataset.record_queryset).qs.order_by('id')
+    exporter = get_exporter_class()(dataset, records)
+    with tempfile.TemporaryFile() as output:
+        exporter.to_file(output, export.format)
+        if export.file:
+            export.file.delete(save=False)
+        export.file.save('{}.{}'.format(export.key, export.format), File(output), save=False)
+    export.version = version
+    export.save(update_fields=['file', 'version', 'last_modified'])
+    DatasetExport.prune(dataset, version, getattr(settings, 'DATASET_EXPORT_MAX_COUNT', None))
+    return {
+        'export': export.pk,
+        'version': version,
+        'size': export.file.size
+    }
@@ -0,0 +1,30 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Link the records of a project to their nearest site within a distance (in meters).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='The project id.')
+        parser.add_argument('max_distance', type=float, help='Maximum distance in meters.')
+        parser.add_argument('--dataset', type=int, action='append', dest='datasets',
+                            help='Restrict to this dataset id. Can be repeated.')
+        parser.add_argument('--overwrite', action='store_true', default=False,
+                            help='Also reassign the records that already have a site.')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Number of record ids per update.')
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(pk=options['project']).first()
+        if project is None:
+            raise CommandError('Project {} does not exist'.format(options['project']))
+        count = project.assign_nearest_sites(
+            options['max_distance'],
+            datasets=options['datasets'],
+            overwrite=options['overwrite'],
+            chunk_size=options['chunk_size']
+        )
+        self.stdout.write('{} records assigned to a site'.format(count))
@@ -0,0 +1,21 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.jobs import create_job, run_job
+from main.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Refresh the local species table from the species source (settings.SPECIES_CACHE_SOURCE_CLASS).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', default=False,
+                            help='Fetch all the species instead of the ones updated since the last refresh. '
+                                 'Needed to remove the species deleted from the source.')
+
+    def handle(self, *args, **options):
+        job = run_job(create_job(Job.TYPE_REFRESH_SPECIES, params={'full': options['full']}, start=False))
+        if job.status != Job.STATUS_SUCCESS:
+            raise CommandError('Species refresh failed: {}'.format(job.error))
+        self.stdout.write('Species refreshed: {}'.format(job.result))
@@ -0,0 +1,22 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.jobs import create_job, run_job
+from main.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Resolve again the name_id of the species observation records from their species name ' \
+           '(settings.SPECIES_FACADE_CLASS).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', type=int, action='append', dest='datasets',
+                            help='Restrict to this dataset id. Can be repeated.')
+
+    def handle(self, *args, **options):
+        job = create_job(Job.TYPE_RESOLVE_SPECIES_NAMES, params={'datasets': options['datasets']}, start=False)
+        job = run_job(job)
+        if job.status != Job.STATUS_SUCCESS:
+            raise CommandError('Species names resolution failed: {}'.format(job.error))
+        self.stdout.write('Species names resolved: {}'.format(job.result))
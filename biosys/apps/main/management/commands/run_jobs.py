@@ -0,0 +1,17 @@
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+from django.core.management.base import BaseCommand
+
+from main.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run the pending background jobs. Use it (e.g. in a cron) if JOBS_RUN_IN_THREAD is False.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of jobs to run.')
+
+    def handle(self, *args, **options):
+        jobs = run_pending_jobs(limit=options['limit'])
+        for job in jobs:
+            self.stdout.write('{}'.format(job))
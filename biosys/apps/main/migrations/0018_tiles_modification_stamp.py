@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_datasetmedia_projectmedia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['dataset', 'last_modified'], name='main_record_ds_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_record_geometry_from_site_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='type',
+            field=models.CharField(choices=[('site_geometry_cascade', 'Site geometry cascade'), ('assign_nearest_sites', 'Assign nearest sites')], max_length=100),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_job_type_assign_nearest_sites'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Species',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name_id', models.IntegerField(unique=True)),
+                ('species_name', models.CharField(db_index=True, max_length=500)),
+            ],
+            options={
+                'ordering': ['species_name'],
+                'verbose_name_plural': 'species',
+            },
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='type',
+            field=models.CharField(choices=[('site_geometry_cascade', 'Site geometry cascade'), ('assign_nearest_sites', 'Assign nearest sites'), ('refresh_species', 'Refresh species')], max_length=100),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_species'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            "CREATE INDEX main_species_name_trgm_idx ON main_species USING gin (species_name gin_trgm_ops);",
+            reverse_sql="DROP INDEX IF EXISTS main_species_name_trgm_idx;"
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_species_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['species_name'], name='main_record_species_name_idx'),
+        ),
+        migrations.CreateModel(
+            name='SpeciesSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('species_name', models.CharField(max_length=500, unique=True)),
+                ('name_id', models.IntegerField(default=-1)),
+                ('record_count', models.IntegerField(default=0)),
+                ('dataset_count', models.IntegerField(default=0)),
+                ('first_observed', models.DateTimeField(blank=True, null=True)),
+                ('last_observed', models.DateTimeField(blank=True, null=True)),
+                ('stale', models.BooleanField(db_index=True, default=True)),
+            ],
+            options={
+                'ordering': ['species_name'],
+                'verbose_name_plural': 'species summaries',
+            },
+        ),
+        # case insensitive prefix search (species_name__istartswith)
+        migrations.RunSQL(
+            "CREATE INDEX main_speciessummary_name_prefix_idx "
+            "ON main_speciessummary (UPPER(species_name::text) text_pattern_ops);",
+            reverse_sql="DROP INDEX IF EXISTS main_speciessummary_name_prefix_idx;"
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO main_speciessummary
+              (species_name, name_id, record_count, dataset_count, first_observed, last_observed, stale)
+            SELECT species_name, MAX(name_id), COUNT(*), COUNT(DISTINCT dataset_id), MIN(datetime), MAX(datetime), false
+            FROM main_record
+            WHERE species_name IS NOT NULL AND species_name <> ''
+            GROUP BY species_name;
+            """,
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_job_type_resolve_species_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='species',
+            name='md5_rowhash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='species',
+            name='updated_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_species_rowhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='species',
+            name='genus',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='species',
+            name='family_nid',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='species',
+            name='family_code',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='species',
+            name='rank_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='species',
+            name='kingdom_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        # the taxonomy of the existing species is filled by the next refresh: without updated_on the refresh is full
+        # (see utils_species.refresh_species) and without row hash it compares the whole rows (see
+        # utils_species._is_species_changed).
+        migrations.RunSQL(
+            "UPDATE main_species SET md5_rowhash = '', updated_on = NULL",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['dataset', 'name_id'], name='main_record_ds_name_id_idx'),
+        ),
+    ]
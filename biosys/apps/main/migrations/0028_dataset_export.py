@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import main.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0027_species_taxonomy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='type',
+            field=models.CharField(choices=[('site_geometry_cascade', 'Site geometry cascade'), ('assign_nearest_sites', 'Assign nearest sites'), ('refresh_species', 'Refresh species'), ('resolve_species_names', 'Resolve species names'), ('dataset_export', 'Dataset export')], max_length=100),
+        ),
+        migrations.CreateModel(
+            name='DatasetExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'XLSX'), ('geojson', 'GeoJSON')], max_length=20)),
+                ('filters', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict)),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('version', models.CharField(blank=True, default='', max_length=100)),
+                ('file', models.FileField(blank=True, null=True, upload_to=main.models.get_export_path)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exports', to='main.Dataset')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.Job')),
+            ],
+            options={
+                'ordering': ['-last_modified'],
+            },
+        ),
+    ]
@@ -1,5 +1,7 @@
 from __future__ import absolute_import, unicode_literals, print_function, division
 
+import hashlib
+import json
 import logging
 from os import path
 
@@ -9,9 +11,9 @@ from tableschema import validate as tableschema_validate
 from tableschema import exceptions as tableschema_exceptions
 from django.conf import settings
 from django.contrib.gis.db import models
-from django.contrib.gis.db.models import Extent
 from django.contrib.postgres.fields import JSONField
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.text import Truncator
 from django.db.models.query_utils import Q
@@ -20,10 +22,51 @@ from timezone_field import TimeZoneField
 from main.constants import DATUM_CHOICES, MODEL_SRID
 from main.utils_auth import is_admin
 from main.utils_data_package import GenericSchema, ObservationSchema, SpeciesObservationSchema
+from main.utils_extent import refresh_datasets_extent, refresh_projects_extent, replace_extent_geometry
 
 logger = logging.getLogger(__name__)
 
 
+class LoadedGeometryMixin(object):
+    """
+    Keep track of the geometry as loaded from the db, so a change of geometry can be detected on save.
+    Used to maintain the cached extents of the datasets and projects (see main.signals)
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(LoadedGeometryMixin, cls).from_db(db, field_names, values)
+        instance._loaded_geometry = instance.__dict__.get('geometry')
+        return instance
+
+    @property
+    def loaded_geometry(self):
+        return getattr(self, '_loaded_geometry', None)
+
+
+class CachedExtentModel(models.Model):
+    """
+    A model with a bounding box maintained incrementally in the db. See main.utils_extent
+    """
+    CACHED_EXTENT_FIELDS = ('cached_extent', 'extent_stale')
+
+    cached_extent = models.GeometryField(srid=MODEL_SRID, null=True, blank=True, editable=False)
+    extent_stale = models.BooleanField(default=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        # the cached extent is updated in the db behind the back of this instance. Don't overwrite it with the
+        # (possibly outdated) loaded value.
+        if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CACHED_EXTENT_FIELDS
+            ]
+        super(CachedExtentModel, self).save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
 @python_2_unicode_compatible
 class Program(models.Model):
     name = models.CharField(max_length=300, null=False, blank=False, unique=True,
@@ -84,7 +127,7 @@ class Program(models.Model):
 
 
 @python_2_unicode_compatible
-class Project(models.Model):
+class Project(LoadedGeometryMixin, CachedExtentModel):
     DEFAULT_TIMEZONE = settings.TIME_ZONE
 
     program = models.ForeignKey(Program, blank=False, null=False, on_delete=models.CASCADE,
@@ -196,7 +239,61 @@ class Project(models.Model):
 
     @property
     def extent(self):
-        return self.geometry.extent if self.geometry else None
+        """
+        The bounding box of the project geometry, sites and records. Recomputed only if stale.
+        """
+        if self.extent_stale:
+            refresh_projects_extent(Project.objects.filter(pk=self.pk))
+            self.refresh_from_db(fields=['cached_extent', 'extent_stale'])
+        return self.cached_extent.extent if self.cached_extent else None
+
+    def assign_nearest_sites(self, max_distance, datasets=None, overwrite=False, chunk_size=10000):
+        """
+        Link the records of the project to their nearest site of the project within max_distance.
+        The nearest site is found with a KNN (<->) query on the site geometry index. The distance is checked on the
+        geography (meters). The records are updated by chunks of ids, one UPDATE per chunk.
+        :param max_distance: in meters
+        :param datasets: restrict to these datasets (queryset or list of ids)
+        :param overwrite: if False only the records without site are assigned.
+        :param chunk_size: number of record ids per UPDATE
+        :return: the number of records updated
+        """
+        records = Record.objects.filter(dataset__project=self, geometry__isnull=False)
+        if datasets is not None:
+            records = records.filter(dataset__in=datasets)
+        if not overwrite:
+            records = records.filter(site__isnull=True)
+        id_range = records.aggregate(min_id=models.Min('id'), max_id=models.Max('id'))
+        if id_range['min_id'] is None:
+            return 0
+        records_sql, records_params = records.order_by().values('id').query.sql_with_params()
+        qn = connection.ops.quote_name
+        sql = """
+        UPDATE {record} SET site_id = nearest.site_id, geometry_from_site = nearest.geometry_from_site,
+          last_modified = now()
+        FROM (
+          SELECT r.id AS record_id, s.id AS site_id, r.geometry ~= s.geometry AS geometry_from_site
+          FROM {record} AS r
+          CROSS JOIN LATERAL (
+            SELECT site.id, site.geometry FROM {site} AS site
+            WHERE site.project_id = %s AND site.geometry IS NOT NULL
+            ORDER BY site.geometry <-> r.geometry
+            LIMIT 1
+          ) AS s
+          WHERE r.id >= %s AND r.id < %s AND r.id IN ({records_sql})
+          AND ST_DWithin(s.geometry::geography, r.geometry::geography, %s)
+        ) AS nearest
+        WHERE {record}.id = nearest.record_id AND {record}.site_id IS DISTINCT FROM nearest.site_id
+        """.format(record=qn(Record._meta.db_table), site=qn(Site._meta.db_table), records_sql=records_sql)
+        count = 0
+        start = id_range['min_id']
+        with connection.cursor() as cursor:
+            while start <= id_range['max_id']:
+                end = start + chunk_size
+                cursor.execute(sql, [self.pk, start, end] + list(records_params) + [max_distance])
+                count += cursor.rowcount
+                start = end
+        return count
 
     @property
     def dataset_count(self):
@@ -218,7 +315,7 @@ class Project(models.Model):
 
 
 @python_2_unicode_compatible
-class Site(models.Model):
+class Site(LoadedGeometryMixin, models.Model):
     project = models.ForeignKey('Project', null=False, blank=False,
                                 verbose_name="Project", help_text="Select the project this site is part of (required)",
                                 on_delete=models.CASCADE)
@@ -233,6 +330,7 @@ class Site(models.Model):
     description = models.TextField(null=True, blank=True,
                                    verbose_name="Description", help_text="")
     attributes = JSONField(null=True, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
 
     def is_custodian(self, user):
         return self.project.is_custodian(user)
@@ -240,6 +338,34 @@ class Site(models.Model):
     def is_data_engineer(self, user):
         return self.project.is_data_engineer(user)
 
+    @property
+    def geometry_records(self):
+        """
+        The records that inherited their geometry from this site.
+        """
+        return Record.objects.filter(site=self, geometry_from_site=True)
+
+    def cascade_geometry_to_records(self, previous_geometry=None):
+        """
+        Copy the site geometry to the records that inherited their geometry from the site in a single UPDATE.
+        :param previous_geometry: the geometry of the site before the change. Used to maintain the datasets extent.
+        :return: the number of records updated
+        """
+        qn = connection.ops.quote_name
+        sql = """
+        UPDATE {record} SET geometry = s.geometry, last_modified = now()
+        FROM {site} AS s
+        WHERE {record}.site_id = s.id AND {record}.geometry_from_site AND s.id = %s AND s.geometry IS NOT NULL
+        """.format(record=qn(Record._meta.db_table), site=qn(Site._meta.db_table))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk])
+            count = cursor.rowcount
+        if count:
+            # queryset.update and raw SQL don't send signals
+            datasets = Dataset.objects.filter(pk__in=self.geometry_records.values('dataset_id'))
+            replace_extent_geometry(datasets, previous_geometry, self.geometry)
+        return count
+
     # API permissions
     @staticmethod
     def has_read_permission(request):
@@ -306,7 +432,7 @@ class Site(models.Model):
 
 
 @python_2_unicode_compatible
-class Dataset(models.Model):
+class Dataset(CachedExtentModel):
     TYPE_GENERIC = 'generic'
     TYPE_OBSERVATION = 'observation'
     TYPE_SPECIES_OBSERVATION = 'species_observation'
@@ -349,9 +475,28 @@ class Dataset(models.Model):
     def record_count(self):
         return self.record_queryset.count()
 
+    @property
+    def records_version(self):
+        """
+        A stamp of the records (count and last modification) that changes every time a record is created, updated or
+        deleted. Used to tell if a cached export is still valid (see DatasetExport).
+        """
+        stats = self.record_queryset.order_by().aggregate(
+            count=models.Count('id'),
+            last_modified=models.Max('last_modified')
+        )
+        last_modified = stats['last_modified'].isoformat() if stats['last_modified'] else ''
+        return '{}:{}'.format(stats['count'], last_modified)
+
     @property
     def extent(self):
-        return self.record_queryset.aggregate(Extent('geometry'))['geometry__extent']
+        """
+        The bounding box of the records. Recomputed only if stale.
+        """
+        if self.extent_stale:
+            refresh_datasets_extent(Dataset.objects.filter(pk=self.pk))
+            self.refresh_from_db(fields=['cached_extent', 'extent_stale'])
+        return self.cached_extent.extent if self.cached_extent else None
 
     @property
     def schema_class(self):
@@ -590,13 +735,15 @@ class Dataset(models.Model):
 
 
 @python_2_unicode_compatible
-class Record(models.Model):
+class Record(LoadedGeometryMixin, models.Model):
     dataset = models.ForeignKey(Dataset, null=False, blank=False, on_delete=models.CASCADE)
     data = JSONField()
     site = models.ForeignKey(Site, null=True, blank=True, on_delete=models.SET_NULL)
     # Fields for Observation and Species Observation
     datetime = models.DateTimeField(null=True, blank=True)
     geometry = models.GeometryField(srid=MODEL_SRID, spatial_index=True, null=True, blank=True)
+    # True if the geometry is the one of the site. Set on save. Used to cascade a change of the site geometry.
+    geometry_from_site = models.BooleanField(default=False, editable=False)
     # Fields specific for Species Observation
     species_name = models.CharField(max_length=500, null=True, blank=True,
                                     verbose_name="Species Name", help_text="Species Name (as imported)")
@@ -618,6 +765,25 @@ class Record(models.Model):
     def __str__(self):
         return "{0}: {1}".format(self.dataset.name, Truncator(self.data).chars(100))
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Record, cls).from_db(db, field_names, values)
+        # to detect a change of species on save, see SpeciesSummary
+        instance._loaded_species_name = instance.__dict__.get('species_name')
+        return instance
+
+    @property
+    def loaded_species_name(self):
+        return getattr(self, '_loaded_species_name', None)
+
+    def save(self, *args, **kwargs):
+        self.geometry_from_site = self.is_geometry_from_site()
+        super(Record, self).save(*args, **kwargs)
+
+    def is_geometry_from_site(self):
+        site_geometry = self.site.geometry if self.site_id is not None else None
+        return self.geometry is not None and site_geometry is not None and self.geometry.equals_exact(site_geometry)
+
     @property
     def data_with_id(self):
         return dict({'id': self.id}, **self.data)
@@ -726,6 +892,16 @@ class Record(models.Model):
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            # used for the dataset modification stamp (count, max(last_modified))
+            models.Index(fields=['dataset', 'last_modified'], name='main_record_ds_modified_idx'),
+            # used for the cascade of a site geometry
+            models.Index(fields=['site', 'geometry_from_site'], name='main_record_site_geom_idx'),
+            # used for the refresh of the species summary
+            models.Index(fields=['species_name'], name='main_record_species_name_idx'),
+            # used for the taxonomy roll-up (count of records per name_id)
+            models.Index(fields=['dataset', 'name_id'], name='main_record_ds_name_id_idx'),
+        ]
 
 
 def get_media_path(instance, filename):
@@ -1026,3 +1202,251 @@ class DatasetMedia(models.Model):
 
     def has_object_destroy_permission(self, request):
         return is_admin(request.user) or self.is_data_engineer(request.user)
+
+
+@python_2_unicode_compatible
+class Job(models.Model):
+    """
+    A long running task executed in background (see main.jobs).
+    The client can poll the job to get its status and result.
+    """
+    TYPE_SITE_GEOMETRY_CASCADE = 'site_geometry_cascade'
+    TYPE_ASSIGN_NEAREST_SITES = 'assign_nearest_sites'
+    TYPE_REFRESH_SPECIES = 'refresh_species'
+    TYPE_RESOLVE_SPECIES_NAMES = 'resolve_species_names'
+    TYPE_DATASET_EXPORT = 'dataset_export'
+    TYPE_CHOICES = [
+        (TYPE_SITE_GEOMETRY_CASCADE, 'Site geometry cascade'),
+        (TYPE_ASSIGN_NEAREST_SITES, 'Assign nearest sites'),
+        (TYPE_REFRESH_SPECIES, 'Refresh species'),
+        (TYPE_RESOLVE_SPECIES_NAMES, 'Resolve species names'),
+        (TYPE_DATASET_EXPORT, 'Dataset export'),
+    ]
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCESS, 'Success'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    type = models.CharField(max_length=100, null=False, blank=False, choices=TYPE_CHOICES)
+    status = models.CharField(max_length=20, null=False, blank=False, choices=STATUS_CHOICES,
+                              default=STATUS_PENDING, db_index=True)
+    params = JSONField(null=True, blank=True)
+    result = JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_done(self):
+        return self.status in [self.STATUS_SUCCESS, self.STATUS_FAILED]
+
+    # API permissions
+    @staticmethod
+    def has_read_permission(request):
+        return True
+
+    def has_object_read_permission(self, request):
+        return is_admin(request.user) or self.owner == request.user
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return '{} {} ({})'.format(self.type, self.pk, self.status)
+
+
+def get_export_path(instance, filename):
+    """
+    The function used in DatasetExport file field to build the path of the export file.
+    """
+    return 'exports/dataset_{dataset}/{filename}'.format(dataset=instance.dataset_id, filename=filename)
+
+
+@python_2_unicode_compatible
+class DatasetExport(models.Model):
+    """
+    An export file of the records of a dataset for a (dataset, filters, format) key.
+    The file is generated by a background job (see main.jobs) and kept on the default storage. It is served as long as
+    the records version it was generated from is the dataset current one (see Dataset.records_version), otherwise it
+    is generated again.
+    """
+    FORMAT_CSV = 'csv'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_GEOJSON = 'geojson'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_XLSX, 'XLSX'),
+        (FORMAT_GEOJSON, 'GeoJSON'),
+    ]
+
+    dataset = models.ForeignKey(Dataset, related_name='exports', on_delete=models.CASCADE)
+    format = models.CharField(max_length=20, choices=FORMAT_CHOICES)
+    # the record filters (see main.api.filters.RecordFilterSet)
+    filters = JSONField(default=dict, blank=True)
+    # sha1 of the (dataset, filters, format)
+    key = models.CharField(max_length=40, unique=True)
+    # the records version of the file
+    version = models.CharField(max_length=100, blank=True, default='')
+    file = models.FileField(upload_to=get_export_path, null=True, blank=True)
+    # the last generation job
+    job = models.ForeignKey(Job, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-last_modified']
+
+    def __str__(self):
+        return '{} {} ({})'.format(self.dataset, self.format, self.key)
+
+    @staticmethod
+    def build_key(dataset, export_format, filters):
+        key = {
+            'dataset': dataset.pk,
+            'format': export_format,
+            'filters': filters or {}
+        }
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get_for(cls, dataset, export_format, filters):
+        """
+        :return: the export of the (dataset, filters, format) key, created if it doesn't exist
+        """
+        export, created = cls.objects.get_or_create(
+            key=cls.build_key(dataset, export_format, filters),
+            defaults={
+                'dataset': dataset,
+                'format': export_format,
+                'filters': filters or {}
+            }
+        )
+        return export
+
+    @classmethod
+    def prune(cls, dataset, version, max_count):
+        """
+        Delete the exports of the dataset not generated from the given records version and keep only the max_count
+        most recently generated ones. The exports being generated are kept.
+        """
+        exports = cls.objects.filter(dataset=dataset)
+        current = exports.filter(version=version).order_by('-last_modified').values_list('pk', flat=True)
+        kept = list(current[:max_count]) if max_count else list(current)
+        # the file of each deleted export is deleted by a signal, see main.signals
+        exports \
+            .exclude(pk__in=kept) \
+            .exclude(job__status__in=[Job.STATUS_PENDING, Job.STATUS_RUNNING]) \
+            .delete()
+
+    @property
+    def is_current(self):
+        return bool(self.file) and self.version == self.dataset.records_version
+
+    @property
+    def file_name(self):
+        """
+        The name of the downloaded file
+        """
+        return '{}_{}.{}'.format(self.dataset.name, self.last_modified.strftime('%Y-%m-%d-%H%M%S'), self.format)
+
+
+@python_2_unicode_compatible
+class Species(models.Model):
+    """
+    A local copy of the species list of the species source (e.g. Herbie).
+    Populated by the 'refresh_species' job, see main.utils_species.CachedSpeciesFacade
+    """
+    name_id = models.IntegerField(unique=True)
+    species_name = models.CharField(max_length=500, db_index=True)
+    # the source row hash and last update, used for the incremental refresh
+    md5_rowhash = models.CharField(max_length=32, blank=True, default='')
+    updated_on = models.DateField(null=True, blank=True)
+    # taxonomy. The family_nid is the name_id of the family.
+    genus = models.CharField(max_length=200, blank=True, default='', db_index=True)
+    family_nid = models.IntegerField(null=True, blank=True, db_index=True)
+    family_code = models.CharField(max_length=50, blank=True, default='')
+    rank_name = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    kingdom_id = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['species_name']
+        verbose_name_plural = 'species'
+
+    def __str__(self):
+        return '{} ({})'.format(self.species_name, self.name_id)
+
+
+@python_2_unicode_compatible
+class SpeciesSummary(models.Model):
+    """
+    One row per distinct species name of the records with the record count, dataset count and observation dates.
+    The record signals flag the rows of the species names of a saved or deleted record as stale (see main.signals)
+    and the stale rows are recomputed in one statement before being read (see refresh_stale).
+    """
+    species_name = models.CharField(max_length=500, unique=True)
+    # the resolved name_id if any of the records is resolved else -1
+    name_id = models.IntegerField(default=-1)
+    record_count = models.IntegerField(default=0)
+    dataset_count = models.IntegerField(default=0)
+    first_observed = models.DateTimeField(null=True, blank=True)
+    last_observed = models.DateTimeField(null=True, blank=True)
+    stale = models.BooleanField(default=True, db_index=True)
+
+    class Meta:
+        ordering = ['species_name']
+        verbose_name_plural = 'species summaries'
+
+    def __str__(self):
+        return '{} ({})'.format(self.species_name, self.record_count)
+
+    @classmethod
+    def mark_stale(cls, species_names):
+        species_names = list(set([name for name in species_names if name]))
+        if not species_names:
+            return
+        table = connection.ops.quote_name(cls._meta.db_table)
+        sql = """
+        INSERT INTO {table} (species_name, name_id, record_count, dataset_count, stale)
+        SELECT name, -1, 0, 0, true FROM unnest(%s::text[]) AS name
+        ON CONFLICT (species_name) DO UPDATE SET stale = true WHERE NOT {table}.stale
+        """.format(table=table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [species_names])
+
+    @classmethod
+    def refresh_stale(cls):
+        """
+        Recompute the stale rows from the records and delete the ones without records anymore.
+        """
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        record_table = qn(Record._meta.db_table)
+        update_sql = """
+        UPDATE {table} AS s SET
+          name_id = agg.name_id, record_count = agg.record_count, dataset_count = agg.dataset_count,
+          first_observed = agg.first_observed, last_observed = agg.last_observed, stale = false
+        FROM (
+          SELECT r.species_name, MAX(r.name_id) AS name_id, COUNT(*) AS record_count,
+            COUNT(DISTINCT r.dataset_id) AS dataset_count, MIN(r.datetime) AS first_observed,
+            MAX(r.datetime) AS last_observed
+          FROM {record} AS r
+          WHERE r.species_name IN (SELECT species_name FROM {table} WHERE stale)
+          GROUP BY r.species_name
+        ) AS agg
+        WHERE s.species_name = agg.species_name AND s.stale
+        """.format(table=table, record=record_table)
+        delete_sql = """
+        DELETE FROM {table} AS s WHERE s.stale
+        AND NOT EXISTS (SELECT 1 FROM {record} AS r WHERE r.species_name = s.species_name)
+        """.format(table=table, record=record_table)
+        with connection.cursor() as cursor:
+            cursor.execute(update_sql)
+            cursor.execute(delete_sql)
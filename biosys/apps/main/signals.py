@@ -0,0 +1,164 @@
+"""
+Signal receivers that maintain the cached extents of the datasets and projects (see main.utils_extent) and the species
+summary (see main.models.SpeciesSummary) when records and sites are saved or deleted, and that delete the file of the
+deleted dataset exports.
+Note: queryset.update() doesn't send any signal, code that bulk updates geometries or species must maintain the
+extents and the species summary itself.
+The per record maintenance is suspended for the records of a dataset being deleted (and of its project) or changed in
+bulk (see bulk_record_changes and bulk_site_changes): the extents and the species are flagged as stale once instead.
+"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from main.models import Dataset, DatasetExport, Project, Record, Site, SpeciesSummary
+from main.utils_extent import expand_extent, shrink_extent, replace_extent_geometry
+
+# the ids of the datasets and projects whose per record/site maintenance is suspended, per thread.
+_suspended = threading.local()
+
+
+def _suspended_ids(name):
+    if not hasattr(_suspended, name):
+        setattr(_suspended, name, set())
+    return getattr(_suspended, name)
+
+
+def _mark_dataset_stale(dataset_id):
+    """
+    Flag the extents of the dataset and its project and the species of the dataset records as stale.
+    """
+    datasets = Dataset.objects.filter(pk=dataset_id)
+    datasets.update(extent_stale=True)
+    Project.objects.filter(pk__in=datasets.values('project_id')).update(extent_stale=True)
+    SpeciesSummary.mark_stale(
+        Record.objects.filter(dataset=dataset_id).order_by().values_list('species_name', flat=True).distinct()
+    )
+
+
+@contextmanager
+def bulk_record_changes(dataset):
+    """
+    Suspend the per record maintenance of the extents and species summary for the records of the dataset saved or
+    deleted in the block, e.g. a records upload. The extents and species of the dataset are flagged as stale before
+    and after the block.
+    """
+    datasets = _suspended_ids('datasets')
+    if dataset.pk in datasets:
+        # nested
+        yield
+        return
+    _mark_dataset_stale(dataset.pk)
+    datasets.add(dataset.pk)
+    try:
+        yield
+    finally:
+        datasets.discard(dataset.pk)
+        _mark_dataset_stale(dataset.pk)
+
+
+@contextmanager
+def bulk_site_changes(project):
+    """
+    Suspend the per site maintenance of the project extent for the sites of the project deleted in the block, e.g. a
+    bulk sites delete. The project extent is flagged as stale after the block.
+    """
+    projects = _suspended_ids('projects')
+    if project.pk in projects:
+        # nested
+        yield
+        return
+    projects.add(project.pk)
+    try:
+        yield
+    finally:
+        projects.discard(project.pk)
+        Project.objects.filter(pk=project.pk).update(extent_stale=True)
+
+
+def _update_extents(querysets, instance, created):
+    for queryset in querysets:
+        if created:
+            expand_extent(queryset, instance.geometry)
+        else:
+            replace_extent_geometry(queryset, instance.loaded_geometry, instance.geometry)
+    instance._loaded_geometry = instance.geometry
+
+
+def _record_extent_querysets(record):
+    datasets = Dataset.objects.filter(pk=record.dataset_id)
+    projects = Project.objects.filter(pk__in=datasets.values('project_id'))
+    return [datasets, projects]
+
+
+@receiver(post_save, sender=Record)
+def record_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.dataset_id in _suspended_ids('datasets'):
+        instance._loaded_geometry = instance.geometry
+    else:
+        _update_extents(_record_extent_querysets(instance), instance, created)
+        SpeciesSummary.mark_stale([instance.species_name, instance.loaded_species_name])
+    instance._loaded_species_name = instance.species_name
+
+
+@receiver(post_delete, sender=Record)
+def record_deleted(sender, instance, **kwargs):
+    if instance.dataset_id in _suspended_ids('datasets'):
+        return
+    for queryset in _record_extent_querysets(instance):
+        shrink_extent(queryset, instance.geometry)
+    SpeciesSummary.mark_stale([instance.species_name])
+
+
+@receiver(post_save, sender=Site)
+def site_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        _update_extents([Project.objects.filter(pk=instance.project_id)], instance, created)
+
+
+@receiver(post_delete, sender=Site)
+def site_deleted(sender, instance, **kwargs):
+    if instance.project_id not in _suspended_ids('projects'):
+        shrink_extent(Project.objects.filter(pk=instance.project_id), instance.geometry)
+
+
+@receiver(pre_delete, sender=Dataset)
+def dataset_deleting(sender, instance, **kwargs):
+    # the records are deleted (with a signal each) before the dataset, see django.db.models.deletion.Collector
+    _mark_dataset_stale(instance.pk)
+    _suspended_ids('datasets').add(instance.pk)
+
+
+@receiver(post_delete, sender=Dataset)
+def dataset_deleted(sender, instance, **kwargs):
+    _suspended_ids('datasets').discard(instance.pk)
+
+
+@receiver(pre_delete, sender=Project)
+def project_deleting(sender, instance, **kwargs):
+    # the datasets of the project receive their own pre_delete signal
+    _suspended_ids('projects').add(instance.pk)
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    _suspended_ids('projects').discard(instance.pk)
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, raw=False, **kwargs):
+    # a new project extent is stale by default
+    if not raw and not created:
+        _update_extents([Project.objects.filter(pk=instance.pk)], instance, created)
+
+
+@receiver(post_delete, sender=DatasetExport)
+def dataset_export_deleted(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
@@ -0,0 +1,120 @@
+import shutil
+import tempfile
+
+from django.test import override_settings
+from django.utils import six
+from django.urls import reverse
+from openpyxl import load_workbook
+from rest_framework import status
+
+from main.jobs import run_job
+from main.models import DatasetExport, Job
+from main.tests.api import helpers
+
+
+class TestDatasetExport(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestDatasetExport, self).setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Chubby Bat', '2018-08-23', -17.962075, 122.234554]
+        ])
+        self.url = reverse('api:dataset-export', kwargs={'pk': self.ds.pk})
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def generate(self, resp):
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        job = run_job(Job.objects.get(pk=resp.json()['id']))
+        self.assertEqual(job.status, Job.STATUS_SUCCESS)
+        return job
+
+    def test_csv_generated_then_served(self):
+        client = self.custodian_1_client
+        job = self.generate(client.get(self.url, {'output': 'csv'}))
+        self.assertEqual(job.type, Job.TYPE_DATASET_EXPORT)
+
+        resp = client.get(self.url, {'output': 'csv'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get('content-type'), 'text/csv')
+        content = resp.getvalue().decode('utf-8')
+        self.assertIn('Canis lupus', content)
+        self.assertIn('Chubby Bat', content)
+        # served again without a new job
+        client.get(self.url, {'output': 'csv'})
+        self.assertEqual(Job.objects.filter(type=Job.TYPE_DATASET_EXPORT).count(), 1)
+
+    def test_regenerated_when_records_change(self):
+        client = self.custodian_1_client
+        self.generate(client.get(self.url, {'output': 'csv'}))
+        record = self.ds.record_queryset.first()
+        record.data['What'] = 'Updated'
+        record.save()
+        resp = client.get(self.url, {'output': 'csv'})
+        self.generate(resp)
+        resp = client.get(self.url, {'output': 'csv'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn('Updated', resp.getvalue().decode('utf-8'))
+
+    def test_pending_job_not_duplicated(self):
+        client = self.custodian_1_client
+        first = client.get(self.url, {'output': 'geojson'})
+        second = client.get(self.url, {'output': 'geojson'})
+        self.assertEqual(first.json()['id'], second.json()['id'])
+
+    def test_key_includes_filters_and_format(self):
+        client = self.custodian_1_client
+        self.generate(client.get(self.url, {'output': 'xlsx'}))
+        self.generate(client.get(self.url, {'output': 'xlsx', 'data__contains': '{"What": "Chubby Bat"}'}))
+        self.assertEqual(DatasetExport.objects.filter(dataset=self.ds).count(), 2)
+
+        resp = client.get(self.url, {'output': 'xlsx', 'data__contains': '{"What": "Chubby Bat"}'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        wb = load_workbook(six.BytesIO(resp.getvalue()))
+        ws = wb.worksheets[0]
+        # headers + 1 record
+        self.assertEqual(ws.max_row, 2)
+
+    def test_pruned(self):
+        client = self.custodian_1_client
+        self.generate(client.get(self.url, {'output': 'csv'}))
+        old_export = DatasetExport.objects.get(dataset=self.ds)
+        storage, name = old_export.file.storage, old_export.file.name
+        record = self.ds.record_queryset.first()
+        record.save()
+        # a new export of the new version of the records: the previous version is deleted
+        self.generate(client.get(self.url, {'output': 'geojson'}))
+        self.assertEqual(list(DatasetExport.objects.filter(dataset=self.ds).values_list('format', flat=True)),
+                         ['geojson'])
+        self.assertFalse(storage.exists(name))
+
+        with override_settings(DATASET_EXPORT_MAX_COUNT=2):
+            self.generate(client.get(self.url, {'output': 'csv'}))
+            self.generate(client.get(self.url, {'output': 'xlsx'}))
+        self.assertEqual(
+            sorted(DatasetExport.objects.filter(dataset=self.ds).values_list('format', flat=True)),
+            ['csv', 'xlsx']
+        )
+
+    def test_bad_params(self):
+        client = self.custodian_1_client
+        resp = client.get(self.url, {'output': 'pdf'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = client.get(self.url, {'datetime__gt': 'not a date'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_file_deleted_with_export(self):
+        client = self.custodian_1_client
+        self.generate(client.get(self.url))
+        export = DatasetExport.objects.get(dataset=self.ds)
+        storage, name = export.file.storage, export.file.name
+        self.assertTrue(storage.exists(name))
+        export.delete()
+        self.assertFalse(storage.exists(name))
@@ -0,0 +1,122 @@
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from main.models import Dataset, Project, Site
+from main.signals import bulk_record_changes
+from main.tests import factories
+from main.tests.api import helpers
+
+
+class TestExtents(helpers.BaseUserTestCase):
+    """
+    Test that the dataset and project extents are cached and maintained on record and site changes.
+    """
+
+    def setUp(self):
+        super(TestExtents, self).setUp()
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Chubby Bat', '2018-08-23', -17.962075, 122.234554]
+        ])
+
+    def assertExtentEqual(self, extent, expected):
+        # the stored bounding boxes can be rounded outward by PostGIS
+        self.assertIsNotNone(extent)
+        self.assertEqual([round(v, 4) for v in extent], [round(v, 4) for v in expected])
+
+    def test_dataset_extent(self):
+        ds = Dataset.objects.get(pk=self.ds.pk)
+        self.assertExtentEqual(ds.extent, (115.75, -32.0, 122.234554, -17.962075))
+        ds.refresh_from_db()
+        self.assertFalse(ds.extent_stale)
+
+    def test_expand_on_insert(self):
+        # compute the extent
+        self.assertIsNotNone(Dataset.objects.get(pk=self.ds.pk).extent)
+        record = self.ds.record_queryset.first()
+        record.pk = None
+        record.geometry = Point(130.0, -12.0)
+        record.save()
+        ds = Dataset.objects.get(pk=self.ds.pk)
+        # no need to recompute
+        self.assertFalse(ds.extent_stale)
+        self.assertExtentEqual(ds.extent, (115.75, -32.0, 130.0, -12.0))
+
+    def test_recomputed_after_delete(self):
+        self.assertIsNotNone(Dataset.objects.get(pk=self.ds.pk).extent)
+        self.ds.record_queryset.filter(geometry=Point(122.234554, -17.962075)).delete()
+        ds = Dataset.objects.get(pk=self.ds.pk)
+        self.assertTrue(ds.extent_stale)
+        self.assertExtentEqual(ds.extent, (115.75, -32.0, 115.75, -32.0))
+
+    def test_project_extent_includes_sites_and_records(self):
+        project = Project.objects.get(pk=self.project_1.pk)
+        self.assertExtentEqual(project.extent, (115.75, -32.0, 122.234554, -17.962075))
+        factories.SiteFactory.create(project=self.project_1, geometry=Point(110.0, -35.0))
+        project = Project.objects.get(pk=self.project_1.pk)
+        self.assertFalse(project.extent_stale)
+        self.assertExtentEqual(project.extent, (110.0, -35.0, 122.234554, -17.962075))
+
+    def test_dataset_list_reads_stored_extent(self):
+        client = self.custodian_1_client
+        resp = client.get(reverse('api:dataset-list'), {'project': self.project_1.pk})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.json()
+        self.assertEqual(len(data), 1)
+        self.assertExtentEqual(data[0]['extent'], (115.75, -32.0, 122.234554, -17.962075))
+        self.assertNotIn('cached_extent', data[0])
+
+    def test_dataset_delete(self):
+        self.assertIsNotNone(Project.objects.get(pk=self.project_1.pk).extent)
+        # the records of the dataset are not maintained one by one, the project extent is flagged as stale once
+        self.ds.delete()
+        project = Project.objects.get(pk=self.project_1.pk)
+        self.assertTrue(project.extent_stale)
+        self.assertIsNone(project.extent)
+
+    def test_bulk_record_changes(self):
+        self.assertIsNotNone(Dataset.objects.get(pk=self.ds.pk).extent)
+        with bulk_record_changes(self.ds):
+            record = self.ds.record_queryset.first()
+            record.pk = None
+            record.geometry = Point(130.0, -12.0)
+            record.save()
+            self.ds.record_queryset.filter(geometry=Point(122.234554, -17.962075)).delete()
+        ds = Dataset.objects.get(pk=self.ds.pk)
+        self.assertTrue(ds.extent_stale)
+        self.assertExtentEqual(ds.extent, (115.75, -32.0, 130.0, -12.0))
+        self.assertTrue(Project.objects.get(pk=self.project_1.pk).extent_stale)
+
+    def _delete_all_query_count(self, url):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.custodian_1_client.delete(url, data='all', format='json')
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        return len(context.captured_queries)
+
+    def test_delete_all_records(self):
+        # the records are not maintained one by one: the number of queries doesn't grow with the number of records
+        rows = [['What', 'When', 'Latitude', 'Longitude']]
+        rows += [['Canis lupus', '2018-06-22', -32 + i * 0.1, 115.75] for i in range(10)]
+        big_ds = self._create_dataset_and_records_from_rows(rows)
+        self.assertEqual(big_ds.record_queryset.count(), 10)
+        small_count = self._delete_all_query_count(reverse('api:dataset-records', kwargs={'pk': self.ds.pk}))
+        big_count = self._delete_all_query_count(reverse('api:dataset-records', kwargs={'pk': big_ds.pk}))
+        self.assertEqual(big_count, small_count)
+        self.assertEqual(big_ds.record_queryset.count(), 0)
+        self.assertTrue(Dataset.objects.get(pk=big_ds.pk).extent_stale)
+        self.assertTrue(Project.objects.get(pk=self.project_1.pk).extent_stale)
+
+    def test_delete_all_sites(self):
+        url = reverse('api:project-sites', kwargs={'pk': self.project_1.pk})
+        factories.SiteFactory.create_batch(2, project=self.project_1)
+        small_count = self._delete_all_query_count(url)
+        factories.SiteFactory.create_batch(10, project=self.project_1)
+        self.assertIsNotNone(Project.objects.get(pk=self.project_1.pk).extent)
+        big_count = self._delete_all_query_count(url)
+        self.assertEqual(big_count, small_count)
+        self.assertFalse(Site.objects.filter(project=self.project_1).exists())
+        self.assertTrue(Project.objects.get(pk=self.project_1.pk).extent_stale)
@@ -5,6 +5,7 @@ from django.contrib.gis.geos import Polygon, Point, MultiPolygon
 from rest_framework import status
 
 from main.models import Record, Dataset
+from main.tests import factories
 from main.tests.api import helpers
 
 
@@ -728,3 +729,90 @@ class TestSpatialFiltering(helpers.BaseUserTestCase):
             sorted([r['data'].get('Where') for r in records]),
             sorted([r[4] for r in expected_records])
         )
+
+
+class TestBBoxFiltering(helpers.BaseUserTestCase):
+    """
+    Test the in_bbox=minx,miny,maxx,maxy filter on records and sites.
+    """
+
+    def setUp(self):
+        super(TestBBoxFiltering, self).setUp()
+        self.perth_metro_ds = self._create_dataset_and_records_from_rows([
+            ['Species Name', 'When', 'Latitude', 'Longitude', 'Where'],
+            ['Canis lupus', '2018-06-22', -32, 115.75, 'Cottesloe'],
+            ['Quokka', '2018-04-01', -32.011935, 115.517554, 'Rottnest Island'],
+            ['Eucalyptus robusta', '2017-11-23', -31.959765, 115.8322754, 'Kings Park'],
+            ['Chubby Bat', '2018-08-23', -32.531197, 115.725752, 'Mandurah']
+        ])
+        # perth without Mandurah
+        self.bbox = '115.0,-32.1,116.0,-31.5'
+
+    def test_records(self):
+        url = reverse('api:record-list')
+        client = self.custodian_1_client
+        for query in [{'in_bbox': self.bbox}, {'in_bbox': self.bbox, 'in_bbox_exact': 'true'}]:
+            response = client.get(url, query)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(
+                sorted([r['data'].get('Where') for r in response.json()]),
+                ['Cottesloe', 'Kings Park', 'Rottnest Island']
+            )
+
+    def test_records_keyset_pagination(self):
+        url = reverse('api:record-list')
+        client = self.custodian_1_client
+        query = {
+            'in_bbox': self.bbox,
+            'limit': 2
+        }
+        response = client.get(url, query)
+        self.assertEqual(200, response.status_code)
+        first_page = response.json()['results']
+        self.assertEqual(len(first_page), 2)
+
+        query['id__gt'] = first_page[-1]['id']
+        response = client.get(url, query)
+        self.assertEqual(200, response.status_code)
+        second_page = response.json()['results']
+        self.assertEqual(len(second_page), 1)
+        self.assertTrue(second_page[0]['id'] > first_page[-1]['id'])
+
+    def test_sites(self):
+        inside = factories.SiteFactory.create(project=self.project_1, geometry=Point(115.75, -32.0))
+        factories.SiteFactory.create(project=self.project_1, geometry=Point(115.725752, -32.531197))
+        url = reverse('api:site-list')
+        client = self.custodian_1_client
+        response = client.get(url, {'in_bbox': self.bbox})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([s['id'] for s in response.json()], [inside.pk])
+
+    def test_sites_keyset_pagination(self):
+        # the codes are in the reverse order of the ids
+        sites = [
+            factories.SiteFactory.create(project=self.project_1, code=code, geometry=Point(115.75, -32.0))
+            for code in ['C', 'B', 'A']
+        ]
+        url = reverse('api:site-list')
+        client = self.custodian_1_client
+        query = {
+            'in_bbox': self.bbox,
+            'limit': 2,
+            'id__gt': sites[0].pk - 1
+        }
+        response = client.get(url, query)
+        self.assertEqual(200, response.status_code)
+        first_page = response.json()['results']
+        self.assertEqual([s['id'] for s in first_page], [sites[0].pk, sites[1].pk])
+
+        query['id__gt'] = first_page[-1]['id']
+        response = client.get(url, query)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([s['id'] for s in response.json()['results']], [sites[2].pk])
+
+    def test_invalid_bbox(self):
+        client = self.custodian_1_client
+        for url in [reverse('api:record-list'), reverse('api:site-list')]:
+            response = client.get(url, {'in_bbox': '115.0,-32.1,116.0'})
+            self.assertEqual(400, response.status_code)
+            self.assertIn('detail', response.json())
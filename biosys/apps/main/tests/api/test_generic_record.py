@@ -482,7 +482,7 @@ class TestExport(helpers.BaseUserTestCase):
         self.assertEqual(ext, '.xlsx')
         filename.startswith(dataset.name)
         # read content
-        wb = load_workbook(six.BytesIO(resp.content), read_only=True)
+        wb = load_workbook(six.BytesIO(resp.getvalue()), read_only=True)
         # one datasheet named from dataset
         sheet_names = wb.sheetnames
         self.assertEqual(1, len(sheet_names))
@@ -593,7 +593,7 @@ class TestExport(helpers.BaseUserTestCase):
             self.fail("Export should not raise an exception: {}".format(e))
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         # load workbook
-        wb = load_workbook(six.BytesIO(resp.content))
+        wb = load_workbook(six.BytesIO(resp.getvalue()))
         ws = wb[dataset.name]
         rows = list(ws.rows)
         self.assertEqual(len(rows), 2)
@@ -0,0 +1,64 @@
+from django.contrib.gis.geos import Point
+from django.urls import reverse
+from rest_framework import status
+
+from main.jobs import run_job
+from main.models import Job
+from main.tests import factories
+from main.tests.api import helpers
+
+
+class TestAssignNearestSites(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestAssignNearestSites, self).setUp()
+        self.cottesloe = factories.SiteFactory.create(project=self.project_1, geometry=Point(115.75, -32.0))
+        self.kings_park = factories.SiteFactory.create(project=self.project_1, geometry=Point(115.83, -31.96))
+        # a site of another project, closer to every record, must be ignored
+        factories.SiteFactory.create(project=self.project_2, geometry=Point(115.751, -32.0))
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['near cottesloe', '2018-06-22', -32.0005, 115.7505],
+            ['near kings park', '2018-06-22', -31.9601, 115.8301],
+            ['far away', '2018-08-23', -17.962075, 122.234554]
+        ])
+
+    def get_record(self, what):
+        return self.ds.record_queryset.get(data__What=what)
+
+    def test_assign(self):
+        count = self.project_1.assign_nearest_sites(1000, chunk_size=1)
+        self.assertEqual(count, 2)
+        self.assertEqual(self.get_record('near cottesloe').site, self.cottesloe)
+        self.assertEqual(self.get_record('near kings park').site, self.kings_park)
+        self.assertIsNone(self.get_record('far away').site)
+        # the geometry of the records doesn't come from the site
+        self.assertFalse(self.get_record('near cottesloe').geometry_from_site)
+
+    def test_no_overwrite(self):
+        record = self.get_record('near cottesloe')
+        record.site = self.kings_park
+        record.save()
+        self.assertEqual(self.project_1.assign_nearest_sites(1000), 1)
+        self.assertEqual(self.get_record('near cottesloe').site, self.kings_park)
+        self.assertEqual(self.project_1.assign_nearest_sites(1000, overwrite=True), 1)
+        self.assertEqual(self.get_record('near cottesloe').site, self.cottesloe)
+
+    def test_api(self):
+        url = reverse('api:assign-nearest-sites', kwargs={'pk': self.project_1.pk})
+        # anonymous and custodian of another project
+        for client in [self.anonymous_client, self.custodian_2_client]:
+            resp = client.post(url, {'max_distance': 1000}, format='json')
+            self.assertIn(resp.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+        client = self.custodian_1_client
+        for max_distance in ['far', 'nan', 'inf', 0]:
+            resp = client.post(url, {'max_distance': max_distance}, format='json')
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        resp = client.post(url, {'max_distance': 1000, 'datasets': [self.ds.pk]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        job = run_job(Job.objects.get(pk=resp.json()['id']))
+        self.assertEqual(job.status, Job.STATUS_SUCCESS)
+        self.assertEqual(job.result, {'records': 2})
+        self.assertEqual(self.get_record('near kings park').site, self.kings_park)
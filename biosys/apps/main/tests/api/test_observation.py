@@ -10,7 +10,8 @@ from openpyxl import load_workbook
 from rest_framework import status
 
 from main import constants
-from main.models import Site, Dataset, Record
+from main.jobs import run_job
+from main.models import Site, Dataset, Record, Job
 from main.tests import factories
 from main.tests.api import helpers
 from main.tests.test_data_package import clone
@@ -1639,6 +1640,53 @@ class TestGeometryFromSite(helpers.BaseUserTestCase):
             self.assertEqual(record_1.geometry, new_record_geometry)
             self.assertNotEqual(record_1.geometry.geojson, record_1.site.geometry.geojson)
 
+    def test_site_geometry_cascade_in_background_job(self):
+        """
+        Use case: a site with many records has its geometry updated. The cascade to the records is done in a background
+        job that can be polled.
+        """
+        project = self.project_1
+        client = self.custodian_1_client
+        schema = self.schema_with_site_code_fk()
+        dataset = self._create_dataset_with_schema(
+            project, self.data_engineer_1_client, schema, dataset_type=Dataset.TYPE_OBSERVATION
+        )
+        site_geometry = Point(115.76, -32.0)
+        site = factories.SiteFactory(code='Cottesloe', geometry=site_geometry, project=project)
+        csv_data = [
+            ['What', 'When', 'Site Code'],
+            ['what_1', '01/01/2017', 'Cottesloe'],
+            ['what_2', '02/02/2017', 'Cottesloe']
+        ]
+        file_ = helpers.rows_to_xlsx_file(csv_data)
+        url = reverse('api:dataset-upload', kwargs={'pk': dataset.pk})
+        with open(file_, 'rb') as fp:
+            resp = client.post(url, data={'file': fp}, format='multipart')
+            self.assertEqual(status.HTTP_200_OK, resp.status_code)
+        records = Record.objects.filter(dataset=dataset)
+        self.assertEqual(records.filter(geometry_from_site=True).count(), 2)
+
+        new_geometry = Point(117.0, -30.0)
+        url = reverse('api:site-detail', kwargs={'pk': site.pk})
+        with self.settings(SITE_GEOMETRY_CASCADE_MAX_SYNC=1):
+            resp = client.patch(url, data={"geometry": new_geometry.wkt}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        job_data = resp.json().get('geometry_cascade_job')
+        self.assertIsNotNone(job_data)
+        self.assertEqual(job_data['status'], Job.STATUS_PENDING)
+        # not cascaded yet
+        for record in Record.objects.filter(dataset=dataset):
+            self.assertEqual(record.geometry.geojson, site_geometry.geojson)
+
+        # the job is started after the transaction commit, run it here
+        run_job(Job.objects.get(pk=job_data['id']))
+        for record in Record.objects.filter(dataset=dataset):
+            self.assertEqual(record.geometry.geojson, new_geometry.geojson)
+        resp = client.get(reverse('api:job-detail', kwargs={'pk': job_data['id']}))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()['status'], Job.STATUS_SUCCESS)
+        self.assertEqual(resp.json()['result'], {'records': 2})
+
 
 class TestMultipleGeometrySource(helpers.BaseUserTestCase):
 
@@ -1972,7 +2020,7 @@ class TestExport(helpers.BaseUserTestCase):
         self.assertEqual(ext, '.xlsx')
         filename.startswith(dataset.name)
         # read content
-        wb = load_workbook(six.BytesIO(resp.content), read_only=True)
+        wb = load_workbook(six.BytesIO(resp.getvalue()), read_only=True)
         # one datasheet named from dataset
         sheet_names = wb.sheetnames
         self.assertEqual(1, len(sheet_names))
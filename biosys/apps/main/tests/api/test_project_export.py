@@ -0,0 +1,88 @@
+import json
+import zipfile
+
+from django.contrib.gis.geos import Point
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import six
+from rest_framework import status
+
+from main.tests import factories
+from main.tests.api import helpers
+
+# TODO: remove when python3
+if six.PY2:
+    import unicodecsv as csv
+else:
+    import csv
+
+
+class TestProjectExport(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestProjectExport, self).setUp()
+        self.rows = [
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Chubby Bat', '2018-08-23', -17.962075, 122.234554]
+        ]
+        self.ds = self._create_dataset_and_records_from_rows(self.rows)
+        self.site = factories.SiteFactory.create(
+            project=self.project_1,
+            geometry=Point(115.75, -32.0),
+            attributes={'habitat': 'dunes'}
+        )
+        self.url = reverse('api:project-export', kwargs={'pk': self.project_1.pk})
+
+    def read_csv(self, zip_, name):
+        return list(csv.reader(six.StringIO(zip_.read(name).decode('utf-8')), dialect='excel'))
+
+    def test_zip_content(self):
+        resp = self.readonly_client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp.get('content-type'), 'application/zip')
+        zip_ = zipfile.ZipFile(six.BytesIO(resp.getvalue()))
+        self.assertIsNone(zip_.testzip())
+
+        package = json.loads(zip_.read('datapackage.json').decode('utf-8'))
+        self.assertEqual(package['title'], self.project_1.name)
+        resources = dict([(r['name'], r) for r in package['resources']])
+        self.assertEqual(len(resources), 2)
+        self.assertIn('sites', resources)
+        resource = [r for name, r in resources.items() if name != 'sites'][0]
+        self.assertEqual(
+            [f['name'] for f in resource['schema']['fields']],
+            [f['name'] for f in self.ds.resource['schema']['fields']]
+        )
+        self.assertEqual(
+            sorted(zip_.namelist()),
+            sorted(['datapackage.json'] + [r['path'] for r in resources.values()])
+        )
+
+        rows = self.read_csv(zip_, resource['path'])
+        self.assertEqual(rows[0], self.rows[0])
+        self.assertEqual(sorted([row[0] for row in rows[1:]]), ['Canis lupus', 'Chubby Bat'])
+
+        sites = self.read_csv(zip_, 'sites.csv')
+        self.assertEqual(sites[0], ['id', 'code', 'name', 'description', 'geometry', 'attributes'])
+        self.assertEqual(len(sites), 2)
+        self.assertEqual(sites[1][1], self.site.code)
+        self.assertEqual(sites[1][4], 'POINT(115.75 -32)')
+        self.assertEqual(json.loads(sites[1][5]), {'habitat': 'dunes'})
+
+    def test_anonymous(self):
+        resp = self.anonymous_client.get(self.url)
+        self.assertIn(resp.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+    @override_settings(EXPORTER_CLASS='main.api.exporters.BionetExporter')
+    def test_configured_exporter_ignored(self):
+        # the dataset csv files must start with the header of the package schema
+        resp = self.readonly_client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        zip_ = zipfile.ZipFile(six.BytesIO(resp.getvalue()))
+        package = json.loads(zip_.read('datapackage.json').decode('utf-8'))
+        resource = [r for r in package['resources'] if r['name'] != 'sites'][0]
+        rows = self.read_csv(zip_, resource['path'])
+        self.assertEqual(rows[0], [f['name'] for f in resource['schema']['fields']])
+        self.assertEqual(len(rows), 3)
@@ -0,0 +1,74 @@
+from django.urls import reverse
+from django.utils import six
+from rest_framework import status
+
+from main.tests.api import helpers
+
+
+class TestRecordDensity(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestRecordDensity, self).setUp()
+        self.perth_metro_ds = self._create_dataset_and_records_from_rows([
+            ['Species Name', 'When', 'Latitude', 'Longitude', 'Where'],
+            ['Canis lupus', '2018-06-22', -32, 115.75, 'Cottesloe'],
+            ['Quokka', '2018-04-01', -32.011935, 115.517554, 'Rottnest Island'],
+            ['Eucalyptus robusta', '2017-11-23', -31.959765, 115.8322754, 'Kings Park'],
+        ])
+        self.wa_north_ds = self._create_dataset_and_records_from_rows([
+            ['Species Name', 'When', 'Latitude', 'Longitude', 'Where'],
+            ['Canis lupus', '2018-06-22', -24.882248, 113.662995, 'Carnavon'],
+            ['Chubby Bat', '2018-08-23', -17.962075, 122.234554, 'Broome']
+        ])
+        self.url = reverse('api:record-density')
+
+    def test_grid_low_zoom(self):
+        """
+        At zoom 0 a cell is 45 degrees: all the records fall in one or two cells.
+        """
+        client = self.custodian_1_client
+        resp = client.get(self.url, {'zoom': 0})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.json()
+        self.assertEqual(data['cell'], 'grid')
+        self.assertEqual(data['cell_size'], 45.0)
+        self.assertEqual(sum([c['count'] for c in data['cells']]), 5)
+
+    def test_grid_with_bbox_and_dataset_filter(self):
+        client = self.custodian_1_client
+        query = {
+            'zoom': 10,
+            'bbox': '115.0,-32.1,116.0,-31.5',
+            'dataset__id': self.perth_metro_ds.pk
+        }
+        resp = client.get(self.url, query)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        cells = resp.json()['cells']
+        # every record in its own cell at zoom 10
+        self.assertEqual(len(cells), 3)
+        self.assertEqual(sorted([c['count'] for c in cells]), [1, 1, 1])
+
+        # the bbox excludes the north records
+        query['dataset__id'] = self.wa_north_ds.pk
+        resp = client.get(self.url, query)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()['cells'], [])
+
+    def test_geohash(self):
+        client = self.custodian_1_client
+        resp = client.get(self.url, {'zoom': 2, 'cell': 'geohash'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        cells = resp.json()['cells']
+        self.assertEqual(sum([c['count'] for c in cells]), 5)
+        for cell in cells:
+            self.assertIsInstance(cell['cell'], six.string_types)
+
+    def test_bad_params(self):
+        client = self.custodian_1_client
+        resp = client.get(self.url, {'bbox': '115,-32,116'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = client.get(self.url, {'cell': 'hexagon'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        for zoom in [-1, 23, 2000]:
+            resp = client.get(self.url, {'zoom': zoom})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
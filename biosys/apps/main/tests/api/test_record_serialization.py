@@ -1,13 +1,17 @@
+import json
 import re
 from os import path
 
-from django.test import override_settings
+from django.test import TestCase, override_settings
 from openpyxl import load_workbook
 
 from django.shortcuts import reverse
 from django.utils import six
+from django.utils.text import slugify
 from rest_framework import status
 
+from main.api.exporters import column_caster
+from main.tests import factories
 from main.tests.api import helpers
 # TODO: remove when python3
 if six.PY2:
@@ -182,7 +186,10 @@ class TestExcelFormat(helpers.BaseUserTestCase):
         filename, ext = path.splitext(match.group(1))
         self.assertEqual(ext, '.xlsx')
         # read content
-        wb = load_workbook(six.BytesIO(resp.content), read_only=True)
+        self.assertTrue(resp.streaming)
+        content = resp.getvalue()
+        self.assertEqual(int(resp.get('content-length')), len(content))
+        wb = load_workbook(six.BytesIO(content), read_only=True)
         # one datasheet named after the dataset
         expected_sheet_name = dataset.name
         sheet_names = wb.sheetnames
@@ -220,6 +227,7 @@ class TestCSVFormat(helpers.BaseUserTestCase):
         }
         resp = client.get(url, query_params)
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.streaming)
         self.assertEqual(resp.get('content-type'),
                          'text/csv')
         content_disposition = resp.get('content-disposition')
@@ -230,9 +238,377 @@ class TestCSVFormat(helpers.BaseUserTestCase):
         filename, ext = path.splitext(match.group(1))
         self.assertEqual(ext, '.csv')
         # read content
-        reader = csv.reader(six.StringIO(resp.content.decode('utf-8')), dialect='excel')
+        reader = csv.reader(six.StringIO(resp.getvalue().decode('utf-8')), dialect='excel')
         for expected_row, actual_row in zip(expected_rows, reader):
             expected_row_string = [str(v) for v in expected_row]
             self.assertEqual(actual_row, expected_row_string)
 
+    @override_settings(EXPORTER_CLASS='main.api.exporters.BionetExporter')
+    def test_bionet(self):
+        rows = [
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['a big bird in Cottesloe', '20018-01-24', -32, 115.75],
+        ]
+        dataset = self._create_dataset_and_records_from_rows(rows)
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {'dataset__id': dataset.pk, 'output': 'csv'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        reader = csv.reader(six.StringIO(resp.getvalue().decode('utf-8')), dialect='excel')
+        actual_rows = list(reader)
+        self.assertEqual(actual_rows[:2], [['Bionet Ignored Line'], ['Bionet Ignored Line']])
+        self.assertEqual(actual_rows[2:], [[str(v) for v in row] for row in rows])
+
+
+class TestColumnCaster(TestCase):
+
+    def test_memo(self):
+        calls = []
+
+        def cast(field, value):
+            calls.append(value)
+            return int(value)
+
+        caster = column_caster(None, cast)
+        self.assertEqual([caster(v) for v in ['1', '2', '1', '1', '2']], [1, 2, 1, 1, 2])
+        self.assertEqual(calls, ['1', '2'])
+        # the type is part of the key
+        caster(1)
+        self.assertEqual(calls, ['1', '2', 1])
+        # unhashable values are not memoised
+        caster = column_caster(None, lambda field, value: len(value))
+        self.assertEqual(caster([1, 2]), 2)
+
+    def test_memo_size(self):
+        calls = []
+
+        def cast(field, value):
+            calls.append(value)
+            return value
+
+        caster = column_caster(None, cast, memo_size=1)
+        for value in ['a', 'b', 'a', 'b']:
+            caster(value)
+        self.assertEqual(calls, ['a', 'b', 'b'])
+
+
+class TestGeoJSONFormat(helpers.BaseUserTestCase):
+
+    def test_happy_path(self):
+        rows = [
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['a big bird in Cottesloe', '2018-01-24', -32, 115.75],
+            ['a chubby bat somewhere', '2017-12-24', -33.6, 116.678],
+        ]
+        dataset = self._create_dataset_and_records_from_rows(rows)
+        client = self.custodian_1_client
+        url = reverse('api:record-list')
+        query_params = {
+            'dataset__id': dataset.pk,
+            'output': 'geojson'
+        }
+        resp = client.get(url, query_params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp.get('content-type'), 'application/geo+json')
+        match = re.match('attachment; filename=(.+)', resp.get('content-disposition'))
+        self.assertIsNotNone(match)
+        self.assertEqual(path.splitext(match.group(1))[1], '.geojson')
+
+        collection = json.loads(resp.getvalue().decode('utf-8'))
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        features = collection['features']
+        self.assertEqual(len(features), 2)
+        expected_ids = sorted(dataset.record_queryset.values_list('id', flat=True))
+        self.assertEqual(sorted([f['id'] for f in features]), expected_ids)
+        feature = [f for f in features if f['properties']['What'] == 'a big bird in Cottesloe'][0]
+        self.assertEqual(feature['type'], 'Feature')
+        self.assertEqual(feature['geometry'], {'type': 'Point', 'coordinates': [115.75, -32]})
+
+    def test_empty(self):
+        dataset = self._create_dataset_from_rows([
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['a big bird in Cottesloe', '2018-01-24', -32, 115.75],
+        ])
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {'dataset__id': dataset.pk, 'output': 'geojson'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(resp.getvalue().decode('utf-8')), {'type': 'FeatureCollection', 'features': []})
+
+
+class TestColumnarFormats(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestColumnarFormats, self).setUp()
+        self.rows = [
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['a big bird in Cottesloe', '2018-01-24', -32, 115.75],
+            ['a chubby bat somewhere', '2017-12-24', -33.6, 116.678],
+        ]
+        self.dataset = self._create_dataset_and_records_from_rows(self.rows)
+
+    def get_table(self, output, extension):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {
+            'dataset__id': self.dataset.pk,
+            'output': output
+        })
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        match = re.match('attachment; filename=(.+)', resp.get('content-disposition'))
+        self.assertEqual(path.splitext(match.group(1))[1], extension)
+        content = resp.getvalue()
+        self.assertEqual(int(resp.get('content-length')), len(content))
+        if output == 'parquet':
+            return pq.read_table(pa.BufferReader(content))
+        return pa.RecordBatchStreamReader(pa.BufferReader(content)).read_all()
+
+    def assert_table(self, table):
+        from django.contrib.gis.geos import GEOSGeometry
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(
+            table.schema.names,
+            ['What', 'When', 'Latitude', 'Longitude', 'datetime', 'species_name', 'name_id', 'geometry']
+        )
+        self.assertEqual(str(table.schema.field_by_name('Latitude').type), 'double')
+        rows = table.to_pydict()
+        index = rows['What'].index('a big bird in Cottesloe')
+        self.assertEqual(rows['Latitude'][index], -32)
+        self.assertEqual(GEOSGeometry(six.memoryview(rows['geometry'][index])).coords, (115.75, -32.0))
+
+    def test_parquet(self):
+        self.assert_table(self.get_table('parquet', '.parquet'))
+
+    def test_arrow(self):
+        self.assert_table(self.get_table('arrow', '.arrows'))
+
+
+class TestGeoPackageFormat(helpers.BaseUserTestCase):
+
+    def test_happy_path(self):
+        import sqlite3
+        import tempfile
+
+        rows = [
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['a big bird in Cottesloe', '2018-01-24', -32, 115.75],
+            ['a chubby bat somewhere', '2017-12-24', -33.6, 116.678],
+        ]
+        dataset = self._create_dataset_and_records_from_rows(rows)
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {'dataset__id': dataset.pk, 'output': 'gpkg'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get('content-type'), 'application/geopackage+sqlite3')
+        match = re.match('attachment; filename=(.+)', resp.get('content-disposition'))
+        self.assertEqual(path.splitext(match.group(1))[1], '.gpkg')
+
+        with tempfile.NamedTemporaryFile(suffix='.gpkg') as f:
+            f.write(resp.getvalue())
+            f.flush()
+            db = sqlite3.connect(f.name)
+            try:
+                self.assertEqual(db.execute('PRAGMA application_id').fetchone()[0], 0x47504B47)
+                table_name, data_type, srs_id = db.execute(
+                    'SELECT table_name, data_type, srs_id FROM gpkg_contents').fetchone()
+                self.assertEqual(data_type, 'features')
+                self.assertEqual(srs_id, 4326)
+                features = db.execute(
+                    'SELECT fid, "What", "Latitude", geom FROM "{}" ORDER BY fid'.format(table_name)).fetchall()
+                self.assertEqual(len(features), 2)
+                self.assertEqual(
+                    sorted([fid for fid, what, latitude, geom in features]),
+                    sorted(dataset.record_queryset.values_list('id', flat=True))
+                )
+                fid, what, latitude, geom = [f for f in features if f[1] == 'a big bird in Cottesloe'][0]
+                self.assertEqual(latitude, -32)
+                self.assertEqual(bytes(geom[:2]), b'GP')
+                # spatial index
+                envelope = db.execute(
+                    'SELECT minx, miny FROM "rtree_{}_geom" WHERE id = ?'.format(table_name), [fid]).fetchone()
+                self.assertEqual(envelope, (115.75, -32.0))
+            finally:
+                db.close()
+
+    def test_reserved_and_duplicate_names(self):
+        import sqlite3
+        import tempfile
+
+        rows = [
+            ['What', 'WHAT', 'fid', 'When', 'Latitude', 'Longitude'],
+            ['a big bird', 'a small bird', 'F1', '2018-01-24', -32, 115.75],
+        ]
+        dataset = self._create_dataset_and_records_from_rows(rows)
+        dataset.name = 'gpkg_contents'
+        dataset.save()
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {'dataset__id': dataset.pk, 'output': 'gpkg'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        with tempfile.NamedTemporaryFile(suffix='.gpkg') as f:
+            f.write(resp.getvalue())
+            f.flush()
+            db = sqlite3.connect(f.name)
+            try:
+                table_name = db.execute('SELECT table_name FROM gpkg_contents').fetchone()[0]
+                self.assertEqual(table_name, 'records_gpkg_contents')
+                row = db.execute(
+                    'SELECT "What", "field_WHAT", "field_fid" FROM "{}"'.format(table_name)).fetchone()
+                self.assertEqual(row, ('a big bird', 'a small bird', 'F1'))
+            finally:
+                db.close()
+
+
+class TestBundleFormat(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        import tempfile
+
+        super(TestBundleFormat, self).setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        import shutil
+
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super(TestBundleFormat, self).tearDown()
+
+    def test_happy_path(self):
+        import zipfile
+
+        rows = [
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['a big bird in Cottesloe', '2018-01-24', -32, 115.75],
+            ['a chubby bat somewhere', '2017-12-24', -33.6, 116.678],
+        ]
+        dataset = self._create_dataset_and_records_from_rows(rows)
+        bird = dataset.record_queryset.get(data__What='a big bird in Cottesloe')
+        bat = dataset.record_queryset.get(data__What='a chubby bat somewhere')
+        bird_media = [factories.MediaFactory.create(record=bird) for _ in range(3)]
+        factories.MediaFactory.create(record=bat)
+        dataset_media = factories.DatasetMediaFactory.create(dataset=dataset)
+        project_media = factories.ProjectMediaFactory.create(project=dataset.project)
+        # media of another project
+        factories.ProjectMediaFactory.create(project=self.project_2)
+
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {
+            'dataset__id': dataset.pk,
+            'id': bird.pk,
+            'output': 'bundle'
+        })
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp.get('content-type'), 'application/zip')
+        match = re.match('attachment; filename=(.+)', resp.get('content-disposition'))
+        self.assertEqual(path.splitext(match.group(1))[1], '.zip')
+
+        zip_ = zipfile.ZipFile(six.BytesIO(resp.getvalue()))
+        self.assertIsNone(zip_.testzip())
+        names = zip_.namelist()
+        expected_media = ['media/records/{}/{}_{}'.format(bird.pk, m.pk, m.filename) for m in bird_media] + [
+            'media/dataset/{}_{}'.format(dataset_media.pk, dataset_media.filename),
+            'media/project/{}_{}'.format(project_media.pk, project_media.filename),
+        ]
+        self.assertEqual(names[1:], expected_media)
+
+        # the records csv file (filtered)
+        self.assertTrue(names[0].endswith('.csv'))
+        reader = csv.reader(six.StringIO(zip_.read(names[0]).decode('utf-8')), dialect='excel')
+        csv_rows = list(reader)
+        self.assertEqual(csv_rows[0], rows[0])
+        self.assertEqual(len(csv_rows), 2)
+        self.assertEqual(csv_rows[1][0], 'a big bird in Cottesloe')
+
+        # the media files are stored as is
+        for media in bird_media:
+            info = zip_.getinfo('media/records/{}/{}_{}'.format(bird.pk, media.pk, media.filename))
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            with open(media.path, 'rb') as f:
+                self.assertEqual(zip_.read(info), f.read())
+
+    def test_missing_file_aborts(self):
+        dataset = self._create_dataset_and_records_from_rows([
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['a big bird in Cottesloe', '2018-01-24', -32, 115.75],
+        ])
+        media = factories.MediaFactory.create(record=dataset.record_queryset.first())
+        media.file.storage.delete(media.file.name)
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {
+            'dataset__id': dataset.pk,
+            'output': 'bundle'
+        })
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        with self.assertRaises((IOError, OSError)):
+            resp.getvalue()
+
+
+class TestJoinedFormat(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestJoinedFormat, self).setUp()
+        self.parent_dataset = self._create_dataset_and_records_from_rows([
+            ['Survey ID', 'Where', 'When'],
+            ['ID-001', 'King\'s Park', '2018-07-15'],
+            ['ID-002', 'Cottesloe', '2018-07-11'],
+        ])
+        schema = helpers.create_schema_from_fields([
+            {
+                'name': 'Survey ID',
+                'type': 'string',
+                'constraints': helpers.REQUIRED_CONSTRAINTS
+            },
+            {
+                'name': 'What',
+                'type': 'string',
+                'constraints': helpers.NOT_REQUIRED_CONSTRAINTS
+            },
+        ])
+        schema['foreignKeys'] = [{
+            'fields': 'Survey ID',
+            'reference': {
+                'fields': 'Survey ID',
+                'resource': self.parent_dataset.name
+            }
+        }]
+        self.child_dataset = self._create_dataset_with_schema(self.project_1, self.data_engineer_1_client, schema)
+        self._upload_records_from_rows([
+            ['Survey ID', 'What'],
+            ['ID-001', 'Canis lupus'],
+            ['ID-001', 'A frog'],
+            ['ID-003', 'An orphan'],
+        ], self.child_dataset.pk, strict=False)
+
+    def get_rows(self, params):
+        resp = self.custodian_1_client.get(reverse('api:record-list'), dict(params, output='joined'))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get('content-type'), 'text/csv')
+        return list(csv.reader(six.StringIO(resp.getvalue().decode('utf-8')), dialect='excel'))
+
+    def test_happy_path(self):
+        rows = self.get_rows({'dataset__id': self.child_dataset.pk})
+        parent_prefix = slugify(self.parent_dataset.name)
+        child_prefix = slugify(self.child_dataset.name)
+        self.assertEqual(rows[0], [
+            parent_prefix + '.Survey ID',
+            parent_prefix + '.Where',
+            parent_prefix + '.When',
+            child_prefix + '.Survey ID',
+            child_prefix + '.What',
+        ])
+        # in the record order
+        self.assertEqual(rows[1:], [
+            ['ID-001', 'King\'s Park', '2018-07-15', 'ID-001', 'Canis lupus'],
+            ['ID-001', 'King\'s Park', '2018-07-15', 'ID-001', 'A frog'],
+            ['', '', '', 'ID-003', 'An orphan'],
+        ])
+
+    def test_filtered(self):
+        record = self.child_dataset.record_queryset.get(data__What='A frog')
+        rows = self.get_rows({'dataset__id': self.child_dataset.pk, 'id': record.pk})
+        self.assertEqual(rows[1:], [['ID-001', 'King\'s Park', '2018-07-15', 'ID-001', 'A frog']])
 
+    def test_no_parent_dataset(self):
+        resp = self.custodian_1_client.get(reverse('api:record-list'), {
+            'dataset__id': self.parent_dataset.pk,
+            'output': 'joined'
+        })
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
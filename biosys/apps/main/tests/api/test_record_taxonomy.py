@@ -0,0 +1,58 @@
+from django.urls import reverse
+from rest_framework import status
+
+from main.models import Species
+from main.tests.api import helpers
+
+
+class TestRecordTaxonomy(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestRecordTaxonomy, self).setUp()
+        Species.objects.bulk_create([
+            Species(name_id=100, species_name='Canidae', rank_name='Family'),
+            Species(name_id=25454, species_name='Canis lupus', genus='Canis', family_nid=100, rank_name='Species'),
+            Species(name_id=30883, species_name='Canis lupus subsp. familiaris', genus='Canis', family_nid=100,
+                    rank_name='Subspecies'),
+            Species(name_id=24204, species_name='Vespadelus douglasorum', genus='Vespadelus', family_nid=200,
+                    rank_name='Species'),
+        ])
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['Species Name', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Canis lupus subsp. familiaris', '2018-06-23', -32, 115.75],
+            ['Vespadelus douglasorum', '2018-08-23', -17.962075, 122.234554],
+            ['Unknown', '2018-08-23', -17.962075, 122.234554],
+        ])
+        for species in Species.objects.all():
+            self.ds.record_queryset.filter(species_name=species.species_name).update(name_id=species.name_id)
+        self.url = reverse('api:record-taxonomy')
+
+    def test_family(self):
+        resp = self.custodian_1_client.get(self.url, {'dataset__id': self.ds.pk})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.json()
+        self.assertEqual(data['group_by'], 'family')
+        groups = dict((g['family_nid'], g) for g in data['groups'])
+        self.assertEqual(groups[100]['family'], 'Canidae')
+        self.assertEqual(groups[100]['record_count'], 2)
+        self.assertEqual(groups[100]['species_count'], 2)
+        # family not in the species list
+        self.assertIsNone(groups[200]['family'])
+        self.assertEqual(groups[200]['record_count'], 1)
+        # unresolved record
+        self.assertEqual(groups[None]['record_count'], 1)
+        self.assertEqual(groups[None]['species_count'], 0)
+
+    def test_genus_with_filters(self):
+        resp = self.custodian_1_client.get(self.url, {
+            'group_by': 'genus',
+            'dataset__project__program__id': self.project_1.program.pk,
+            'in_bbox': '115,-33,116,-31'
+        })
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()['groups'], [{'genus': 'Canis', 'record_count': 2, 'species_count': 2}])
+
+    def test_unknown_group(self):
+        resp = self.custodian_1_client.get(self.url, {'group_by': 'order'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
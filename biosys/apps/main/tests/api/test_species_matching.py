@@ -0,0 +1,105 @@
+from os import path
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from main.jobs import create_job, run_job
+from main.models import Dataset, Job, Species
+from main.tests.api import helpers
+from main.utils_species import SpeciesIndex
+from main.utils_species_matching import resolve_species_names
+
+SPECIES_FIXTURE_FILE = path.join(path.dirname(path.dirname(__file__)), 'data', 'species.json')
+
+
+@override_settings(SPECIES_CACHE_MAX_AGE=0)
+class TestSpeciesMatching(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestSpeciesMatching, self).setUp()
+        Species.objects.bulk_create([
+            Species(name_id=25454, species_name='Canis lupus'),
+            Species(name_id=24204, species_name='Vespadelus douglasorum'),
+            Species(name_id=17879, species_name='Triodia helmsii'),
+        ])
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['Species Name', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupis', '2018-06-22', -32, 115.75],
+            ['Canis lupis', '2018-06-23', -32, 115.75],
+            ['Vespadelus duglasorum', '2018-08-23', -17.962075, 122.234554],
+        ])
+        self.assertEqual(self.ds.type, Dataset.TYPE_SPECIES_OBSERVATION)
+        self.url = reverse('api:dataset-species-matching', kwargs={'pk': self.ds.pk})
+
+    def test_suggestions(self):
+        resp = self.custodian_1_client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.json()
+        self.assertEqual([(d['species_name'], d['records']) for d in data],
+                         [('Canis lupis', 2), ('Vespadelus duglasorum', 1)])
+        self.assertEqual(data[0]['suggestions'][0]['name_id'], 25454)
+        self.assertEqual(data[1]['suggestions'][0]['species_name'], 'Vespadelus douglasorum')
+        # nothing is similar enough
+        resp = self.custodian_1_client.get(self.url, {'threshold': 1})
+        self.assertEqual([d['suggestions'] for d in resp.json()], [[], []])
+
+    def test_bad_params(self):
+        for params in [{'threshold': 0}, {'threshold': 1.5}, {'threshold': 'nan'}, {'limit': 0}]:
+            resp = self.custodian_1_client.get(self.url, params)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_apply_corrections(self):
+        payload = [{'species_name': 'Canis lupis', 'name_id': 25454}]
+        # not a custodian of the project
+        resp = self.custodian_2_client.post(self.url, payload, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+        client = self.custodian_1_client
+        resp = client.post(self.url, [{'species_name': 'Canis lupis', 'name_id': 1}], format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        resp = client.post(self.url, payload, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), {'records': 2})
+        for record in self.ds.record_queryset.filter(name_id=25454):
+            self.assertEqual(record.species_name, 'Canis lupus')
+            self.assertEqual(record.data['Species Name'], 'Canis lupus')
+        self.assertEqual(self.ds.record_queryset.filter(name_id=-1).count(), 1)
+        # only the remaining unresolved name is suggested
+        resp = client.get(self.url)
+        self.assertEqual([d['species_name'] for d in resp.json()], ['Vespadelus duglasorum'])
+
+
+class TestResolveSpeciesNames(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestResolveSpeciesNames, self).setUp()
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['Species Name', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Canis lupus', '2018-06-23', -32, 115.75],
+            ['Chubby bat', '2018-08-23', -17.962075, 122.234554],
+        ])
+        # a stale id
+        self.ds.record_queryset.filter(species_name='Chubby bat').update(name_id=999)
+
+    def test_resolve(self):
+        result = resolve_species_names(SpeciesIndex({'Canis lupus': 25454}))
+        self.assertEqual(result, {'pairs': 2, 'records': 3})
+        self.assertEqual(self.ds.record_queryset.filter(name_id=25454).count(), 2)
+        self.assertEqual(self.ds.record_queryset.get(species_name='Chubby bat').name_id, -1)
+        # nothing left to change
+        self.assertEqual(resolve_species_names(SpeciesIndex({'Canis lupus': 25454})), {'pairs': 0, 'records': 0})
+
+    @override_settings(
+        SPECIES_FACADE_CLASS='main.utils_species.CachedSpeciesFacade',
+        SPECIES_CACHE_SOURCE_CLASS='main.utils_species.FixtureSpeciesFacade',
+        SPECIES_FIXTURE_FILE=SPECIES_FIXTURE_FILE,
+        SPECIES_CACHE_MAX_AGE=24
+    )
+    def test_job(self):
+        job = run_job(create_job(Job.TYPE_RESOLVE_SPECIES_NAMES, start=False))
+        self.assertEqual(job.status, Job.STATUS_SUCCESS)
+        self.assertEqual(self.ds.record_queryset.filter(name_id=25454).count(), 2)
+        self.assertEqual(self.ds.record_queryset.get(species_name='Chubby bat').name_id, -1)
@@ -1094,7 +1094,7 @@ class TestExport(helpers.BaseUserTestCase):
         self.assertEqual(ext, '.xlsx')
         filename.startswith(dataset.name)
         # read content
-        wb = load_workbook(six.BytesIO(resp.content), read_only=True)
+        wb = load_workbook(six.BytesIO(resp.getvalue()), read_only=True)
         # one datasheet named from dataset
         sheet_names = wb.sheetnames
         self.assertEqual(1, len(sheet_names))
@@ -0,0 +1,63 @@
+from django.urls import reverse
+from rest_framework import status
+
+from main.models import SpeciesSummary
+from main.tests.api import helpers
+
+
+class TestSpeciesSummary(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestSpeciesSummary, self).setUp()
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['Species Name', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Canis lupus', '2018-06-23', -32, 115.75],
+            ['Chubby bat', '2018-08-23', -17.962075, 122.234554],
+        ])
+        self.url = reverse('api:species')
+
+    def get_summary(self, species_name):
+        SpeciesSummary.refresh_stale()
+        return SpeciesSummary.objects.filter(species_name=species_name).first()
+
+    def test_maintained_on_record_changes(self):
+        summary = self.get_summary('Canis lupus')
+        self.assertEqual(summary.record_count, 2)
+        self.assertEqual(summary.dataset_count, 1)
+        dates = sorted(self.ds.record_queryset.filter(species_name='Canis lupus').values_list('datetime', flat=True))
+        self.assertEqual((summary.first_observed, summary.last_observed), (dates[0], dates[-1]))
+
+        record = self.ds.record_queryset.get(species_name='Chubby bat')
+        record.species_name = 'Canis lupus'
+        record.save()
+        self.assertEqual(self.get_summary('Canis lupus').record_count, 3)
+        self.assertIsNone(self.get_summary('Chubby bat'))
+
+        self.ds.record_queryset.filter(species_name='Canis lupus').first().delete()
+        self.assertEqual(self.get_summary('Canis lupus').record_count, 2)
+
+    def test_view(self):
+        client = self.custodian_1_client
+        resp = client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), ['Canis lupus', 'Chubby bat'])
+
+        resp = client.get(self.url, {'prefix': 'chu'})
+        self.assertEqual(resp.json(), ['Chubby bat'])
+
+        resp = client.get(self.url, {'limit': 1, 'offset': 1})
+        data = resp.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['results'], ['Chubby bat'])
+
+        resp = client.get(self.url, {'summary': 'true', 'prefix': 'canis'})
+        data = resp.json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['species_name'], 'Canis lupus')
+        self.assertEqual(data[0]['record_count'], 2)
+        self.assertEqual(data[0]['dataset_count'], 1)
+
+        # no resolved species
+        resp = client.get(self.url, {'strict': 'true'})
+        self.assertEqual(resp.json(), [])
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from main.tests.api import helpers
+from main.utils_tiles import tile_envelope, tile_bbox, WEB_MERCATOR_ORIGIN
+
+
+class TestTileMath(helpers.BaseUserTestCase):
+
+    def test_world_tile(self):
+        self.assertEqual(
+            tile_envelope(0, 0, 0),
+            (-WEB_MERCATOR_ORIGIN, -WEB_MERCATOR_ORIGIN, WEB_MERCATOR_ORIGIN, WEB_MERCATOR_ORIGIN)
+        )
+
+    def test_perth_tile_contains_perth(self):
+        # zoom 10 tile of Perth
+        bbox = tile_bbox(10, 841, 607)
+        west, south, east, north = bbox.extent
+        self.assertTrue(west < 115.86 < east)
+        self.assertTrue(south < -31.8 < north)
+
+
+class TestTiles(helpers.BaseUserTestCase):
+
+    def setUp(self):
+        super(TestTiles, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Chubby Bat', '2018-08-23', -17.962075, 122.234554]
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_world_tile(self):
+        client = self.custodian_1_client
+        url = reverse('api:tiles', kwargs={'z': 0, 'x': 0, 'y': 0})
+        with override_settings(TILES_CACHE_DIR=self.cache_dir):
+            resp = client.get(url, {'dataset': self.ds.pk})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get('content-type'), 'application/vnd.mapbox-vector-tile')
+        self.assertTrue(len(resp.content) > 0)
+        self.assertIn(b'records', resp.content)
+
+    def test_empty_tile(self):
+        client = self.custodian_1_client
+        # a tile in the north atlantic
+        url = reverse('api:tiles', kwargs={'z': 10, 'x': 300, 'y': 300})
+        with override_settings(TILES_CACHE_DIR=self.cache_dir):
+            resp = client.get(url, {'layers': 'records'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.content, b'')
+
+    def test_tile_cached_until_dataset_modified(self):
+        client = self.custodian_1_client
+        url = reverse('api:tiles', kwargs={'z': 0, 'x': 0, 'y': 0})
+        with override_settings(TILES_CACHE_DIR=self.cache_dir, TILES_STAMP_MAX_AGE=0):
+            resp = client.get(url, {'dataset': self.ds.pk})
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+            # same request: same cache entry
+            client.get(url, {'dataset': self.ds.pk})
+            self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+            # modify a record: new stamp
+            record = self.ds.record_queryset.first()
+            record.save()
+            client.get(url, {'dataset': self.ds.pk})
+            self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_old_stamps_pruned(self):
+        client = self.custodian_1_client
+        url = reverse('api:tiles', kwargs={'z': 0, 'x': 0, 'y': 0})
+        old_stamp_dir = os.path.join(self.cache_dir, 'old')
+        os.makedirs(old_stamp_dir)
+        two_days_ago = time.time() - 48 * 3600
+        os.utime(old_stamp_dir, (two_days_ago, two_days_ago))
+        with override_settings(TILES_CACHE_DIR=self.cache_dir, TILES_CACHE_MAX_AGE=24):
+            resp = client.get(url, {'dataset': self.ds.pk})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertFalse(os.path.exists(old_stamp_dir))
+
+    def test_out_of_range_tile(self):
+        client = self.custodian_1_client
+        url = reverse('api:tiles', kwargs={'z': 1, 'x': 2, 'y': 0})
+        resp = client.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_layer(self):
+        client = self.custodian_1_client
+        url = reverse('api:tiles', kwargs={'z': 0, 'x': 0, 'y': 0})
+        resp = client.get(url, {'layers': 'records,unicorns'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_permission_denied_if_not_logged_in(self):
+        client = self.anonymous_client
+        url = reverse('api:tiles', kwargs={'z': 0, 'x': 0, 'y': 0})
+        resp = client.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,25 @@
+import datetime
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from main.jobs import run_pending_jobs
+from main.models import Job
+
+
+class TestStaleJobs(TestCase):
+
+    @override_settings(JOBS_RUNNING_TIMEOUT=60)
+    def test_stale_running_job_failed(self):
+        now = timezone.now()
+        stale = Job.objects.create(type=Job.TYPE_REFRESH_SPECIES, status=Job.STATUS_RUNNING,
+                                   started=now - datetime.timedelta(minutes=61))
+        running = Job.objects.create(type=Job.TYPE_REFRESH_SPECIES, status=Job.STATUS_RUNNING,
+                                     started=now - datetime.timedelta(minutes=10))
+        self.assertEqual(run_pending_jobs(), [])
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, Job.STATUS_FAILED)
+        self.assertIsNotNone(stale.error)
+        self.assertIsNotNone(stale.finished)
+        running.refresh_from_db()
+        self.assertEqual(running.status, Job.STATUS_RUNNING)
@@ -0,0 +1,82 @@
+from django.shortcuts import reverse
+from rest_framework import status
+
+from main.models import Dataset, Record
+from main.tests import factories
+from main.tests.api import helpers
+
+
+class TestJSONDataTable(helpers.BaseUserTestCase):
+    """
+    The DataTables server-side processing of the publish data view.
+    """
+
+    def setUp(self):
+        super(TestJSONDataTable, self).setUp()
+        self.ds = self._create_dataset_and_records_from_rows([
+            ['What', 'When', 'Latitude', 'Longitude'],
+            ['Canis lupus', '2018-06-22', -32, 115.75],
+            ['Chubby Bat', '2018-08-23', -17.962075, 122.234554],
+            ['Canis dingo', '2018-09-01', -31, 116],
+        ])
+        self.url = reverse('publish:data_json', kwargs={'pk': self.ds.pk})
+        self.client.login(username=self.readonly_user.username, password='password')
+
+    def get_params(self, **kwargs):
+        params = {
+            'draw': 3,
+            'start': 0,
+            'length': 10,
+            'search[value]': '',
+            'order[0][column]': 0,
+            'order[0][dir]': 'asc',
+        }
+        for index, name in enumerate(['id', 'What', 'When', 'Latitude', 'Longitude']):
+            prefix = 'columns[{}]'.format(index)
+            params.update({
+                prefix + '[data]': name,
+                prefix + '[name]': name,
+                prefix + '[searchable]': 'true',
+                prefix + '[orderable]': 'true',
+            })
+        params.update(kwargs)
+        return params
+
+    def test_page(self):
+        resp = self.client.get(self.url, self.get_params(length=2))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.json()
+        self.assertEqual(data['draw'], 3)
+        self.assertEqual(data['recordsTotal'], 3)
+        self.assertEqual(data['recordsFiltered'], 3)
+        expected_ids = list(self.ds.record_queryset.order_by('id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in data['data']], expected_ids[:2])
+        resp = self.client.get(self.url, self.get_params(start=2, length=2))
+        self.assertEqual([row['id'] for row in resp.json()['data']], expected_ids[2:])
+
+    def test_search_and_order(self):
+        params = self.get_params(**{
+            'search[value]': 'canis',
+            'order[0][column]': 1,
+            'order[0][dir]': 'desc',
+        })
+        data = self.client.get(self.url, params).json()
+        self.assertEqual(data['recordsTotal'], 3)
+        self.assertEqual(data['recordsFiltered'], 2)
+        self.assertEqual([row['What'] for row in data['data']], ['Canis lupus', 'Canis dingo'])
+
+    def test_search_without_fields(self):
+        ds = factories.DatasetFactory(
+            project=self.project_1,
+            type=Dataset.TYPE_GENERIC,
+            data_package=helpers.create_data_package_from_fields([])
+        )
+        for _ in range(2):
+            Record.objects.create(dataset=ds, data={})
+        resp = self.client.get(reverse('publish:data_json', kwargs={'pk': ds.pk}), self.get_params(**{
+            'search[value]': 'canis'
+        }))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.json()
+        self.assertEqual(data['recordsTotal'], 2)
+        self.assertEqual(data['recordsFiltered'], 2)
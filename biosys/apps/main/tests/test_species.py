@@ -1,6 +1,16 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from os import path
 
-from main.utils_species import HerbieFacade
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from main.jobs import run_pending_jobs
+from main.models import Job, Species
+from main.utils_species import HerbieFacade, CachedSpeciesFacade, FixtureSpeciesFacade, SpeciesIndex, \
+    SharedSpeciesIndex, build_species_lookup_file, refresh_species
 
 
 class TestHerbieFacade(TestCase):
@@ -37,3 +47,205 @@ class TestHerbieFacade(TestCase):
             self.assertTrue(self.facade.PROPERTY_NAME_ID.herbie_name in sp)
         except Exception as e:
             self.fail("Should not raise an exception!: {}: '{}'".format(e.__class__, e))
+
+
+SPECIES_FIXTURE_FILE = path.join(path.dirname(__file__), 'data', 'species.json')
+
+
+@override_settings(
+    SPECIES_CACHE_SOURCE_CLASS='main.utils_species.FixtureSpeciesFacade',
+    SPECIES_FIXTURE_FILE=SPECIES_FIXTURE_FILE,
+    SPECIES_CACHE_MAX_AGE=24
+)
+class TestCachedSpeciesFacade(TestCase):
+
+    def refresh(self):
+        # the first use starts the refresh job
+        CachedSpeciesFacade().name_id_by_species_name()
+        run_pending_jobs()
+
+    def test_first_use_refresh(self):
+        self.assertEqual(Species.objects.count(), 0)
+        # the species of the source are served while the cache is refreshed in background
+        mapping = CachedSpeciesFacade().name_id_by_species_name()
+        self.assertEqual(mapping['Canis lupus'], 25454)
+        self.assertEqual(len(mapping), 4)
+        self.assertEqual(Species.objects.count(), 0)
+        self.assertTrue(CachedSpeciesFacade.is_refreshing())
+        run_pending_jobs()
+        self.assertEqual(Species.objects.count(), 4)
+        self.assertIsNotNone(CachedSpeciesFacade.last_refresh())
+
+    def test_failed_refresh_not_retried(self):
+        with override_settings(SPECIES_FIXTURE_FILE='/not/a/file.json'):
+            CachedSpeciesFacade().ensure_fresh()
+            jobs = run_pending_jobs()
+            self.assertEqual([job.status for job in jobs], [Job.STATUS_FAILED])
+            CachedSpeciesFacade().ensure_fresh()
+            self.assertFalse(CachedSpeciesFacade.is_refreshing())
+        Job.objects.update(finished=timezone.now() - CachedSpeciesFacade.FAILED_REFRESH_DELAY - timedelta(minutes=1))
+        CachedSpeciesFacade().ensure_fresh()
+        self.assertTrue(CachedSpeciesFacade.is_refreshing())
+
+    def test_no_refresh_when_fresh(self):
+        self.refresh()
+        Species.objects.filter(name_id=25454).delete()
+        # the cache is fresh: not refreshed
+        self.assertNotIn('Canis lupus', CachedSpeciesFacade().name_id_by_species_name())
+        self.assertEqual(Job.objects.filter(type=Job.TYPE_REFRESH_SPECIES).count(), 1)
+
+    def test_stale_cache_start_background_refresh(self):
+        self.refresh()
+        Job.objects.filter(type=Job.TYPE_REFRESH_SPECIES).update(finished=timezone.now() - timedelta(hours=25))
+        CachedSpeciesFacade().name_id_by_species_name()
+        self.assertTrue(CachedSpeciesFacade.is_refreshing())
+
+    def test_refresh_sync(self):
+        Species.objects.create(name_id=1, species_name='Unknown species')
+        Species.objects.create(name_id=25454, species_name='Canis lupus old name')
+        result = refresh_species()
+        self.assertEqual(result, {'created': 3, 'updated': 1, 'deleted': 1, 'full': True})
+        self.assertEqual(
+            dict(Species.objects.values_list('name_id', 'species_name')),
+            dict((sp['name_id'], sp['species_name']) for sp in FixtureSpeciesFacade().get_all_species())
+        )
+
+    def test_properties_filter(self):
+        self.refresh()
+        species = CachedSpeciesFacade().get_all_species([CachedSpeciesFacade.PROPERTY_NAME_ID])
+        self.assertEqual(len(species), 4)
+        self.assertEqual(list(species[0].keys()), ['name_id'])
+
+
+class TestIncrementalSpeciesRefresh(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.file_path = path.join(self.directory, 'species.json')
+
+    def refresh(self, species, full=False):
+        with open(self.file_path, 'w') as fp:
+            json.dump(species, fp)
+        with override_settings(SPECIES_FIXTURE_FILE=self.file_path):
+            return refresh_species(FixtureSpeciesFacade, full=full)
+
+    def test_incremental(self):
+        canis = {'name_id': 25454, 'species_name': 'Canis lupus', 'md5_rowhash': 'a', 'updated_on': '2004-12-09Z'}
+        triodia = {'name_id': 17879, 'species_name': 'Triodia helmsii', 'md5_rowhash': 'b', 'updated_on': '2010-01-01Z'}
+        result = self.refresh([canis, triodia])
+        self.assertEqual(result, {'created': 2, 'updated': 0, 'deleted': 0, 'full': True})
+        self.assertEqual(Species.objects.get(name_id=17879).updated_on.isoformat(), '2010-01-01')
+
+        # only the species updated since the 2010-01-01 are considered and only the changed ones are saved
+        canis_renamed = dict(canis, species_name='Canis lupus renamed', md5_rowhash='c')
+        triodia_renamed = dict(triodia, species_name='Triodia helmsii renamed', md5_rowhash='d',
+                               updated_on='2018-01-01Z')
+        result = self.refresh([canis_renamed, triodia_renamed])
+        self.assertEqual(result, {'created': 0, 'updated': 1, 'deleted': 0, 'full': False})
+        self.assertEqual(Species.objects.get(name_id=25454).species_name, 'Canis lupus')
+        self.assertEqual(Species.objects.get(name_id=17879).species_name, 'Triodia helmsii renamed')
+
+        # same row hash: nothing to do
+        self.assertEqual(self.refresh([triodia_renamed])['updated'], 0)
+
+        # the full refresh detects the deleted species
+        result = self.refresh([triodia_renamed], full=True)
+        self.assertEqual(result, {'created': 0, 'updated': 0, 'deleted': 1, 'full': True})
+
+    def test_species_without_taxonomy(self):
+        canis = {'name_id': 25454, 'species_name': 'Canis lupus', 'md5_rowhash': 'a', 'updated_on': '2004-12-09Z',
+                 'genus': 'Canis', 'family_nid': 22717, 'rank_name': 'Species'}
+        self.refresh([canis])
+        # the species cached before the taxonomy, as left by the 0027_species_taxonomy migration
+        Species.objects.update(genus='', family_nid=None, rank_name='', md5_rowhash='', updated_on=None)
+
+        # the species is not updated in the source but the refresh is full and fills the taxonomy
+        result = self.refresh([canis])
+        self.assertEqual(result, {'created': 0, 'updated': 1, 'deleted': 0, 'full': True})
+        species = Species.objects.get(name_id=25454)
+        self.assertEqual((species.genus, species.family_nid, species.rank_name), ('Canis', 22717, 'Species'))
+        self.assertEqual(species.updated_on.isoformat(), '2004-12-09')
+
+
+class TestSpeciesIndex(TestCase):
+
+    def setUp(self):
+        self.index = SpeciesIndex({
+            'Canis lupus': 25454,
+            'Canis lupus subsp. familiaris': '30883',
+            'Vespadelus douglasorum': 24204,
+        })
+
+    def test_lookups(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.get_name_id('Canis lupus'), 25454)
+        self.assertEqual(self.index.get_name_id('Canis lupus subsp. familiaris'), 30883)
+        self.assertEqual(self.index.get_name_id('Unknown'), -1)
+        self.assertEqual(self.index.get_species_name(24204), 'Vespadelus douglasorum')
+        self.assertEqual(self.index.get_species_name('30883'), 'Canis lupus subsp. familiaris')
+        self.assertIsNone(self.index.get_species_name(1))
+        self.assertIsNone(self.index.get_species_name('not a number'))
+
+    def test_name_ids(self):
+        self.assertTrue(self.index.has_name_id(25454))
+        self.assertTrue(self.index.has_name_id('24204'))
+        self.assertFalse(self.index.has_name_id(1))
+        self.assertEqual(self.index.name_ids, {25454, 30883, 24204})
+
+    def test_empty(self):
+        self.assertFalse(SpeciesIndex())
+        self.assertFalse(SpeciesIndex().has_name_id(25454))
+
+
+class TestSharedSpeciesIndex(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.file_path = path.join(self.directory, 'species_lookup.sqlite3')
+
+    def test_lookups(self):
+        build_species_lookup_file(self.file_path, [
+            ('Canis lupus', 25454),
+            ('Canis lupus subsp. familiaris', '30883'),
+            ('Vespadelus douglasorum', 24204),
+        ], stamp=12)
+        index = SharedSpeciesIndex(self.file_path)
+        self.assertEqual(index.stamp, 12)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.get_name_id('Canis lupus subsp. familiaris'), 30883)
+        self.assertEqual(index.get_name_id('Unknown'), -1)
+        self.assertEqual(index.get_species_name('24204'), 'Vespadelus douglasorum')
+        self.assertIsNone(index.get_species_name('not a number'))
+        self.assertTrue(index.has_name_id('25454'))
+        self.assertFalse(index.has_name_id(1))
+
+    def test_rebuild_keeps_opened_index(self):
+        build_species_lookup_file(self.file_path, [('Canis lupus', 25454)], stamp=1)
+        index = SharedSpeciesIndex(self.file_path)
+        build_species_lookup_file(self.file_path, [('Triodia helmsii', 17879)], stamp=2)
+        # the opened index still reads the previous file
+        self.assertEqual(index.get_name_id('Canis lupus'), 25454)
+        new_index = SharedSpeciesIndex(self.file_path)
+        self.assertEqual(new_index.stamp, 2)
+        self.assertEqual(new_index.get_name_id('Canis lupus'), -1)
+        self.assertEqual(new_index.get_name_id('Triodia helmsii'), 17879)
+
+    def test_cached_facade(self):
+        with override_settings(
+                SPECIES_CACHE_SOURCE_CLASS='main.utils_species.FixtureSpeciesFacade',
+                SPECIES_FIXTURE_FILE=SPECIES_FIXTURE_FILE,
+                SPECIES_CACHE_MAX_AGE=24,
+                SPECIES_LOOKUP_FILE=self.file_path):
+            CachedSpeciesFacade().ensure_fresh()
+            run_pending_jobs()
+            index = CachedSpeciesFacade().species_index()
+            self.assertIsInstance(index, SharedSpeciesIndex)
+            last_refresh = CachedSpeciesFacade.last_refresh()
+            self.assertEqual(index.stamp, last_refresh.pk)
+            self.assertEqual(len(index), 4)
+            self.assertEqual(index.get_name_id('Triodia helmsii'), 17879)
+            # species changed by another host: the file is older than the last refresh and is rebuilt
+            build_species_lookup_file(self.file_path, [], stamp=last_refresh.pk - 1)
+            self.assertEqual(len(CachedSpeciesFacade().species_index()), 4)
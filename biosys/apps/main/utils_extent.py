@@ -0,0 +1,128 @@
+"""
+Maintenance of the cached extents (bounding boxes) of the datasets and projects.
+The extent is stored in the 'cached_extent' column of the model together with an 'extent_stale' flag:
+- when a geometry is added the stored extent is expanded if it doesn't already cover the geometry.
+- when a geometry is removed (delete or update) the extent is flagged as stale if the geometry was not strictly inside
+it. A stale extent is recomputed the next time it is read (see Dataset.extent and Project.extent).
+All the updates are done in SQL so they are safe with concurrent writes.
+"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+from django.db import connection
+from django.utils.encoding import force_text
+
+from main.constants import MODEL_SRID
+
+
+def _geometry_param(geometry):
+    """
+    :return: the geometry as a hex EWKB string in the MODEL_SRID (no loss of precision unlike WKT)
+    """
+    if geometry.srid is None:
+        geometry = geometry.clone()
+        geometry.srid = MODEL_SRID
+    elif geometry.srid != MODEL_SRID:
+        geometry = geometry.transform(MODEL_SRID, clone=True)
+    return force_text(geometry.hexewkb)
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def expand_extent(queryset, geometry):
+    """
+    Expand the cached extent of the objects of the queryset (Dataset or Project) to include the geometry.
+    Stale extents are left alone, they will be recomputed anyway.
+    """
+    if geometry is None:
+        return
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    ids_sql, ids_params = queryset.order_by().values('pk').query.sql_with_params()
+    sql = """
+    UPDATE {table} SET cached_extent = ST_Envelope(
+      CASE WHEN {table}.cached_extent IS NULL THEN g.geom ELSE ST_Collect({table}.cached_extent, g.geom) END
+    )
+    FROM (SELECT %s::geometry AS geom) AS g
+    WHERE {table}.id IN ({ids_sql}) AND NOT {table}.extent_stale
+    AND ({table}.cached_extent IS NULL OR NOT ST_Covers({table}.cached_extent, g.geom))
+    """.format(table=table, ids_sql=ids_sql)
+    _execute(sql, (_geometry_param(geometry),) + tuple(ids_params))
+
+
+def shrink_extent(queryset, geometry):
+    """
+    A geometry has been removed from the objects of the queryset (Dataset or Project).
+    If the geometry was touching the boundary of the cached extent the extent could shrink: flag it as stale.
+    """
+    if geometry is None:
+        return
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    ids_sql, ids_params = queryset.order_by().values('pk').query.sql_with_params()
+    sql = """
+    UPDATE {table} SET extent_stale = true
+    FROM (SELECT %s::geometry AS geom) AS g
+    WHERE {table}.id IN ({ids_sql}) AND NOT {table}.extent_stale
+    AND ({table}.cached_extent IS NULL OR NOT ST_ContainsProperly({table}.cached_extent, g.geom))
+    """.format(table=table, ids_sql=ids_sql)
+    _execute(sql, (_geometry_param(geometry),) + tuple(ids_params))
+
+
+def replace_extent_geometry(queryset, old_geometry, new_geometry):
+    """
+    A geometry of the objects of the queryset has been updated.
+    """
+    if old_geometry == new_geometry:
+        return
+    shrink_extent(queryset, old_geometry)
+    expand_extent(queryset, new_geometry)
+
+
+def refresh_datasets_extent(dataset_queryset):
+    """
+    Recompute from the records the extent of the stale datasets of the queryset.
+    """
+    from main.models import Dataset, Record
+
+    qn = connection.ops.quote_name
+    dataset_table = qn(Dataset._meta.db_table)
+    ids_sql, ids_params = dataset_queryset.order_by().values('pk').query.sql_with_params()
+    sql = """
+    UPDATE {dataset} SET cached_extent = (
+      SELECT ST_SetSRID(ST_Extent(r.geometry)::geometry, %s) FROM {record} AS r WHERE r.dataset_id = {dataset}.id
+    ), extent_stale = false
+    WHERE {dataset}.id IN ({ids_sql}) AND {dataset}.extent_stale
+    """.format(dataset=dataset_table, record=qn(Record._meta.db_table), ids_sql=ids_sql)
+    _execute(sql, (MODEL_SRID,) + tuple(ids_params))
+
+
+def refresh_projects_extent(project_queryset):
+    """
+    Recompute the extent of the stale projects of the queryset from the project geometry, the sites and the extents
+    of the datasets (refreshed first if stale).
+    """
+    from main.models import Dataset, Project, Site
+
+    refresh_datasets_extent(Dataset.objects.filter(project__in=project_queryset.order_by().values('pk')))
+    qn = connection.ops.quote_name
+    project_table = qn(Project._meta.db_table)
+    ids_sql, ids_params = project_queryset.order_by().values('pk').query.sql_with_params()
+    sql = """
+    UPDATE {project} SET cached_extent = (
+      SELECT ST_SetSRID(ST_Extent(geometries.geom)::geometry, %s) FROM (
+        SELECT {project}.geometry AS geom
+        UNION ALL
+        SELECT s.geometry FROM {site} AS s WHERE s.project_id = {project}.id
+        UNION ALL
+        SELECT d.cached_extent FROM {dataset} AS d WHERE d.project_id = {project}.id
+      ) AS geometries
+    ), extent_stale = false
+    WHERE {project}.id IN ({ids_sql}) AND {project}.extent_stale
+    """.format(
+        project=project_table,
+        site=qn(Site._meta.db_table),
+        dataset=qn(Dataset._meta.db_table),
+        ids_sql=ids_sql
+    )
+    _execute(sql, (MODEL_SRID,) + tuple(ids_params))
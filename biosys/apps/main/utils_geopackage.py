@@ -0,0 +1,252 @@
+"""
+A minimal GeoPackage writer (http://www.geopackage.org/spec120/) built on the sqlite3 module.
+It writes one features table with a geometry column and its spatial index (the gpkg_rtree_index extension).
+The features are inserted in bulk, one transaction per chunk, and the rtree maintenance triggers are created once the
+table is populated: they use the ST_* functions that are provided by the GIS applications but not by plain sqlite.
+"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import sqlite3
+import struct
+
+GPKG_APPLICATION_ID = 0x47504B47  # 'GPKG'
+GPKG_USER_VERSION = 10200
+GEOMETRY_COLUMN = 'geom'
+FID_COLUMN = 'fid'
+RTREE_EXTENSION_DEFINITION = 'http://www.geopackage.org/spec120/#extension_rtree'
+
+# GeoPackageBinary header flags: little endian, with or without the [minx, maxx, miny, maxy] envelope.
+GEOMETRY_FLAGS_ENVELOPE = 0x03
+GEOMETRY_FLAGS_EMPTY = 0x11
+
+CORE_TABLES_SQL = """
+CREATE TABLE gpkg_spatial_ref_sys (
+  srs_name TEXT NOT NULL,
+  srs_id INTEGER NOT NULL PRIMARY KEY,
+  organization TEXT NOT NULL,
+  organization_coordsys_id INTEGER NOT NULL,
+  definition TEXT NOT NULL,
+  description TEXT
+);
+CREATE TABLE gpkg_contents (
+  table_name TEXT NOT NULL PRIMARY KEY,
+  data_type TEXT NOT NULL,
+  identifier TEXT UNIQUE,
+  description TEXT DEFAULT '',
+  last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+  min_x DOUBLE,
+  min_y DOUBLE,
+  max_x DOUBLE,
+  max_y DOUBLE,
+  srs_id INTEGER,
+  CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id)
+);
+CREATE TABLE gpkg_geometry_columns (
+  table_name TEXT NOT NULL,
+  column_name TEXT NOT NULL,
+  geometry_type_name TEXT NOT NULL,
+  srs_id INTEGER NOT NULL,
+  z TINYINT NOT NULL,
+  m TINYINT NOT NULL,
+  CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+  CONSTRAINT uk_gc_table_name UNIQUE (table_name),
+  CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+  CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id)
+);
+CREATE TABLE gpkg_extensions (
+  table_name TEXT,
+  column_name TEXT,
+  extension_name TEXT NOT NULL,
+  definition TEXT NOT NULL,
+  scope TEXT NOT NULL,
+  CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name)
+);
+"""
+
+# the rtree triggers of the spec, formatted with t (table), c (geometry column), i (fid column)
+RTREE_TRIGGERS_SQL = """
+CREATE TRIGGER rtree_{t}_{c}_insert AFTER INSERT ON {t}
+  WHEN (new.{c} NOT NULL AND NOT ST_IsEmpty(NEW.{c}))
+BEGIN
+  INSERT OR REPLACE INTO rtree_{t}_{c} VALUES (
+    NEW.{i}, ST_MinX(NEW.{c}), ST_MaxX(NEW.{c}), ST_MinY(NEW.{c}), ST_MaxY(NEW.{c})
+  );
+END;
+CREATE TRIGGER rtree_{t}_{c}_update1 AFTER UPDATE OF {c} ON {t}
+  WHEN OLD.{i} = NEW.{i} AND (NEW.{c} NOTNULL AND NOT ST_IsEmpty(NEW.{c}))
+BEGIN
+  INSERT OR REPLACE INTO rtree_{t}_{c} VALUES (
+    NEW.{i}, ST_MinX(NEW.{c}), ST_MaxX(NEW.{c}), ST_MinY(NEW.{c}), ST_MaxY(NEW.{c})
+  );
+END;
+CREATE TRIGGER rtree_{t}_{c}_update2 AFTER UPDATE OF {c} ON {t}
+  WHEN OLD.{i} = NEW.{i} AND (NEW.{c} ISNULL OR ST_IsEmpty(NEW.{c}))
+BEGIN
+  DELETE FROM rtree_{t}_{c} WHERE id = OLD.{i};
+END;
+CREATE TRIGGER rtree_{t}_{c}_update3 AFTER UPDATE ON {t}
+  WHEN OLD.{i} != NEW.{i} AND (NEW.{c} NOTNULL AND NOT ST_IsEmpty(NEW.{c}))
+BEGIN
+  DELETE FROM rtree_{t}_{c} WHERE id = OLD.{i};
+  INSERT OR REPLACE INTO rtree_{t}_{c} VALUES (
+    NEW.{i}, ST_MinX(NEW.{c}), ST_MaxX(NEW.{c}), ST_MinY(NEW.{c}), ST_MaxY(NEW.{c})
+  );
+END;
+CREATE TRIGGER rtree_{t}_{c}_update4 AFTER UPDATE ON {t}
+  WHEN OLD.{i} != NEW.{i} AND (NEW.{c} ISNULL OR ST_IsEmpty(NEW.{c}))
+BEGIN
+  DELETE FROM rtree_{t}_{c} WHERE id IN (OLD.{i}, NEW.{i});
+END;
+CREATE TRIGGER rtree_{t}_{c}_delete AFTER DELETE ON {t}
+  WHEN old.{c} NOT NULL
+BEGIN
+  DELETE FROM rtree_{t}_{c} WHERE id = OLD.{i};
+END;
+"""
+
+
+def quote_name(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def geometry_blob(wkb, envelope, srs_id):
+    """
+    Encode a geometry in the GeoPackageBinary format: a header with the srs and the envelope followed by the WKB.
+    :param envelope: (minx, maxx, miny, maxy) or None for an empty geometry
+    """
+    if envelope is None or None in envelope:
+        header = struct.pack(str('<2sBBi'), b'GP', 0, GEOMETRY_FLAGS_EMPTY, srs_id)
+    else:
+        header = struct.pack(str('<2sBBi4d'), b'GP', 0, GEOMETRY_FLAGS_ENVELOPE, srs_id, *envelope)
+    return sqlite3.Binary(header + bytes(wkb))
+
+
+class GeoPackageWriter(object):
+    """
+    Usage:
+        writer = GeoPackageWriter(file_path, 'records', [('name', 'TEXT'), ...], srs)
+        writer.write(features)
+        writer.close()
+    :param table_name: the features table name, must be a plain sql identifier (used in the rtree names)
+    :param columns: the attribute columns as a list of (name, GeoPackage type: INTEGER, DOUBLE, TEXT, DATE...)
+    :param srs: a dict with the srs_id, organization, organization_coordsys_id and definition (WKT)
+    """
+
+    def __init__(self, file_path, table_name, columns, srs, identifier=None, description=''):
+        self.table_name = table_name
+        self.columns = columns
+        self.srs_id = srs['srs_id']
+        self.extent = None
+        self.count = 0
+        self.connection = sqlite3.connect(file_path)
+        # the file is generated in one go, no need for a journal
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('PRAGMA application_id = {}'.format(GPKG_APPLICATION_ID))
+        self.connection.execute('PRAGMA user_version = {}'.format(GPKG_USER_VERSION))
+        with self.connection:
+            self._create_tables(srs, identifier or table_name, description)
+
+    @property
+    def rtree_name(self):
+        return 'rtree_{}_{}'.format(self.table_name, GEOMETRY_COLUMN)
+
+    def _create_tables(self, srs, identifier, description):
+        cursor = self.connection.cursor()
+        cursor.executescript(CORE_TABLES_SQL)
+        srs_rows = [
+            ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', 'undefined cartesian coordinate reference system'),
+            ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', 'undefined geographic coordinate reference system'),
+        ]
+        if self.srs_id not in [-1, 0]:
+            srs_rows.append((
+                srs.get('srs_name') or '{}:{}'.format(srs['organization'], srs['organization_coordsys_id']),
+                self.srs_id,
+                srs['organization'],
+                srs['organization_coordsys_id'],
+                srs['definition'],
+                None
+            ))
+        cursor.executemany('INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)', srs_rows)
+        cursor.execute(
+            'INSERT INTO gpkg_contents (table_name, data_type, identifier, description, srs_id) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [self.table_name, 'features', identifier, description, self.srs_id]
+        )
+        cursor.execute(
+            'INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)',
+            [self.table_name, GEOMETRY_COLUMN, 'GEOMETRY', self.srs_id]
+        )
+        cursor.execute(
+            'INSERT INTO gpkg_extensions VALUES (?, ?, ?, ?, ?)',
+            [self.table_name, GEOMETRY_COLUMN, 'gpkg_rtree_index', RTREE_EXTENSION_DEFINITION, 'write-only']
+        )
+        columns_sql = ''.join([', {} {}'.format(quote_name(name), sql_type) for name, sql_type in self.columns])
+        table_sql = 'CREATE TABLE {table} ({fid} INTEGER PRIMARY KEY AUTOINCREMENT, {geom} GEOMETRY{columns})'
+        cursor.execute(table_sql.format(
+            table=quote_name(self.table_name),
+            fid=quote_name(FID_COLUMN),
+            geom=quote_name(GEOMETRY_COLUMN),
+            columns=columns_sql
+        ))
+        cursor.execute('CREATE VIRTUAL TABLE {} USING rtree(id, minx, maxx, miny, maxy)'.format(
+            quote_name(self.rtree_name)))
+
+    def write(self, features, chunk_size=10000):
+        """
+        Insert the features and their envelope in the spatial index, one transaction per chunk_size features.
+        :param features: an iterable of (fid, wkb, envelope (minx, maxx, miny, maxy), values of the columns).
+        wkb is None for a feature without geometry.
+        """
+        insert_sql = 'INSERT INTO {table} VALUES ({params})'.format(
+            table=quote_name(self.table_name),
+            params=', '.join(['?'] * (len(self.columns) + 2))
+        )
+        rtree_sql = 'INSERT INTO {} VALUES (?, ?, ?, ?, ?)'.format(quote_name(self.rtree_name))
+        rows = []
+        rtree_rows = []
+        for fid, wkb, envelope, values in features:
+            geometry = None
+            if wkb is not None:
+                geometry = geometry_blob(wkb, envelope, self.srs_id)
+                if envelope is not None and None not in envelope:
+                    rtree_rows.append([fid] + list(envelope))
+                    self._expand_extent(envelope)
+            rows.append([fid, geometry] + list(values))
+            if len(rows) >= chunk_size:
+                self._insert(insert_sql, rows, rtree_sql, rtree_rows)
+                rows, rtree_rows = [], []
+        if rows:
+            self._insert(insert_sql, rows, rtree_sql, rtree_rows)
+
+    def _insert(self, insert_sql, rows, rtree_sql, rtree_rows):
+        with self.connection:
+            self.connection.executemany(insert_sql, rows)
+            self.connection.executemany(rtree_sql, rtree_rows)
+        self.count += len(rows)
+
+    def _expand_extent(self, envelope):
+        minx, maxx, miny, maxy = envelope
+        if self.extent is None:
+            self.extent = [minx, miny, maxx, maxy]
+        else:
+            self.extent = [
+                min(self.extent[0], minx),
+                min(self.extent[1], miny),
+                max(self.extent[2], maxx),
+                max(self.extent[3], maxy)
+            ]
+
+    def close(self):
+        with self.connection:
+            if self.extent is not None:
+                self.connection.execute(
+                    'UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ? WHERE table_name = ?',
+                    self.extent + [self.table_name]
+                )
+            self.connection.executescript(RTREE_TRIGGERS_SQL.format(
+                t=self.table_name,
+                c=GEOMETRY_COLUMN,
+                i=FID_COLUMN
+            ))
+        self.connection.close()
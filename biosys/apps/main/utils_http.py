@@ -1,10 +1,14 @@
 from __future__ import absolute_import, unicode_literals, print_function, division
 
-from django.http import HttpResponse
+import os
+import tempfile
 
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
 
-class CSVFileResponse(HttpResponse):
-    def __init__(self, file_name=None):
+
+class CSVFileResponse(StreamingHttpResponse):
+    def __init__(self, streaming_content=(), file_name=None):
         content_type = 'text/csv'
         content_disposition = 'attachment;'
 
@@ -13,7 +17,7 @@ class CSVFileResponse(HttpResponse):
                 file_name += '.csv'
             content_disposition += ' filename=' + file_name
 
-        super(CSVFileResponse, self).__init__(content_type=content_type)
+        super(CSVFileResponse, self).__init__(streaming_content, content_type=content_type)
         self['Content-Disposition'] = content_disposition
 
 
@@ -31,9 +35,117 @@ class ExcelFileResponse(HttpResponse):
         self['Content-Disposition'] = content_disposition
 
 
-class WorkbookResponse(ExcelFileResponse):
+class SpooledFileResponse(FileResponse):
+    """
+    The content is written by write(output) in a temporary file (in memory until settings.EXPORT_SPOOL_MAX_SIZE bytes,
+    then on disk) and the file is streamed.
+    """
+    file_content_type = 'application/octet-stream'
+    file_extension = None
+
+    def __init__(self, write, file_name=None):
+        content_disposition = 'attachment;'
+
+        if file_name is not None:
+            if self.file_extension and not file_name.lower().endswith(self.file_extension):
+                file_name += self.file_extension
+            content_disposition += ' filename=' + file_name
+
+        output = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'EXPORT_SPOOL_MAX_SIZE', 1024 * 1024))
+        write(output)
+        content_length = output.tell()
+        output.seek(0)
+        super(SpooledFileResponse, self).__init__(output, content_type=self.file_content_type)
+        self['Content-Disposition'] = content_disposition
+        self['Content-Length'] = content_length
+
+
+class WorkbookResponse(SpooledFileResponse):
+    file_content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    file_extension = '.xlsx'
+
     def __init__(self, wb, file_name=None):
-        super(WorkbookResponse, self).__init__(file_name=file_name)
-        wb.save(self)
+        super(WorkbookResponse, self).__init__(wb.save, file_name=file_name)
 
 
+class ParquetFileResponse(SpooledFileResponse):
+    file_content_type = 'application/vnd.apache.parquet'
+    file_extension = '.parquet'
+
+
+class ArrowFileResponse(SpooledFileResponse):
+    # Arrow IPC stream format
+    file_content_type = 'application/vnd.apache.arrow.stream'
+    file_extension = '.arrows'
+
+
+class GeoPackageFileResponse(FileResponse):
+    """
+    The GeoPackage (a SQLite database) is written by write(file_path) in a temporary file that is removed once sent.
+    """
+
+    def __init__(self, write, file_name=None):
+        content_type = 'application/geopackage+sqlite3'
+        content_disposition = 'attachment;'
+
+        if file_name is not None:
+            if not file_name.lower().endswith('.gpkg'):
+                file_name += '.gpkg'
+            content_disposition += ' filename=' + file_name
+
+        fd, file_path = tempfile.mkstemp(suffix='.gpkg')
+        os.close(fd)
+        try:
+            write(file_path)
+            output = open(file_path, 'rb')
+        finally:
+            # the open file is still readable
+            os.remove(file_path)
+        content_length = os.fstat(output.fileno()).st_size
+        super(GeoPackageFileResponse, self).__init__(output, content_type=content_type)
+        self['Content-Disposition'] = content_disposition
+        self['Content-Length'] = content_length
+
+
+class GeoJSONFileResponse(StreamingHttpResponse):
+    def __init__(self, streaming_content=(), file_name=None):
+        content_type = 'application/geo+json'
+        content_disposition = 'attachment;'
+
+        if file_name is not None:
+            if not file_name.lower().endswith('.geojson'):
+                file_name += '.geojson'
+            content_disposition += ' filename=' + file_name
+
+        super(GeoJSONFileResponse, self).__init__(streaming_content, content_type=content_type)
+        self['Content-Disposition'] = content_disposition
+
+
+class StoredFileResponse(FileResponse):
+    """
+    Stream a file of a storage backend (e.g. a cached export) as an attachment.
+    """
+
+    def __init__(self, field_file, file_name=None, content_type='application/octet-stream'):
+        content_disposition = 'attachment;'
+        if file_name is not None:
+            content_disposition += ' filename=' + file_name
+
+        output = field_file.storage.open(field_file.name, 'rb')
+        super(StoredFileResponse, self).__init__(output, content_type=content_type)
+        self['Content-Disposition'] = content_disposition
+        self['Content-Length'] = field_file.size
+
+
+class ZipFileResponse(StreamingHttpResponse):
+    def __init__(self, streaming_content=(), file_name=None):
+        content_type = 'application/zip'
+        content_disposition = 'attachment;'
+
+        if file_name is not None:
+            if not file_name.lower().endswith('.zip'):
+                file_name += '.zip'
+            content_disposition += ' filename=' + file_name
+
+        super(ZipFileResponse, self).__init__(streaming_content, content_type=content_type)
+        self['Content-Disposition'] = content_disposition
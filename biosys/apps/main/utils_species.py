@@ -46,11 +46,26 @@ All species information are in the properties field.
 """
 from __future__ import absolute_import, unicode_literals, print_function, division
 
+import io
+import json
 import logging
+import os
+import sqlite3
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+import ijson
 import requests
 from confy import env
+from requests.adapters import HTTPAdapter
 
-from django.utils import six
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import six, timezone
+from django.utils.dateparse import parse_date
+from django.utils.module_loading import import_string
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +85,129 @@ def get_key_for_value(dict_, value, default=None):
     return default
 
 
+class SpeciesIndex(object):
+    """
+    A species_name <-> name_id index built once from a species_name -> name_id mapping.
+    Both directions are dicts and the valid name ids a set, so every lookup is O(1) (see get_key_for_value).
+    """
+
+    def __init__(self, name_id_by_species_name=None):
+        self.name_id_by_species_name = {}
+        self.species_name_by_name_id = {}
+        for species_name, name_id in six.iteritems(name_id_by_species_name or {}):
+            name_id = int(name_id)
+            self.name_id_by_species_name[species_name] = name_id
+            # same as get_key_for_value: one of the names if a name_id has many.
+            self.species_name_by_name_id.setdefault(name_id, species_name)
+        self.name_ids = frozenset(self.species_name_by_name_id)
+
+    def __len__(self):
+        return len(self.name_id_by_species_name)
+
+    def get_name_id(self, species_name, default=-1):
+        return self.name_id_by_species_name.get(species_name, default)
+
+    def get_species_name(self, name_id, default=None):
+        try:
+            return self.species_name_by_name_id.get(int(name_id), default)
+        except (TypeError, ValueError):
+            return default
+
+    def has_name_id(self, name_id):
+        try:
+            return int(name_id) in self.name_ids
+        except (TypeError, ValueError):
+            return False
+
+
+# 64MB, far more than the size of a lookup file of the whole WA flora and fauna.
+SPECIES_LOOKUP_MMAP_SIZE = 64 * 1024 * 1024
+
+
+class SharedSpeciesIndex(object):
+    """
+    Same interface as SpeciesIndex but backed by a read-only SQLite lookup file (see build_species_lookup_file).
+    The file is memory mapped, so its pages are shared by all the processes of a host through the OS page cache
+    and opening it costs nothing compared to building a SpeciesIndex from the whole species list.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # the file is never modified in place (replaced by a rename), so the connection can be shared by threads.
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        self.connection.execute('PRAGMA query_only = 1')
+        self.connection.execute('PRAGMA mmap_size = {}'.format(SPECIES_LOOKUP_MMAP_SIZE))
+        meta = dict(self.connection.execute('SELECT key, value FROM meta').fetchall())
+        self.stamp = int(meta.get('stamp', 0))
+        self.count = int(meta.get('count', 0))
+
+    def __len__(self):
+        return self.count
+
+    def _fetch_one(self, sql, param, default):
+        row = self.connection.execute(sql, (param,)).fetchone()
+        return row[0] if row is not None else default
+
+    def get_name_id(self, species_name, default=-1):
+        return self._fetch_one('SELECT name_id FROM species WHERE species_name = ?', species_name, default)
+
+    def get_species_name(self, name_id, default=None):
+        try:
+            name_id = int(name_id)
+        except (TypeError, ValueError):
+            return default
+        # same as SpeciesIndex: the first name if a name_id has many.
+        return self._fetch_one(
+            'SELECT species_name FROM species WHERE name_id = ? ORDER BY rowid LIMIT 1', name_id, default
+        )
+
+    def has_name_id(self, name_id):
+        try:
+            name_id = int(name_id)
+        except (TypeError, ValueError):
+            return False
+        return self._fetch_one('SELECT 1 FROM species WHERE name_id = ? LIMIT 1', name_id, None) is not None
+
+    def close(self):
+        self.connection.close()
+
+
+def build_species_lookup_file(file_path, rows, stamp=0):
+    """
+    Write the species lookup file read by the SharedSpeciesIndex.
+    The file is written next to the destination and renamed, so the readers always see a complete file and the ones
+    that have the previous file opened keep reading it.
+    :param rows: an iterable of (species_name, name_id)
+    :param stamp: an integer identifying the species data version, e.g. the id of the refresh job.
+    :return: the file path
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix='species_lookup_', dir=directory)
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.execute('CREATE TABLE species (species_name TEXT NOT NULL, name_id INTEGER NOT NULL)')
+            connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value INTEGER)')
+            connection.executemany(
+                'INSERT INTO species (species_name, name_id) VALUES (?, ?)',
+                ((species_name, int(name_id)) for species_name, name_id in rows)
+            )
+            connection.execute('CREATE INDEX species_name_idx ON species (species_name)')
+            connection.execute('CREATE INDEX species_name_id_idx ON species (name_id)')
+            count = connection.execute('SELECT COUNT(*) FROM species').fetchone()[0]
+            connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [('stamp', stamp), ('count', count)])
+            connection.commit()
+        finally:
+            connection.close()
+        os.rename(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return file_path
+
+
 class HerbieError(Exception):
     pass
 
@@ -79,9 +217,35 @@ class Property:
         self.herbie_name = herbie_name
 
 
+def parse_updated_on(value):
+    """
+    :param value: the updated_on property of a species, e.g '2004-12-09Z'
+    :return: a date or None
+    """
+    if not value:
+        return None
+    try:
+        return parse_date(six.text_type(value).rstrip('Z')[:10])
+    except ValueError:
+        return None
+
+
 class SpeciesFacade(object):
     PROPERTY_SPECIES_NAME = Property('species_name')
     PROPERTY_NAME_ID = Property('name_id')
+    PROPERTY_MD5_ROWHASH = Property('md5_rowhash')
+    PROPERTY_UPDATED_ON = Property('updated_on')
+    PROPERTY_GENUS = Property('genus')
+    PROPERTY_FAMILY_NID = Property('family_nid')
+    PROPERTY_FAMILY_CODE = Property('family_code')
+    PROPERTY_RANK_NAME = Property('rank_name')
+    PROPERTY_KINGDOM_ID = Property('kingdom_id')
+
+    def species_index(self):
+        """
+        :return: a SpeciesIndex of the species. Build it once and reuse it for many lookups.
+        """
+        return SpeciesIndex(self.name_id_by_species_name())
 
     def name_id_by_species_name(self):
         """
@@ -101,6 +265,18 @@ class SpeciesFacade(object):
         """
         raise NotImplementedError('`get_all_species(properties` must be implemented.')
 
+    def iter_species(self, properties=None, updated_since=None):
+        """
+        Same as get_all_species but as an iterator and optionally restricted to the species updated since a date.
+        :param updated_since: a date. The species updated on that date are included.
+        """
+        for sp in self.get_all_species(properties):
+            if updated_since is not None:
+                updated_on = parse_updated_on(sp.get(self.PROPERTY_UPDATED_ON.herbie_name))
+                if updated_on is not None and updated_on < updated_since:
+                    continue
+            yield sp
+
 
 class HerbieFacade(SpeciesFacade):
     BASE_URL = env('HERBIE_SPECIES_WFS_URL',
@@ -123,17 +299,69 @@ class HerbieFacade(SpeciesFacade):
             )
         return params
 
+    # (connect, read) timeouts in seconds
+    TIMEOUT = (env('HERBIE_CONNECT_TIMEOUT', 10), env('HERBIE_READ_TIMEOUT', 300))
+    _session = None
+
+    @classmethod
+    def get_session(cls):
+        """
+        A requests session shared by all the queries, to reuse the connections to Herbie.
+        """
+        if cls._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=2)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            cls._session = session
+        return cls._session
+
     @staticmethod
-    def _query_species(params=None):
-        r = requests.get(HerbieFacade.BASE_URL, params=params)
-        r.raise_for_status()
+    def _add_updated_since_filter_to_params(updated_since, params=None):
+        """
+        Geoserver CQL filter on the updated_on property.
+        :param updated_since: a date
+        """
+        if updated_since is not None:
+            if params is None:
+                params = {}
+            params['cql_filter'] = "updated_on >= '{}'".format(updated_since.isoformat())
+        return params
+
+    @staticmethod
+    def _to_python(value):
+        # the incremental json parser returns all the numbers as Decimal
+        if isinstance(value, Decimal):
+            return int(value) if value == value.to_integral_value() else float(value)
+        return value
+
+    @staticmethod
+    def _iter_query_species(params=None):
+        """
+        Stream the species features of the response, the feature collection is never loaded in memory.
+        """
+        r = HerbieFacade.get_session().get(HerbieFacade.BASE_URL, params=params, stream=True,
+                                           timeout=HerbieFacade.TIMEOUT)
         try:
-            return [f['properties'] for f in r.json()['features']]
+            r.raise_for_status()
+            r.raw.decode_content = True
+            for feature in ijson.items(r.raw, 'features.item'):
+                yield dict(
+                    [(k, HerbieFacade._to_python(v)) for k, v in six.iteritems(feature.get('properties') or {})]
+                )
+        except requests.RequestException:
+            raise
         except Exception as e:
             # If we have an exception here it's probably because the request is not correct (XML error from geoserver)
-            message = 'Herbie returned an error: {}. \nURL: {}. \nResponse: {}'.format(e, r.url, r.content)
+            message = 'Herbie returned an error: {}. \nURL: {}.'.format(e, r.url)
             logger.warning(message)
             raise HerbieError(message)
+        finally:
+            r.close()
+
+    @staticmethod
+    def _query_species(params=None):
+        return list(HerbieFacade._iter_query_species(params))
 
     def name_id_by_species_name(self):
         """
@@ -153,9 +381,273 @@ class HerbieFacade(SpeciesFacade):
         """
         return self._query_species(self._add_attributes_filter_to_params(properties))
 
+    def iter_species(self, properties=None, updated_since=None):
+        params = self._add_attributes_filter_to_params(properties)
+        params = self._add_updated_since_filter_to_params(updated_since, params)
+        return self._iter_query_species(params)
+
 
 class NoSpeciesFacade(SpeciesFacade):
     def get_all_species(self, properties=None):
         return []
 
-# TODO: implement a cached version of Herbie (memory/disk or db?). Cache renewal policy?
+
+class FixtureSpeciesFacade(SpeciesFacade):
+    """
+    Read the species from a local json file (settings.SPECIES_FIXTURE_FILE).
+    The file is either a WFS FeatureCollection (same format as Herbie) or a list of species properties.
+    Typical use: a stand-in for Herbie as the source of the CachedSpeciesFacade in tests.
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path or getattr(settings, 'SPECIES_FIXTURE_FILE', None)
+
+    def get_all_species(self, properties=None):
+        with io.open(self.file_path, encoding='utf-8') as fp:
+            data = json.load(fp)
+        if isinstance(data, dict):
+            species = [f['properties'] for f in data.get('features', [])]
+        else:
+            species = data
+        if properties:
+            names = [p.herbie_name for p in properties]
+            species = [dict([(name, sp.get(name)) for name in names]) for sp in species]
+        return species
+
+
+class SpeciesCacheError(Exception):
+    pass
+
+
+def get_species_facade_class():
+    """
+    :return: the species facade of the application (settings.SPECIES_FACADE_CLASS) or NoSpeciesFacade
+    """
+    class_path = getattr(settings, 'SPECIES_FACADE_CLASS', None)
+    return import_string(class_path) if class_path else NoSpeciesFacade
+
+
+def get_species_source_facade_class():
+    return import_string(getattr(settings, 'SPECIES_CACHE_SOURCE_CLASS', 'main.utils_species.HerbieFacade'))
+
+
+# The species properties stored in the Species table with their model field name, besides name_id.
+SPECIES_CACHE_PROPERTIES = [
+    (SpeciesFacade.PROPERTY_SPECIES_NAME, 'species_name'),
+    (SpeciesFacade.PROPERTY_MD5_ROWHASH, 'md5_rowhash'),
+    (SpeciesFacade.PROPERTY_UPDATED_ON, 'updated_on'),
+    # taxonomy
+    (SpeciesFacade.PROPERTY_GENUS, 'genus'),
+    (SpeciesFacade.PROPERTY_FAMILY_NID, 'family_nid'),
+    (SpeciesFacade.PROPERTY_FAMILY_CODE, 'family_code'),
+    (SpeciesFacade.PROPERTY_RANK_NAME, 'rank_name'),
+    (SpeciesFacade.PROPERTY_KINGDOM_ID, 'kingdom_id'),
+]
+
+
+def _species_cache_row(sp):
+    """
+    :param sp: the species properties from the source
+    :return: a dict of the Species field values
+    """
+    row = {}
+    for prop, field_name in SPECIES_CACHE_PROPERTIES:
+        value = sp.get(prop.herbie_name)
+        if field_name == 'updated_on':
+            value = parse_updated_on(value)
+        elif field_name in ('family_nid', 'kingdom_id'):
+            value = int(value) if value not in (None, '') else None
+        elif value is None:
+            value = ''
+        row[field_name] = value
+    return row
+
+
+def refresh_species(source_facade_class=None, full=False):
+    """
+    Synchronise the Species table with the species source (settings.SPECIES_CACHE_SOURCE_CLASS by default).
+    The synchronisation is incremental: only the species updated since the last synchronisation (the latest updated_on
+    of the table) are requested and only the species with a different row hash are saved.
+    A full synchronisation, needed to detect the deleted species, is done when full is True or the table is empty.
+    :return: a dict with the number of species created, updated and deleted and if the synchronisation was full.
+    """
+    from main.models import Species  # import here to avoid cyclic import problem
+
+    source_facade_class = source_facade_class or get_species_source_facade_class()
+    source = source_facade_class()
+    field_names = [field_name for prop, field_name in SPECIES_CACHE_PROPERTIES]
+    existing = dict(
+        (values['name_id'], dict((f, values[f]) for f in field_names))
+        for values in Species.objects.values('name_id', *field_names).iterator()
+    )
+    updated_since = None
+    if not full and existing:
+        updated_since = Species.objects.aggregate(Max('updated_on'))['updated_on__max']
+    full = updated_since is None
+
+    seen = set()
+    created = {}
+    updated = {}
+    properties = [SpeciesFacade.PROPERTY_NAME_ID] + [prop for prop, field_name in SPECIES_CACHE_PROPERTIES]
+    for sp in source.iter_species(properties, updated_since=updated_since):
+        name_id = sp.get(SpeciesFacade.PROPERTY_NAME_ID.herbie_name)
+        if name_id is None or not sp.get(SpeciesFacade.PROPERTY_SPECIES_NAME.herbie_name):
+            continue
+        name_id = int(name_id)
+        seen.add(name_id)
+        row = _species_cache_row(sp)
+        if name_id not in existing:
+            created[name_id] = row
+        elif _is_species_changed(existing[name_id], row):
+            updated[name_id] = row
+    if full and not seen:
+        # protect the cache against a source returning nothing
+        raise SpeciesCacheError('The species source {} returned no species'.format(source_facade_class.__name__))
+
+    deleted = [name_id for name_id in existing if name_id not in seen] if full else []
+    with transaction.atomic():
+        if deleted:
+            Species.objects.filter(name_id__in=deleted).delete()
+        Species.objects.bulk_create(
+            [Species(name_id=name_id, **row) for name_id, row in six.iteritems(created)],
+            batch_size=1000
+        )
+        for name_id, row in six.iteritems(updated):
+            Species.objects.filter(name_id=name_id).update(**row)
+    return {
+        'created': len(created),
+        'updated': len(updated),
+        'deleted': len(deleted),
+        'full': full
+    }
+
+
+def _is_species_changed(current, new):
+    """
+    :param current: the field values of the Species table
+    :param new: the field values from the source
+    """
+    if current['md5_rowhash'] and new['md5_rowhash']:
+        return current['md5_rowhash'] != new['md5_rowhash']
+    # no row hash
+    return current != new
+
+
+def build_species_lookup_file_from_db(file_path=None, stamp=0):
+    """
+    Build the species lookup file (settings.SPECIES_LOOKUP_FILE by default) from the Species table.
+    :return: the file path or None if there is no lookup file configured.
+    """
+    from main.models import Species  # import here to avoid cyclic import problem
+
+    file_path = file_path or getattr(settings, 'SPECIES_LOOKUP_FILE', None)
+    if not file_path:
+        return None
+    rows = Species.objects.order_by('pk').values_list('species_name', 'name_id').iterator()
+    return build_species_lookup_file(file_path, rows, stamp=stamp)
+
+
+class CachedSpeciesFacade(SpeciesFacade):
+    """
+    Serve the species from the local Species table, a copy of the species source (settings.SPECIES_CACHE_SOURCE_CLASS).
+    Staleness policy (settings.SPECIES_CACHE_MAX_AGE in hours):
+    - the cache has never been refreshed or the last successful refresh is older than SPECIES_CACHE_MAX_AGE: a
+    background refresh job is started, unless one is already running or one failed less than FAILED_REFRESH_DELAY
+    ago. The current species are served, or the species of the source if the cache is still empty.
+    - SPECIES_CACHE_MAX_AGE is 0 or None: no automatic refresh (use the refresh_species management command).
+    """
+    # the delay before a failed refresh is retried
+    FAILED_REFRESH_DELAY = timedelta(minutes=30)
+
+    @staticmethod
+    def last_refresh():
+        """
+        :return: the last successful refresh job or None
+        """
+        from main.models import Job
+
+        return Job.objects \
+            .filter(type=Job.TYPE_REFRESH_SPECIES, status=Job.STATUS_SUCCESS) \
+            .order_by('-finished') \
+            .first()
+
+    @staticmethod
+    def is_refreshing():
+        from main.models import Job
+
+        return Job.objects \
+            .filter(type=Job.TYPE_REFRESH_SPECIES, status__in=[Job.STATUS_PENDING, Job.STATUS_RUNNING]) \
+            .exists()
+
+    @classmethod
+    def has_recently_failed(cls):
+        from main.models import Job
+
+        return Job.objects \
+            .filter(type=Job.TYPE_REFRESH_SPECIES, status=Job.STATUS_FAILED,
+                    finished__gte=timezone.now() - cls.FAILED_REFRESH_DELAY) \
+            .exists()
+
+    def ensure_fresh(self):
+        """
+        Start a background refresh job if the cache is stale, see the staleness policy.
+        :return: False if the cache has never been refreshed and is empty, the species of the source must be served.
+        """
+        from main.jobs import create_job
+        from main.models import Job, Species
+
+        max_age = getattr(settings, 'SPECIES_CACHE_MAX_AGE', None)
+        if not max_age:
+            return True
+        last_refresh = self.last_refresh()
+        if last_refresh is not None and last_refresh.finished >= timezone.now() - timedelta(hours=max_age):
+            return True
+        if not self.is_refreshing() and not self.has_recently_failed():
+            create_job(Job.TYPE_REFRESH_SPECIES)
+        return last_refresh is not None or Species.objects.exists()
+
+    @staticmethod
+    def source_facade():
+        return get_species_source_facade_class()()
+
+    def species_index(self):
+        """
+        If settings.SPECIES_LOOKUP_FILE is set the index is the shared lookup file, rebuilt from the Species table if
+        it is missing or older than the last refresh (e.g. refreshed by another host).
+        """
+        file_path = getattr(settings, 'SPECIES_LOOKUP_FILE', None)
+        if not self.ensure_fresh():
+            return self.source_facade().species_index()
+        if not file_path:
+            return super(CachedSpeciesFacade, self).species_index()
+        last_refresh = self.last_refresh()
+        stamp = last_refresh.pk if last_refresh is not None else 0
+        try:
+            index = SharedSpeciesIndex(file_path) if os.path.exists(file_path) else None
+            if index is None or index.stamp < stamp:
+                if index is not None:
+                    index.close()
+                build_species_lookup_file_from_db(file_path, stamp=stamp)
+                index = SharedSpeciesIndex(file_path)
+            return index
+        except (sqlite3.Error, IOError, OSError):
+            logger.exception('Error while opening the species lookup file {}'.format(file_path))
+            return super(CachedSpeciesFacade, self).species_index()
+
+    def name_id_by_species_name(self):
+        """
+        :return: a dict where key is species_name and the value is name_id
+        """
+        from main.models import Species
+
+        if not self.ensure_fresh():
+            return self.source_facade().name_id_by_species_name()
+        return dict(Species.objects.values_list('species_name', 'name_id'))
+
+    def get_all_species(self, properties=None):
+        from main.models import Species
+
+        if not self.ensure_fresh():
+            return self.source_facade().get_all_species(properties)
+        properties = properties or [self.PROPERTY_SPECIES_NAME, self.PROPERTY_NAME_ID]
+        return list(Species.objects.values(*[p.herbie_name for p in properties]))
@@ -0,0 +1,197 @@
+"""
+Fuzzy matching of the unresolved species names of the records (name_id = -1) against the cached species list
+(the Species table, see main.utils_species.CachedSpeciesFacade).
+The matching uses the trigram similarity of the PostgreSQL pg_trgm extension, answered by a trigram index on the
+species names. All the distinct unresolved names of a dataset are matched in one query and the accepted corrections
+are applied with one set-based update.
+After a refresh of the species list the name_id of the records are re-resolved from their species name in bulk
+(see resolve_species_names).
+"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+# pg_trgm similarity between 0 and 1 under which a species is not suggested.
+DEFAULT_SIMILARITY_THRESHOLD = 0.3
+DEFAULT_SUGGESTIONS_LIMIT = 3
+UNRESOLVED_NAME_ID = -1
+
+
+def unresolved_species_names(record_queryset):
+    """
+    :return: a list of (species_name, number of records) of the records without a name_id, ordered by species name
+    """
+    return list(
+        record_queryset
+        .filter(name_id=UNRESOLVED_NAME_ID)
+        .exclude(species_name__isnull=True)
+        .exclude(species_name='')
+        .order_by('species_name')
+        .values('species_name')
+        .annotate(count=Count('id'))
+        .values_list('species_name', 'count')
+    )
+
+
+def suggest_species(species_names, limit=DEFAULT_SUGGESTIONS_LIMIT, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """
+    Find the closest species of the Species table for every species name.
+    :return: a dict species_name -> list of {'species_name', 'name_id', 'similarity'}, best match first.
+    """
+    from main.models import Species  # import here to avoid cyclic import problem
+
+    suggestions = dict([(name, []) for name in species_names])
+    if not suggestions:
+        return suggestions
+    # the % operator (escaped as %%) selects the names above the similarity threshold using the trigram index. The
+    # threshold is set for the transaction only, it doesn't leak in the other queries of the (pooled) connection.
+    sql = """
+    SELECT q.name, s.species_name, s.name_id, s.similarity
+    FROM unnest(%s::text[]) AS q(name)
+    CROSS JOIN LATERAL (
+      SELECT sp.species_name, sp.name_id, similarity(sp.species_name, q.name) AS similarity
+      FROM {species} AS sp
+      WHERE sp.species_name %% q.name
+      ORDER BY similarity DESC, sp.species_name
+      LIMIT %s
+    ) AS s
+    ORDER BY q.name, s.similarity DESC, s.species_name
+    """.format(species=connection.ops.quote_name(Species._meta.db_table))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", [str(threshold)])
+        cursor.execute(sql, [list(suggestions), limit])
+        for name, species_name, name_id, similarity in cursor.fetchall():
+            suggestions[name].append({
+                'species_name': species_name,
+                'name_id': name_id,
+                'similarity': round(similarity, 3)
+            })
+    return suggestions
+
+
+def get_species_suggestions(dataset, limit=DEFAULT_SUGGESTIONS_LIMIT, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """
+    :return: a list of {'species_name', 'records', 'suggestions'} for every unresolved species name of the dataset.
+    """
+    unresolved = unresolved_species_names(dataset.record_queryset)
+    suggestions = suggest_species([name for name, count in unresolved], limit=limit, threshold=threshold)
+    return [
+        {
+            'species_name': name,
+            'records': count,
+            'suggestions': suggestions.get(name, [])
+        }
+        for name, count in unresolved
+    ]
+
+
+def apply_species_corrections(dataset, corrections):
+    """
+    Resolve the records of the dataset with an unresolved species name to the species of the given name_id.
+    The species name and name id columns of the record data are updated too, except the genus/species columns of
+    a multi-column species name.
+    :param corrections: a list of (unresolved species_name, name_id). The name_ids must exist in the Species table.
+    :return: the number of updated records
+    """
+    from main.models import Record, Species, SpeciesSummary  # import here to avoid cyclic import problem
+
+    if not corrections:
+        return 0
+    data_sql = 'r.data'
+    data_params = []
+    parser = getattr(dataset.schema, 'species_name_parser', None)
+    if parser is not None:
+        if parser.species_name_field is not None and not parser.has_genus_and_species:
+            data_sql = 'jsonb_set({}, ARRAY[%s], to_jsonb(s.species_name))'.format(data_sql)
+            data_params.append(parser.species_name_field.name)
+        if parser.name_id_field is not None:
+            data_sql = 'jsonb_set({}, ARRAY[%s], to_jsonb(s.name_id))'.format(data_sql)
+            data_params.append(parser.name_id_field.name)
+    values_sql = ', '.join(['(%s::text, %s::integer)'] * len(corrections))
+    values_params = []
+    for species_name, name_id in corrections:
+        values_params += [species_name, int(name_id)]
+    qn = connection.ops.quote_name
+    sql = """
+    UPDATE {record} AS r
+    SET species_name = s.species_name, name_id = s.name_id, data = {data_sql}, last_modified = now()
+    FROM (VALUES {values_sql}) AS v(species_name, name_id)
+    JOIN {species} AS s ON s.name_id = v.name_id
+    WHERE r.dataset_id = %s AND r.name_id = %s AND r.species_name = v.species_name
+    """.format(
+        record=qn(Record._meta.db_table),
+        species=qn(Species._meta.db_table),
+        data_sql=data_sql,
+        values_sql=values_sql
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, data_params + values_params + [dataset.pk, UNRESOLVED_NAME_ID])
+        count = cursor.rowcount
+    if count:
+        corrected_names = Species.objects.filter(name_id__in=[name_id for name, name_id in corrections])
+        SpeciesSummary.mark_stale(
+            [name for name, name_id in corrections] + list(corrected_names.values_list('species_name', flat=True))
+        )
+    return count
+
+
+def get_name_resolved_datasets():
+    """
+    :return: the species observation datasets whose record name_id is resolved from the species name, i.e. the
+    datasets without a name id column (the name id column takes precedence, see RecordCreator).
+    """
+    from main.models import Dataset  # import here to avoid cyclic import problem
+
+    datasets = Dataset.objects.filter(type=Dataset.TYPE_SPECIES_OBSERVATION)
+    return [ds for ds in datasets if ds.schema.species_name_parser.name_id_field is None]
+
+
+def resolve_species_names(species_index, datasets=None, chunk_size=1000):
+    """
+    Resolve again the name_id of the records from their species name against the species index. Each distinct
+    (species_name, name_id) pair is resolved once and the changed pairs are applied with set-based updates of
+    chunk_size pairs.
+    :param datasets: the datasets to resolve, by default all the datasets returned by get_name_resolved_datasets
+    :return: a dict with the number of changed pairs and updated records.
+    """
+    from main.models import Record, SpeciesSummary  # import here to avoid cyclic import problem
+
+    if datasets is None:
+        datasets = get_name_resolved_datasets()
+    dataset_ids = [ds.pk for ds in datasets]
+    if not dataset_ids:
+        return {'pairs': 0, 'records': 0}
+    pairs = Record.objects \
+        .filter(dataset__in=dataset_ids) \
+        .exclude(species_name__isnull=True) \
+        .exclude(species_name='') \
+        .order_by() \
+        .values_list('species_name', 'name_id') \
+        .distinct()
+    changes = []
+    for species_name, name_id in pairs.iterator():
+        new_name_id = species_index.get_name_id(species_name, UNRESOLVED_NAME_ID)
+        if new_name_id != name_id:
+            changes.append((species_name, name_id, new_name_id))
+
+    qn = connection.ops.quote_name
+    count = 0
+    for start in range(0, len(changes), chunk_size):
+        chunk = changes[start:start + chunk_size]
+        params = []
+        for change in chunk:
+            params += list(change)
+        sql = """
+        UPDATE {record} AS r SET name_id = v.new_name_id, last_modified = now()
+        FROM (VALUES {values_sql}) AS v(species_name, name_id, new_name_id)
+        WHERE r.species_name = v.species_name AND r.name_id = v.name_id AND r.dataset_id = ANY(%s)
+        """.format(
+            record=qn(Record._meta.db_table),
+            values_sql=', '.join(['(%s::text, %s::integer, %s::integer)'] * len(chunk))
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params + [dataset_ids])
+            count += cursor.rowcount
+            SpeciesSummary.mark_stale([species_name for species_name, name_id, new_name_id in chunk])
+    return {'pairs': len(changes), 'records': count}
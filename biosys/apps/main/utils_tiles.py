@@ -0,0 +1,247 @@
+"""
+Mapbox Vector Tiles (MVT) generation for records and sites.
+The tiles are generated by PostGIS (ST_AsMVT/ST_AsMVTGeom) and cached on disk.
+The cache key includes a modification stamp (count + last modified) of the datasets and sites involved, so a tile is
+regenerated only when the underlying data changed. The stamp is itself cached settings.TILES_STAMP_MAX_AGE seconds (a
+map requests many tiles at once) and the stamp directories that received no tile for settings.TILES_CACHE_MAX_AGE
+hours are removed.
+Tile coordinates follow the XYZ/Google scheme in Web Mercator (EPSG:3857).
+"""
+from __future__ import absolute_import, unicode_literals, print_function, division
+
+import errno
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Max
+from django.db.models.expressions import RawSQL
+
+from main.constants import MODEL_SRID
+from main.models import Dataset, Record
+
+logger = logging.getLogger(__name__)
+
+WEB_MERCATOR_SRID = 3857
+WEB_MERCATOR_ORIGIN = 20037508.342789244
+EARTH_RADIUS = 6378137.0
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 24
+
+RECORDS_LAYER = 'records'
+SITES_LAYER = 'sites'
+LAYERS = [RECORDS_LAYER, SITES_LAYER]
+
+RECORD_TILE_FIELDS = ('id', 'dataset_id', 'site_id', 'datetime', 'species_name', 'name_id')
+SITE_TILE_FIELDS = ('id', 'project_id', 'code', 'name')
+
+
+class TileError(Exception):
+    pass
+
+
+def tile_envelope(z, x, y):
+    """
+    :return: the tile bounds in Web Mercator (minx, miny, maxx, maxy)
+    """
+    if z < 0 or z > MAX_ZOOM:
+        raise TileError('Zoom level must be between 0 and {}'.format(MAX_ZOOM))
+    count = 2 ** z
+    if x < 0 or x >= count or y < 0 or y >= count:
+        raise TileError('Tile {}/{}/{} out of range'.format(z, x, y))
+    size = 2 * WEB_MERCATOR_ORIGIN / count
+    minx = -WEB_MERCATOR_ORIGIN + x * size
+    maxy = WEB_MERCATOR_ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def mercator_to_lon_lat(x, y):
+    lon = x / WEB_MERCATOR_ORIGIN * 180.0
+    lat = math.degrees(2 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+
+def tile_bbox(z, x, y):
+    """
+    The WGS84 bbox of the tile, including the tile buffer, used to select the geometries with the spatial index.
+    :return: a Polygon in MODEL_SRID
+    """
+    minx, miny, maxx, maxy = tile_envelope(z, x, y)
+    buffer_ = (maxx - minx) * TILE_BUFFER / TILE_EXTENT
+    minx = max(minx - buffer_, -WEB_MERCATOR_ORIGIN)
+    miny = max(miny - buffer_, -WEB_MERCATOR_ORIGIN)
+    maxx = min(maxx + buffer_, WEB_MERCATOR_ORIGIN)
+    maxy = min(maxy + buffer_, WEB_MERCATOR_ORIGIN)
+    west, south = mercator_to_lon_lat(minx, miny)
+    east, north = mercator_to_lon_lat(maxx, maxy)
+    bbox = Polygon.from_bbox((west, south, east, north))
+    bbox.srid = MODEL_SRID
+    return bbox
+
+
+def mvt_geom_expression(model, envelope):
+    """
+    An expression that transforms and clips the model geometry into the tile coordinate space.
+    """
+    qn = connection.ops.quote_name
+    column = '{}.{}'.format(qn(model._meta.db_table), qn('geometry'))
+    sql = 'ST_AsMVTGeom(ST_Transform({column}, {srid}), ST_MakeEnvelope(%s, %s, %s, %s, {srid}), %s, %s, true)'.format(
+        column=column,
+        srid=WEB_MERCATOR_SRID
+    )
+    return RawSQL(sql, tuple(envelope) + (TILE_EXTENT, TILE_BUFFER))
+
+
+def layer_to_mvt(queryset, layer_name, fields, envelope):
+    """
+    Encode a queryset into a MVT layer.
+    :param queryset: a Record or Site queryset, already filtered on the tile bbox.
+    :param layer_name:
+    :param fields: the model fields to be included as feature attributes
+    :param envelope: the tile envelope in Web Mercator
+    :return: the layer as bytes (can be empty)
+    """
+    queryset = queryset \
+        .annotate(geom=mvt_geom_expression(queryset.model, envelope)) \
+        .order_by() \
+        .values(*(fields + ('geom',)))
+    sql, params = queryset.query.sql_with_params()
+    tile_sql = 'SELECT ST_AsMVT(tile, %s, {extent}, %s) FROM ({sql}) AS tile WHERE tile.geom IS NOT NULL'.format(
+        extent=TILE_EXTENT,
+        sql=sql
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(tile_sql, (layer_name, 'geom') + tuple(params))
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b''
+
+
+class TileBuilder(object):
+    """
+    Build (or fetch from the cache) a tile for a filtered set of records and sites.
+    """
+
+    def __init__(self, records=None, sites=None, datasets=None):
+        """
+        :param records: the filtered Record queryset or None if the records layer is not requested.
+        :param sites: the filtered Site queryset or None if the sites layer is not requested.
+        :param datasets: the Dataset queryset that scopes the records. Used for the cache stamp.
+        """
+        self.records = records
+        self.sites = sites
+        self.datasets = datasets if datasets is not None else Dataset.objects.all()
+
+    @property
+    def cache_dir(self):
+        return getattr(settings, 'TILES_CACHE_DIR', None)
+
+    def stamp(self, filters=None):
+        """
+        A key that changes every time the records of the scoped datasets or the sites are modified.
+        """
+        stamp = {
+            'filters': filters or {}
+        }
+        if self.records is not None:
+            stamp[RECORDS_LAYER] = modification_stamp(Record.objects.filter(dataset__in=self.datasets.values('pk')))
+        if self.sites is not None:
+            stamp[SITES_LAYER] = modification_stamp(self.sites)
+        return hashlib.sha1(json.dumps(stamp, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def build(self, z, x, y):
+        envelope = tile_envelope(z, x, y)
+        bbox = tile_bbox(z, x, y)
+        tile = b''
+        if self.records is not None:
+            records = self.records.filter(geometry__bboverlaps=bbox)
+            tile += layer_to_mvt(records, RECORDS_LAYER, RECORD_TILE_FIELDS, envelope)
+        if self.sites is not None:
+            sites = self.sites.filter(geometry__bboverlaps=bbox)
+            tile += layer_to_mvt(sites, SITES_LAYER, SITE_TILE_FIELDS, envelope)
+        return tile
+
+    def get_tile(self, z, x, y, filters=None):
+        """
+        Return the tile from the cache or build it.
+        :param filters: a dict of the request filters. Part of the cache key.
+        :return: bytes
+        """
+        if not self.cache_dir:
+            return self.build(z, x, y)
+        stamp_dir = os.path.join(self.cache_dir, self.stamp(filters))
+        tile_path = os.path.join(stamp_dir, str(z), str(x), '{}.mvt'.format(y))
+        try:
+            with open(tile_path, 'rb') as fp:
+                return fp.read()
+        except IOError:
+            pass
+        tile = self.build(z, x, y)
+        new_stamp = not os.path.isdir(stamp_dir)
+        try:
+            write_tile(tile_path, tile)
+            # the age of a stamp directory is the age of its last tile
+            os.utime(stamp_dir, None)
+        except (IOError, OSError):
+            logger.exception('Error while writing the tile {}'.format(tile_path))
+        if new_stamp:
+            prune_tiles_cache(self.cache_dir, getattr(settings, 'TILES_CACHE_MAX_AGE', None))
+        return tile
+
+
+def modification_stamp(queryset):
+    """
+    The count and last modified of the queryset (Record or Site), cached settings.TILES_STAMP_MAX_AGE seconds.
+    """
+    queryset = queryset.order_by()
+    sql, params = queryset.values('pk').query.sql_with_params()
+    key = 'tiles-stamp-' + hashlib.sha1(json.dumps([sql, params], default=str).encode('utf-8')).hexdigest()
+    stamp = cache.get(key)
+    if stamp is None:
+        stamp = queryset.aggregate(count=Count('id'), last_modified=Max('last_modified'))
+        max_age = getattr(settings, 'TILES_STAMP_MAX_AGE', 0)
+        if max_age:
+            cache.set(key, stamp, max_age)
+    return stamp
+
+
+def prune_tiles_cache(cache_dir, max_age):
+    """
+    Remove the stamp directories of the cache that received no tile for max_age hours.
+    """
+    if not max_age:
+        return
+    limit = time.time() - max_age * 3600
+    for name in os.listdir(cache_dir):
+        stamp_dir = os.path.join(cache_dir, name)
+        try:
+            if os.path.isdir(stamp_dir) and os.path.getmtime(stamp_dir) < limit:
+                shutil.rmtree(stamp_dir, ignore_errors=True)
+        except OSError:
+            # removed by a concurrent request
+            pass
+
+
+def write_tile(tile_path, tile):
+    """
+    Write the tile in a temp file and rename it, so a concurrent reader never gets a partial tile.
+    """
+    tile_dir = os.path.dirname(tile_path)
+    try:
+        os.makedirs(tile_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    fd, tmp_path = tempfile.mkstemp(suffix='.mvt', dir=tile_dir)
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write(tile)
+    os.rename(tmp_path, tile_path)
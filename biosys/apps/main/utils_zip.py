@@ -4,8 +4,12 @@ import logging
 import os
 import shutil
 import tempfile
+import threading
 
+import zipstream
 from django.http import HttpResponse
+from django.utils.encoding import force_bytes
+from django.utils.six.moves import queue
 
 
 def export_zip(zip_path, name, delete_after=False):
@@ -37,3 +41,75 @@ def zip_dir(dir_path, zip_out_path, delete_after=True):
 def zip_dir_to_temp_zip(dir_path, delete_after=True):
     fid, out_path = tempfile.mkstemp(suffix='.zip')
     return zip_dir(dir_path, out_path, delete_after=delete_after)
+
+
+def zip_stream_it(entries, compression=zipstream.ZIP_DEFLATED):
+    """
+    Generate a zip archive by chunks, without any temporary file.
+    :param entries: an iterable of (file name, iterable of the file content chunks) or (file name, chunks, compression)
+    e.g. ZIP_STORED for files already compressed. The chunks are consumed only when the archive reaches the file, e.g.
+    a csv generator over a server-side cursor.
+    """
+    zip_ = zipstream.ZipFile(mode='w', compression=compression, allowZip64=True)
+    for entry in entries:
+        arcname, chunks = entry[:2]
+        compress_type = entry[2] if len(entry) > 2 else None
+        zip_.write_iter(arcname, (force_bytes(chunk) for chunk in chunks), compress_type=compress_type)
+    for data in zip_:
+        yield data
+
+
+def parallel_read_it(items, read, workers=4):
+    """
+    Generate read(item) for every item, in the order of the items.
+    The reads are done by a pool of `workers` threads that read at most 2 * workers items ahead of the consumer, so
+    the memory stays bounded. An exception raised by read is raised again by the generator.
+    """
+    items = list(items)
+    if not items:
+        return
+    window = 2 * workers
+    tasks = queue.Queue()
+    results = {}
+    condition = threading.Condition()
+
+    def worker():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            index, item = task
+            try:
+                result = (True, read(item))
+            except Exception as e:
+                result = (False, e)
+            with condition:
+                results[index] = result
+                condition.notify_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    submitted = 0
+    try:
+        for index in range(len(items)):
+            while submitted < len(items) and submitted < index + window:
+                tasks.put((submitted, items[submitted]))
+                submitted += 1
+            with condition:
+                while index not in results:
+                    condition.wait()
+                success, value = results.pop(index)
+            if not success:
+                raise value
+            yield value
+    finally:
+        # drop the pending reads (e.g. the consumer stopped) and stop the workers
+        try:
+            while True:
+                tasks.get_nowait()
+        except queue.Empty:
+            pass
+        for _ in threads:
+            tasks.put(None)
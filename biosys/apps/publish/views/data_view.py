@@ -1,11 +1,13 @@
 from __future__ import absolute_import, unicode_literals, print_function, division
 
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models.expressions import RawSQL
 from django.http.response import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView, View
 
 from main.models import Project, Dataset, Record
+from main.utils_misc import search_json_fields
 
 
 class DataView(LoginRequiredMixin, TemplateView):
@@ -18,12 +20,82 @@ class DataView(LoginRequiredMixin, TemplateView):
 
 
 class JSONDataTableView(LoginRequiredMixin, View):
+    """
+    The records of a dataset for the DataTables server-side processing protocol
+    (https://datatables.net/manual/server-side).
+    The global search, the column ordering and the paging are done in SQL on the record data, only the requested page
+    is returned with the total and filtered counts.
+    """
+    # the maximum number of records of a page, also used when all records are requested (length=-1)
+    max_length = 1000
+
     def get(self, request, *args, **kwargs):
         ds = get_object_or_404(Dataset, pk=kwargs.get('pk'))
-        rows = []
+        params = request.GET
+        field_names = ds.schema.field_names
+        columns = self.get_columns(params)
         records = Record.objects.filter(dataset=ds)
-        for record in records:
-            rows.append(record.data_with_id)
+        total = records.count()
+        filtered = total
+
+        search = params.get('search[value]', '').strip()
+        searchable = [c['name'] for c in columns if c['searchable'] and c['name'] in field_names] or field_names
+        # no search for a dataset without field
+        if search and searchable:
+            records = search_json_fields(records, {'data': searchable}, search)
+            filtered = records.count()
+
+        order_by = []
+        index = 0
+        while 'order[{}][column]'.format(index) in params:
+            column = columns.get(to_int(params.get('order[{}][column]'.format(index)), -1))
+            descending = params.get('order[{}][dir]'.format(index)) == 'desc'
+            index += 1
+            if column is None or not column['orderable']:
+                continue
+            if column['name'] == 'id':
+                order_by.append('-id' if descending else 'id')
+            elif column['name'] in field_names:
+                expression = RawSQL('data->%s', (column['name'],))
+                order_by.append(expression.desc() if descending else expression.asc())
+        # a stable order for the paging
+        records = records.order_by(*(order_by + ['id']))
+
+        start = max(to_int(params.get('start'), 0), 0)
+        length = to_int(params.get('length'), 10)
+        if length < 0 or length > self.max_length:
+            length = self.max_length
+        rows = []
+        for pk, data in records.values_list('id', 'data')[start:start + length]:
+            rows.append(dict({'id': pk}, **data))
         return JsonResponse({
+            'draw': to_int(params.get('draw'), 0),
+            'recordsTotal': total,
+            'recordsFiltered': filtered,
             'data': rows
         })
+
+    @staticmethod
+    def get_columns(params):
+        """
+        :return: a dict column index -> {'name', 'searchable', 'orderable'} from the columns[i][...] params
+        """
+        columns = {}
+        index = 0
+        while 'columns[{}][data]'.format(index) in params:
+            prefix = 'columns[{}]'.format(index)
+            columns[index] = {
+                # the name is the field name, the data can be escaped (e.g. 'a\\.b')
+                'name': params.get(prefix + '[name]') or params.get(prefix + '[data]'),
+                'searchable': params.get(prefix + '[searchable]', 'true') == 'true',
+                'orderable': params.get(prefix + '[orderable]', 'true') == 'true',
+            }
+            index += 1
+        return columns
+
+
+def to_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
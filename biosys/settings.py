@@ -120,6 +120,23 @@ AUTHENTICATION_BACKENDS = env('AUTHENTICATION_BACKENDS', [
     'django.contrib.auth.backends.ModelBackend',
 ])
 EXPORTER_CLASS = env('EXPORTER_CLASS', 'main.api.exporters.DefaultExporter')
+# Size in bytes above which an export file (e.g. xlsx) is written on disk instead of in memory before being sent.
+EXPORT_SPOOL_MAX_SIZE = env('EXPORT_SPOOL_MAX_SIZE', 1024 * 1024)
+# Maximum number of cached exports (see DatasetExport) kept per dataset, the least recently generated are deleted. The
+# exports of a previous version of the records are always deleted.
+DATASET_EXPORT_MAX_COUNT = env('DATASET_EXPORT_MAX_COUNT', 10)
+# Number of records per row group (record batch) of the parquet and arrow exports and per transaction of the
+# geopackage export.
+EXPORT_ROW_GROUP_SIZE = env('EXPORT_ROW_GROUP_SIZE', 100000)
+# Number of threads reading the media files from the storage for the export bundle (records + media zip).
+EXPORT_MEDIA_WORKERS = env('EXPORT_MEDIA_WORKERS', 4)
+# Background jobs (see main.jobs). If False the jobs must be run with the 'run_jobs' management command.
+JOBS_RUN_IN_THREAD = env('JOBS_RUN_IN_THREAD', True)
+# Minutes after which a running job is considered dead (e.g. its web worker was restarted) and flagged as failed by
+# the 'run_jobs' management command. 0 to disable.
+JOBS_RUNNING_TIMEOUT = env('JOBS_RUNNING_TIMEOUT', 6 * 60)
+# A site geometry change affecting more records than this is cascaded to the records in a background job.
+SITE_GEOMETRY_CASCADE_MAX_SYNC = env('SITE_GEOMETRY_CASCADE_MAX_SYNC', 5000)
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': env('REST_FRAMEWORK_DEFAULT_AUTHENTICATION_CLASSES', [
@@ -211,6 +228,12 @@ MEDIA_ROOT = env('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
 # URL that handles the media served from MEDIA_ROOT. Make sure to use a
 # trailing slash.
 MEDIA_URL = '/media/'
+# Directory where the vector tiles (api/tiles/) are cached. Set it to an empty value to disable the cache.
+TILES_CACHE_DIR = env('TILES_CACHE_DIR', os.path.join(BASE_DIR, 'tiles_cache'))
+# Seconds during which the modification stamp of the tiles cache key is reused. 0 to recompute it for every tile.
+TILES_STAMP_MAX_AGE = env('TILES_STAMP_MAX_AGE', 10)
+# Hours after which a stamp directory of the tiles cache that received no new tile is removed. 0 to keep them.
+TILES_CACHE_MAX_AGE = env('TILES_CACHE_MAX_AGE', 24 * 7)
 STATIC_URL = '/static/'
 
 # Additional locations of static files
@@ -240,7 +263,17 @@ BOOTSTRAP3 = {
 # The class that should provide a mapping between the species scientific name and the species name_id.
 # To use the WA Herbarium web service set SPECIES_FACADE_CLASS='main.utils_species.HerbieFacade'
 # in the environment file.
+# To use a local copy of the species list (refreshed from SPECIES_CACHE_SOURCE_CLASS)
+# set SPECIES_FACADE_CLASS='main.utils_species.CachedSpeciesFacade'
 SPECIES_FACADE_CLASS = env('SPECIES_FACADE_CLASS', None)
+# The source of the CachedSpeciesFacade. Use 'main.utils_species.FixtureSpeciesFacade' to read SPECIES_FIXTURE_FILE.
+SPECIES_CACHE_SOURCE_CLASS = env('SPECIES_CACHE_SOURCE_CLASS', 'main.utils_species.HerbieFacade')
+# Max age of the species cache in hours before a background refresh is started. 0 to disable the automatic refresh.
+SPECIES_CACHE_MAX_AGE = env('SPECIES_CACHE_MAX_AGE', 24)
+SPECIES_FIXTURE_FILE = env('SPECIES_FIXTURE_FILE', None)
+# Path of a SQLite file holding the species name/id lookup of the CachedSpeciesFacade, shared by all the processes
+# of a host. Rebuilt by the species refresh job. If not set every process builds its own lookup in memory.
+SPECIES_LOOKUP_FILE = env('SPECIES_LOOKUP_FILE', None)
 
 # Logging settings - log to stdout/stderr
 LOGGING = {